@@ -0,0 +1,180 @@
+"""Run many requests through planning and execution without a human in the loop.
+
+Usage: python batch.py requests.jsonl results.jsonl [--concurrency N] [--approve POLICY]
+
+Each input line is a JSON object with a "request" and an optional "id". Results are
+streamed to the output file as JSON lines in completion order. Plans execute only when
+the approval policy approves them, unless another --approve mode is given.
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List
+from rich.console import Console
+from chatagent import create_plan, execute_node, maybe_continue_execution
+from interface import Plan
+from utils.approval_policy import approval_policy
+
+console = Console()
+
+
+class SharedPlanner:
+    """Plan each distinct request once, sharing the result between identical requests."""
+
+    def __init__(self):
+        self.futures: Dict[str, Future] = {}
+        self.lock = threading.Lock()
+
+    def plan(self, request: str) -> Plan:
+        """Return the plan of a request, waiting for an identical in-flight request if any."""
+        key = " ".join(request.lower().split())
+        with self.lock:
+            future = self.futures.get(key)
+            owner = future is None
+            if owner:
+                future = self.futures[key] = Future()
+        if owner:
+            try:
+                future.set_result(create_plan(request))
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+    @property
+    def unique_requests(self) -> int:
+        return len(self.futures)
+
+
+def is_approved(plan: Plan, approve: str) -> bool:
+    """Check a plan against the approval mode: "all", "none", "policy" or a comma-separated list of allowed action types.
+
+    Plans repaired from a truncated or malformed reply are never approved.
+    """
+    if plan.get("repaired"):
+        return False
+    if approve == "all":
+        return True
+    if approve == "none":
+        return False
+    if approve == "policy":
+        return approval_policy.approves(plan)
+    allowed = {action_type.strip() for action_type in approve.split(",")}
+    return all(action["action_type"] in allowed for action in plan["actions"])
+
+
+def execute_plan(plan: Plan) -> Dict[str, Any]:
+    """Execute every action of a plan using the same steps as the graph."""
+    state = {
+        "messages": [],
+        "current_plan": {
+            **plan,
+            "actions": [{**action, "status": "pending"} for action in plan["actions"]],
+            "status": "executing",
+        },
+        "tools_output": {},
+        "execution_results": [],
+        "next_action": 0,
+    }
+    while maybe_continue_execution(state) == "execute":
+        state.update(execute_node(state))
+    return state
+
+
+def run_request(item: Dict[str, Any], planner: SharedPlanner, approve: str) -> Dict[str, Any]:
+    """Plan and, if approved, execute a single request."""
+    start = time.perf_counter()
+    result = {"id": item.get("id"), "request": item["request"]}
+    try:
+        plan = planner.plan(item["request"])
+        result["plan"] = plan
+        if plan["status"] == "needs_clarification":
+            result["status"] = "needs_clarification"
+        elif not is_approved(plan, approve):
+            result["status"] = "not_approved"
+        else:
+            state = execute_plan(plan)
+            tools_output = state["tools_output"]
+            result["status"] = state["current_plan"]["status"]
+            result["plan"] = state["current_plan"]
+            result["results"] = state["execution_results"]
+            result["links"] = {
+                key: value
+                for key, value in {
+                    "sheet": tools_output.get("sheet", {}).get("shareable_link"),
+                    "export": tools_output.get("export_path"),
+                }.items()
+                if value
+            }
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["elapsed"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def read_requests(path: str) -> List[Dict[str, Any]]:
+    """Read JSON Lines requests, numbering those without an ID."""
+    items = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                item = json.loads(line)
+                item.setdefault("id", line_number)
+                items.append(item)
+    return items
+
+
+def run_batch(
+    input_path: str, output_path: str, concurrency: int = 4, approve: str = "policy"
+) -> Dict[str, Any]:
+    """Run all requests of the input file and stream their results to the output file."""
+    items = read_requests(input_path)
+    planner = SharedPlanner()
+    statuses = Counter()
+    start = time.perf_counter()
+
+    with open(output_path, "w") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_request, item, planner, approve) for item in items]
+        for future in as_completed(futures):
+            result = future.result()
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            statuses[result["status"]] += 1
+
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": len(items),
+        "unique_requests": planner.unique_requests,
+        "statuses": dict(statuses),
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(items) / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", help="JSON Lines file with one request per line")
+    parser.add_argument("output", help="JSON Lines file to write the results to")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--approve",
+        default="policy",
+        help='"policy" (the server\'s approval policy, the default), "none", a comma-separated list of action types to auto-approve, or "all" to execute every plan unchecked',
+    )
+    args = parser.parse_args()
+
+    summary = run_batch(args.input, args.output, args.concurrency, args.approve)
+    console.print(
+        f"[bold green]Processed {summary['requests']} requests "
+        f"({summary['unique_requests']} unique) in {summary['elapsed']}s "
+        f"- {summary['throughput']} requests/s[/bold green]"
+    )
+    for status, count in summary["statuses"].items():
+        console.print(f"• {status}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Compare the time and peak RSS of sending a large attachment to many recipients, read and
+encoded in memory for each email, and encoded once and streamed by send_bulk.
+
+Run from the repository root: python -m bench.attachments --size-mb 100 --recipients 50
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from utils.email_sender import GmailSender
+from utils.rate_limit import BackendLimiter
+from utils.smtp_sink import SMTPSink
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Peak RSS of sending a large attachment")
+    parser.add_argument("--size-mb", type=int, default=100)
+    parser.add_argument("--recipients", type=int, default=50)
+    return parser.parse_args()
+
+
+def run(args: argparse.Namespace, mode: str, port: int, path: str, queue) -> None:
+    """Send the attachment to the recipients, and put the time and peak RSS in MiB on the queue."""
+    sender = GmailSender("bench@example.com", None, "127.0.0.1", port, use_tls=False)
+    sender.limiter = BackendLimiter("bench", rate=1e9, burst=10**6, max_concurrency=1)
+    recipients = [f"user{i}@example.com" for i in range(args.recipients)]
+    start = time.perf_counter()
+    if mode == "in-memory":
+        # Previous behaviour: read, encode and serialize the whole attachment per email
+        for recipient in recipients:
+            message = MIMEMultipart()
+            message["to"], message["from"], message["subject"] = recipient, sender.email, "Export"
+            message.attach(MIMEText("Export attached"))
+            with open(path, "rb") as f:
+                part = MIMEApplication(f.read(), Name=os.path.basename(path))
+            message.attach(part)
+            with sender._open_session() as server:
+                server.send_message(message)
+            del message, part
+    else:
+        sender.send_bulk(sender.email, recipients, "Export", "Export attached", attachments=[path])
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.xlsx")
+        with open(path, "wb") as f:
+            for _ in range(args.size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        context = multiprocessing.get_context("fork")
+        for mode in ["in-memory", "streamed"]:
+            sink = SMTPSink()
+            sink_process = context.Process(target=sink.serve_forever, daemon=True)
+            sink_process.start()
+            queue = context.Queue()
+            worker = context.Process(target=run, args=(args, mode, sink.port, path, queue))
+            worker.start()
+            elapsed, peak_mib = queue.get()
+            worker.join()
+            sink_process.terminate()
+            sink.server_close()
+            print(
+                f"{mode:10s} {args.size_mb} MB to {args.recipients} recipients: "
+                f"{elapsed:6.1f}s, peak RSS {peak_mib:7.1f} MiB"
+            )
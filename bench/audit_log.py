@@ -0,0 +1,107 @@
+"""Write a year of synthetic actions to a temporary audit log, then print the write rate,
+the latency of typical queries, and the query latency after compaction.
+
+Run from the repository root: python -m bench.audit_log --rows 2000000
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from typing import List
+from config import AUDIT_SEGMENT_ROWS
+from utils.audit_log import AuditLog
+
+THREADS = 2000
+ACTION_TYPES = ["generate_products", "create_sheet", "export_sheet", "send_email", "send_bulk_email"]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Write synthetic records to a temporary audit log and time queries"
+    )
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--segment-rows", type=int, default=AUDIT_SEGMENT_ROWS)
+    return parser.parse_args()
+
+
+def write_records(
+    log: AuditLog, rows: int, start: float, end: float, addresses: List[str], rng: random.Random
+) -> None:
+    """Record actions of THREADS threads spread evenly from start to end.
+
+    The actions are products, sheets, exports and emails, one in ten emails a bulk send to
+    20 of the addresses.
+    """
+    for i in range(rows):
+        action_type = ACTION_TYPES[i % len(ACTION_TYPES)]
+        entry = {
+            "ts": start + (end - start) * i / rows,
+            "thread_id": f"thread-{rng.randrange(THREADS)}",
+            "tenant_id": "default",
+            "action_type": action_type,
+            "description": f"{action_type} {i}",
+            "status": "completed" if rng.random() < 0.97 else "failed",
+            "outcome": "ok",
+            "attempts": 1,
+            "duration_seconds": rng.random(),
+            "parameters": {"index": i},
+        }
+        if action_type == "send_email":
+            entry["recipients"] = [(rng.choice(addresses), "sent")]
+        elif action_type == "send_bulk_email":
+            entry["recipients"] = [(address, "sent") for address in rng.sample(addresses, 20)]
+        while not log.record(entry):
+            time.sleep(0.01)
+    log.flush()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    rng = random.Random(0)
+    log = AuditLog(
+        tempfile.mkdtemp(), segment_rows=args.segment_rows, segment_seconds=0, queue_size=100_000
+    )
+    end = time.time()
+    addresses = [f"user{i}@example.com" for i in range(50_000)]
+
+    began = time.perf_counter()
+    write_records(log, args.rows, end - 365 * 86400, end, addresses, rng)
+    written = time.perf_counter() - began
+    stats = log.stats()
+    print(
+        f"wrote {args.rows} actions in {written:.1f}s ({args.rows / written:,.0f}/s), "
+        f"{stats['segments']} segments, {stats['bytes'] / 1024 / 1024:.0f} MiB"
+    )
+
+    week_ago = end - 7 * 86400
+    queries = [
+        ("emails to one address, last week", lambda: log.query(recipient=rng.choice(addresses), since=week_ago)),
+        ("emails to one address, all time", lambda: log.query(recipient=rng.choice(addresses))),
+        ("one thread, last 100", lambda: log.query(thread_id=f"thread-{rng.randrange(THREADS)}")),
+        ("failed exports, last 30 days", lambda: log.query(
+            action_type="export_sheet", status="failed", since=end - 30 * 86400)),
+        ("everything in one hour", lambda: log.query(since=end - 200 * 86400, until=end - 200 * 86400 + 3600)),
+    ]
+    for label, run in queries:
+        latencies, counts = [], []
+        for _ in range(50):
+            began = time.perf_counter()
+            counts.append(len(run()))
+            latencies.append(time.perf_counter() - began)
+        print(
+            f"{label:32s} p50 {statistics.median(latencies) * 1000:7.2f} ms, "
+            f"max {max(latencies) * 1000:7.2f} ms, {statistics.mean(counts):5.1f} rows"
+        )
+
+    # Compaction after shrinking retention to 90 days, with segments of the new size
+    log.retention_days = 90
+    began = time.perf_counter()
+    result = log.compact()
+    print(f"compaction to 90 days: {result} in {time.perf_counter() - began:.1f}s")
+    latencies = []
+    for _ in range(50):
+        began = time.perf_counter()
+        log.query(recipient=rng.choice(addresses), since=week_ago)
+        latencies.append(time.perf_counter() - began)
+    print(f"emails to one address, last week, after compaction p50 {statistics.median(latencies) * 1000:.2f} ms")
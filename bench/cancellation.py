@@ -0,0 +1,134 @@
+"""Compare the tokens and API calls spent on a workload of users who abandon turns,
+with and without cancellation.
+
+Run from the repository root with the fake LLM and its latency set:
+LLM_PROVIDER=fake LLM_FAKE_LATENCY=1 python -m bench.cancellation
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+import uuid
+from typing import Dict
+import utils.tools as tools
+from config import LLM_PROVIDER
+from utils.cancellation import turns
+from utils.metrics import metrics
+from utils.rate_limit import BackendLimiter
+# Imported after utils, whose package imports llm
+from chatagent import send_message
+from llm import get_llm
+
+google = BackendLimiter("standin_google", rate=20, burst=10, max_concurrency=8)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Tokens and API calls spent on abandoned turns, with and without cancellation"
+    )
+    parser.add_argument("--sessions", type=int, default=40)
+    parser.add_argument("--abandon-rate", type=float, default=0.6, help="share of turns the user walks away from")
+    parser.add_argument("--patience", type=float, default=2.0, help="longest wait before walking away, in seconds")
+    parser.add_argument("--google-latency", type=float, default=0.3)
+    args = parser.parse_args()
+    if LLM_PROVIDER != "fake":
+        parser.error("run with LLM_PROVIDER=fake and LLM_FAKE_LATENCY set, e.g. 1.0")
+    return args
+
+
+class StandInSheets:
+    """Google Sheets stand-in whose API calls go through a limiter like the real manager's."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def _execute(self) -> None:
+        google.call(time.sleep, self.latency)
+
+    def create_sheet(self, title: str) -> str:
+        self._execute()
+        return uuid.uuid4().hex
+
+    def add_data_to_sheet(self, spreadsheet_id: str, data) -> None:
+        self._execute()
+
+    def get_shareable_link(self, spreadsheet_id: str) -> str:
+        self._execute()
+        return f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}"
+
+
+def session(
+    args: argparse.Namespace, index: int, rng: random.Random, cancel: bool, unwind: list
+) -> None:
+    """Request a plan and confirm it, walking away from some turns before they finish."""
+    thread_id = f"bench-{uuid.uuid4().hex}"
+    thread_config = {"configurable": {"thread_id": thread_id}}
+    messages = [f"Generate {index % 9 + 2} products for catalog {index} and put them in a sheet", "yes"]
+    for message in messages:
+        patience = rng.uniform(0, args.patience) if rng.random() < args.abandon_rate else None
+        turn = threading.Thread(target=send_message, args=(thread_config, message))
+        turn.start()
+        turn.join(patience)
+        if turn.is_alive():
+            # The user left; without cancellation the turn runs on unobserved
+            if cancel:
+                start = time.perf_counter()
+                turns.cancel(thread_id, "user abandoned the session")
+                turn.join()
+                unwind.append(time.perf_counter() - start)
+            turn.join()
+            return
+        turn.join()
+
+
+def run(args: argparse.Namespace, label: str, cancel: bool) -> float:
+    """Run the sessions, print the LLM tokens and API calls they spent, and return the tokens."""
+    metrics.reset()
+    rng = random.Random(0)
+    unwind = []
+    threads = [
+        threading.Thread(target=session, args=(args, index, random.Random(rng.random()), cancel, unwind))
+        for index in range(args.sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counters = metrics.snapshot()["counters"]
+    tokens = sum(
+        value for name, value in counters.items() if name.startswith("llm.") and name.endswith(".total_tokens")
+    )
+    llm_calls = sum(
+        value for name, value in counters.items() if name.startswith("llm.") and name.endswith(".calls")
+    )
+    line = (
+        f"{label:15s} LLM tokens {tokens:7.0f}, LLM calls {llm_calls:4.0f}, "
+        f"Google API calls {counters.get('ratelimit.standin_google.calls', 0):4.0f}, "
+        f"{time.perf_counter() - start:5.1f}s"
+    )
+    if cancel:
+        line += (
+            f"; {counters.get('turns.cancelled', 0):.0f} turns cancelled, "
+            f"unwound in p50 {statistics.median(unwind) if unwind else 0:.2f}s / max {max(unwind, default=0):.2f}s"
+        )
+    print(line)
+    return tokens
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    tools.sheets_manager = StandInSheets(args.google_latency)
+    # Every turn pays for its own LLM calls: no pooled products, no cached analyses
+    tools.product_pool.low_water = tools.product_pool.high_water = 0
+    for products in tools.product_pool.buffers.values():
+        products.clear()
+    for purpose in ("analysis", "planning", "products"):
+        get_llm(purpose).cache = None
+
+    results: Dict[str, float] = {}
+    for label, cancel in [("no cancellation", False), ("cancellation", True)]:
+        results[label] = run(args, label, cancel)
+    saved = results["no cancellation"] - results["cancellation"]
+    print(f"tokens saved: {saved:.0f} ({saved / results['no cancellation']:.0%})")
@@ -0,0 +1,84 @@
+"""Compare the latency and checkpoint writes of starting sessions with running the graph
+up to the greeting, e.g. with LLM_PROVIDER=fake.
+
+Run from the repository root: python -m bench.initiation
+"""
+import statistics
+import time
+import uuid
+from collections import Counter
+from typing import Callable
+from fastapi.testclient import TestClient
+from langgraph.types import Command
+from chatagent import checkpointer, graph, send_message
+from main import MAX_BULK_SESSIONS, app, start_chat
+
+SESSIONS = 200
+MESSAGE = "Generate 3 products and put them in a sheet"
+
+writes = Counter()
+
+
+def count_checkpoint_writes() -> None:
+    """Count the checkpoint writes in writes["total"]."""
+    for name in ("put", "put_writes"):
+        def counted(*args, _original=getattr(checkpointer, name), **kwargs):
+            writes["total"] += 1
+            return _original(*args, **kwargs)
+        setattr(checkpointer, name, counted)
+
+
+def initiate_with_graph(thread_id: str) -> None:
+    """The previous /chat_initiate: run the graph up to the greeting's interrupt."""
+    graph.invoke(
+        {"messages": [], "current_plan": None, "needs_confirmation": False, "finished": False},
+        config={"configurable": {"thread_id": thread_id}},
+    )
+
+
+def measure(label: str, initiate: Callable[[str], None], first_message: Callable[[str], None]) -> None:
+    """Print the initiation latency and the checkpoint writes per session, through its first message."""
+    thread_ids = [f"{label}-{uuid.uuid4().hex}" for _ in range(SESSIONS)]
+    writes.clear()
+    latencies = []
+    for thread_id in thread_ids:
+        start = time.perf_counter()
+        initiate(thread_id)
+        latencies.append(time.perf_counter() - start)
+    initiate_writes = writes["total"] / SESSIONS
+    start = time.perf_counter()
+    for thread_id in thread_ids:
+        first_message(thread_id)
+    first_message_time = (time.perf_counter() - start) / SESSIONS
+    print(
+        f"{label:13s} initiation p50 {statistics.median(latencies) * 1000:6.2f} ms, "
+        f"{initiate_writes:.1f} checkpoint writes per session; "
+        f"first message {first_message_time * 1000:6.2f} ms, "
+        f"{writes['total'] / SESSIONS:.1f} writes per session through it"
+    )
+
+
+if __name__ == "__main__":
+    count_checkpoint_writes()
+    print(f"{SESSIONS} sessions, {type(checkpointer).__name__}")
+    measure(
+        "graph.invoke",
+        initiate_with_graph,
+        lambda t: graph.invoke(Command(resume=MESSAGE), config={"configurable": {"thread_id": t}}),
+    )
+    measure(
+        "precomputed",
+        start_chat,
+        lambda t: send_message({"configurable": {"thread_id": t}}, MESSAGE),
+    )
+
+    client = TestClient(app)
+    latencies = []
+    for _ in range(SESSIONS):
+        start = time.perf_counter()
+        client.get("/chat_initiate", params={"thread_id": uuid.uuid4().hex})
+        latencies.append(time.perf_counter() - start)
+    print(f"/chat_initiate over HTTP p50 {statistics.median(latencies) * 1000:.2f} ms")
+    start = time.perf_counter()
+    thread_ids = client.get("/chat_initiate_bulk", params={"count": MAX_BULK_SESSIONS}).json()["thread_ids"]
+    print(f"bulk: {len(thread_ids)} sessions in {(time.perf_counter() - start) * 1000:.0f} ms")
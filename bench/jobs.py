@@ -0,0 +1,33 @@
+"""Job queue throughput per number of workers, with stubbed tools holding a tool slot for 50 ms.
+
+Run from the repository root: python -m bench.jobs
+"""
+import asyncio
+import time
+from utils.jobs import JobQueue, MemoryJobStore, ToolLimiter
+
+stub_limiter = ToolLimiter({}, 16)
+
+
+def stub_job() -> str:
+    with stub_limiter.slot("stub_tool"):
+        time.sleep(0.05)
+    return "done"
+
+
+async def measure(workers: int, num_jobs: int = 200) -> float:
+    """Return the jobs per second of a queue with the given number of workers."""
+    queue = JobQueue(workers=workers, max_size=num_jobs, store=MemoryJobStore())
+    await queue.start()
+    start = time.perf_counter()
+    for _ in range(num_jobs):
+        queue.submit(stub_job)
+    await queue.queue.join()
+    elapsed = time.perf_counter() - start
+    await queue.stop()
+    return num_jobs / elapsed
+
+
+if __name__ == "__main__":
+    for workers in (1, 4, 16):
+        print(f"{workers:>2} workers: {asyncio.run(measure(workers)):.1f} jobs/s")
@@ -0,0 +1,38 @@
+"""Compare extract_json with slicing from the first [ to the last ] on a 10k-product response,
+plain, fenced after a preamble, with trailing commas and truncated.
+
+Run from the repository root: python -m bench.json_extract
+"""
+import json
+import time
+from typing import Any
+from utils.json_extract import extract_json
+from utils.product_pool import fake_products
+
+
+def old_extract(text: str) -> Any:
+    """The previous slice from the first [ to the last ]."""
+    start, end = text.find("["), text.rfind("]") + 1
+    return json.loads(text[start:end])
+
+
+if __name__ == "__main__":
+    products = fake_products(10_000, "electronics")
+    payload = json.dumps(products, indent=2)
+    samples = {
+        "plain": payload,
+        "preamble + fence": f"Sure! Here are the products:\n```json\n{payload}\n```\nLet me know!",
+        "trailing commas": payload.replace("}\n", "},\n").replace("},\n]", "},]"),
+        "truncated": payload[: len(payload) * 3 // 4],
+    }
+
+    print(f"{len(payload) / 1024 / 1024:.1f} MiB response, {len(products)} products")
+    for name, text in samples.items():
+        for label, parse in [("slice", old_extract), ("extract_json", lambda t: extract_json(t, list))]:
+            start = time.perf_counter()
+            try:
+                result = f"{len(parse(text))} items"
+            except ValueError as e:
+                result = f"failed ({type(e).__name__})"
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"  {name:17s} {label:13s} {elapsed:8.1f} ms  {result}")
@@ -0,0 +1,93 @@
+"""Compare LLM clients from create_llm, which share the connection pool of get_http_clients,
+with clients opening their own connections, against a local OpenAI-compatible stub server.
+
+Run from the repository root: python -m bench.llm_pool
+"""
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+CALLS = 200
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    """Stub chat completions endpoint, recording the connections it serves."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    wbufsize = 65536
+    connections = set()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        CompletionHandler.connections.add(self.client_address)
+        body = json.dumps(
+            {
+                "id": "chatcmpl-local",
+                "object": "chat.completion",
+                "created": 0,
+                "model": "local",
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "{}"},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(label: str, make_llm: Callable[[], Any]) -> None:
+    """Make a client and a call with it CALLS times, and print the latency and connections."""
+    CompletionHandler.connections = set()
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        make_llm().invoke("ping")
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>14}: {elapsed / CALLS * 1000:.2f} ms/call, "
+        f"{len(CompletionHandler.connections)} connections"
+    )
+
+
+if __name__ == "__main__":
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompletionHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    # The configuration is read on import, so the provider is set before importing llm
+    os.environ.update(LLM_PROVIDER="local", LLM_BASE_URL=base_url)
+    import httpx
+    from langchain_openai import ChatOpenAI
+    from utils.rate_limit import BackendLimiter, limiters
+    # Imported after utils, whose package imports llm
+    from llm import create_llm, get_http_clients
+
+    # Unthrottled, so that both measure the connections rather than the limiter
+    limiters["openai"] = BackendLimiter("openai", rate=1e9, burst=10**6, max_concurrency=8)
+
+    print(f"{CALLS} calls, each with a new client")
+    assert create_llm("planning", cached=False).llm.http_client is get_http_clients()[0]
+    measure("shared pool", lambda: create_llm("planning", cached=False))
+    measure(
+        "fresh clients",
+        lambda: ChatOpenAI(
+            model="local", api_key="local", base_url=base_url, http_client=httpx.Client()
+        ),
+    )
+    server.shutdown()
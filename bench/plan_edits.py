@@ -0,0 +1,58 @@
+"""Compare incremental plan edits with full replans, e.g. with LLM_PROVIDER=fake.
+
+Run from the repository root: python -m bench.plan_edits
+"""
+import json
+import time
+from typing import Callable
+from chatagent import apply_plan_patch, create_plan, modify_plan
+from interface import Plan
+from utils.metrics import metrics, track_llm_usage
+
+
+def measure(label: str, plan: Plan, changes: list, modify: Callable[[Plan, str], Plan]) -> None:
+    """Print the LLM calls, tokens and latency per change of applying each change to the plan."""
+    metrics.reset()
+    start = time.perf_counter()
+    with track_llm_usage() as usage:
+        for change in changes:
+            modify(plan, change)
+    elapsed = (time.perf_counter() - start) / len(changes)
+    counters = metrics.snapshot()["counters"]
+    calls = sum(
+        count for name, count in counters.items()
+        if name.startswith("llm.") and name.endswith(".calls")
+    ) / len(changes)
+    print(
+        f"{label:>17}: {calls:.1f} LLM calls, {usage['input_tokens'] / len(changes):6.0f} input "
+        f"and {usage['output_tokens'] / len(changes):4.0f} output tokens, "
+        f"{elapsed * 1000:7.1f} ms per change"
+    )
+
+
+if __name__ == "__main__":
+    plan = create_plan("Generate 3 sample products and share them in a Google Sheet")
+    # Each run gets its own counts, so neither is served the other's cached analyses
+    measure("incremental edit", plan, [f"Make it {n} products instead" for n in range(5, 25)], modify_plan)
+    measure(
+        "full replan",
+        plan,
+        [f"Make it {n} products instead" for n in range(25, 45)],
+        lambda plan, change: create_plan(
+            f"Generate {change.split()[2]} sample products and share them in a Google Sheet"
+        ),
+    )
+
+    # Malformed patches are rejected, so modify_plan replans instead
+    for patch in [
+        {"operations": "set x"},
+        {"operations": ["bad"]},
+        {"operations": [{"op": "add", "action": "bad"}]},
+        {"operations": [{"op": "update", "index": 0, "parameters": ["bad"]}]},
+        {"operations": [{"op": "update", "index": 0, "remove_parameters": "title"}]},
+    ]:
+        try:
+            apply_plan_patch(plan, patch)
+            print(f"accepted {patch}")
+        except ValueError as e:
+            print(f"rejected {json.dumps(patch)}: {e}")
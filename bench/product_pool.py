@@ -0,0 +1,77 @@
+"""Compare taking products from the pool with generating them, and check that restarts of
+worker processes sharing one pool path never serve a buffered product twice.
+
+Run from the repository root: python -m bench.product_pool
+"""
+import multiprocessing
+import os
+import tempfile
+import time
+import uuid
+from typing import Optional
+from utils.product_pool import ProductPool, fake_products
+
+
+class SlowGenerator:
+    """Stand-in for the LLM generator with typical completion latency."""
+
+    def generate_products(self, num_products: int, category: Optional[str] = None):
+        time.sleep(0.5 + 0.05 * num_products)
+        return fake_products(num_products, category or "books", seed=num_products)
+
+
+class FastGenerator:
+    """Generator of new products on every call, so that an ID served twice is a product served twice."""
+
+    def generate_products(self, num_products: int, category: Optional[str] = None):
+        products = fake_products(num_products, category or "books", seed=num_products)
+        for product in products:
+            product["name"] += f" {uuid.uuid4().hex[:8]}"
+        return products
+
+
+def worker(path: str) -> tuple:
+    """Take over the pool files of exited workers, refill and take products, then exit."""
+    pool = ProductPool(FastGenerator(), low_water=5, high_water=20, batch_size=10, path=path)
+    pool.load()
+    loaded = [p["product_id"] for products in pool.buffers.values() for p in products]
+    pool.refill()
+    served = [p["product_id"] for p in pool.take(30)]
+    # Exit without saving again, as a killed worker would
+    return loaded, served
+
+
+def measure_latency() -> None:
+    """Print the latency of an LLM call for 10 products and of a pool hit."""
+    generator = SlowGenerator()
+    start = time.perf_counter()
+    generator.generate_products(10)
+    print(f"LLM call for 10 products: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    pool = ProductPool(generator, low_water=5, high_water=20, batch_size=10, path=None)
+    pool.refill()
+    start = time.perf_counter()
+    products = pool.take(10)
+    print(f"Pool hit for 10 products:  {(time.perf_counter() - start) * 1000:.3f} ms")
+    print(f"Unique IDs: {len({p['product_id'] for p in products}) == len(products)}")
+
+
+def measure_restarts(generations: int = 3, workers: int = 4) -> None:
+    """Restart generations of worker processes sharing one pool path, counting products served twice."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "product_pool.json")
+        context = multiprocessing.get_context("fork")
+        served, loaded = [], []
+        for _ in range(generations):
+            with context.Pool(workers) as pool:
+                for generation_loaded, generation_served in pool.map(worker, [path] * workers):
+                    loaded += generation_loaded
+                    served += generation_served
+        print(f"Restarts: {len(loaded)} products taken over, {len(served)} served, "
+              f"{len(served) - len(set(served))} served twice")
+        print(f"Pool files left: {sorted(name.split('.', 2)[-1] for name in os.listdir(tmp))}")
+
+
+if __name__ == "__main__":
+    measure_latency()
+    measure_restarts()
@@ -0,0 +1,39 @@
+"""Compare the memory of 10k products held as a list of dicts and as a ProductTable, and
+their pickled and compact sizes.
+
+Run from the repository root: python -m bench.product_table
+"""
+import pickle
+import tracemalloc
+from config import PRODUCT_CATEGORIES
+from utils.product_pool import fake_products
+from utils.product_table import ProductTable
+
+NUM_PRODUCTS = 10_000
+
+
+if __name__ == "__main__":
+    source = [
+        product
+        for i, category in enumerate(PRODUCT_CATEGORIES)
+        for product in fake_products(NUM_PRODUCTS // len(PRODUCT_CATEGORIES), category, seed=i)
+    ]
+    # Copied through pickle, so that both measurements own their strings
+    records_bytes = pickle.dumps(source)
+    del source
+
+    tracemalloc.start()
+    records = pickle.loads(records_bytes)
+    dict_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    table = ProductTable.from_records(records)
+    table_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    compact_bytes = pickle.dumps(table.to_compact())
+    print(f"{NUM_PRODUCTS} products")
+    print(f"  list of dicts: {dict_memory / 1024:8.0f} KiB in memory, {len(records_bytes) / 1024:8.0f} KiB pickled")
+    print(f"  ProductTable:  {table_memory / 1024:8.0f} KiB in memory, {len(compact_bytes) / 1024:8.0f} KiB compact")
+    assert ProductTable.from_compact(pickle.loads(compact_bytes)).to_records() == table.to_records()
@@ -0,0 +1,58 @@
+"""Compare the wall time of a stand-in turn unprofiled and under profile_turn, sampling alone
+and with tracemalloc, and print what each profile reports.
+
+Run from the repository root: python -m bench.profiling
+"""
+import json
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+from utils.profiling import profile_turn
+
+
+def turn() -> None:
+    """Stand-in turn: an LLM wait followed by formatting a product table as JSON."""
+    time.sleep(0.2)
+    products = [
+        {"product_id": f"P-{i:05d}", "name": f"Product {i}", "price": i * 1.5, "tags": ["a", "b"]}
+        for i in range(5000)
+    ]
+    for _ in range(20):
+        json.loads(json.dumps(products))
+
+
+def timed(label: str, run: Callable[[], None], repeats: int = 3) -> float:
+    """Print and return the median wall time of a run."""
+    walls = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run()
+        walls.append(time.perf_counter() - start)
+    wall = statistics.median(walls)
+    print(f"{label:28s} {wall * 1000:7.1f} ms")
+    return wall
+
+
+def profiled(directory: str, allocations: bool, reports: List[Dict[str, Any]]) -> None:
+    """Run the turn under profile_turn and append its report."""
+    with profile_turn("bench", directory, allocations) as report:
+        turn()
+    reports.append(report)
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp()
+    baseline = timed("off", turn)
+    for allocations in (False, True):
+        reports = []
+        wall = timed(
+            f"sampling{' + tracemalloc' if allocations else ''}",
+            lambda: profiled(directory, allocations, reports),
+        )
+        report = reports[-1]
+        print(
+            f"{'':28s} overhead {(wall / baseline - 1):+.0%}; reported {report['wall_seconds']:.3f}s wall = "
+            f"{report['cpu_seconds']:.3f}s CPU + {report['waiting_seconds']:.3f}s waiting, "
+            f"{report['samples']} samples"
+        )
@@ -0,0 +1,78 @@
+"""Compare a client retrying immediately with one going through a BackendLimiter, against
+a local backend that returns 429 above 50 calls per second.
+
+Run from the repository root: python -m bench.rate_limit
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from utils.rate_limit import BackendLimiter
+
+
+class ThrottledError(Exception):
+    """429 returned by the stand-in backend."""
+
+    status_code = 429
+
+
+class StandInBackend:
+    """Local stand-in that returns 429 above `rate` calls per second."""
+
+    def __init__(self, rate: float, latency: float = 0.02):
+        self.rate = rate
+        self.latency = latency
+        self.calls = []
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def request(self) -> str:
+        with self.lock:
+            now = time.monotonic()
+            self.calls = [t for t in self.calls if now - t < 1.0]
+            if len(self.calls) >= self.rate:
+                self.rejected += 1
+                raise ThrottledError("429 Too Many Requests")
+            self.calls.append(now)
+        time.sleep(self.latency)
+        return "ok"
+
+
+def naive_call(backend: StandInBackend) -> bool:
+    """Retry immediately, like an unthrottled client."""
+    for _ in range(6):
+        try:
+            backend.request()
+            return True
+        except ThrottledError:
+            time.sleep(0.01)
+    return False
+
+
+def run(label: str, call: Callable[[], bool], backend: StandInBackend, total: int = 300) -> None:
+    """Make the calls from 32 threads and print how many succeeded and were throttled."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        succeeded = sum(pool.map(lambda _: call(), range(total)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>8}: {succeeded}/{total} succeeded, {succeeded / elapsed:.1f} ok/s, "
+        f"{backend.rejected} 429s in {elapsed:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    naive_backend = StandInBackend(rate=50)
+    run("naive", lambda: naive_call(naive_backend), naive_backend)
+
+    limited_backend = StandInBackend(rate=50)
+    limiter = BackendLimiter("standin", rate=45, burst=10, max_concurrency=16, base_delay=0.05)
+
+    def limited_call() -> bool:
+        try:
+            limiter.call(limited_backend.request)
+            return True
+        except ThrottledError:
+            return False
+
+    run("limited", limited_call, limited_backend)
@@ -0,0 +1,73 @@
+"""Compare the per-turn latency and checkpoint writes of the deterministic turns run through
+the graph and served directly.
+
+Run from the repository root with the fake LLM: LLM_PROVIDER=fake python -m bench.response_cache
+"""
+import statistics
+import time
+import uuid
+from collections import Counter
+from langchain_core.messages.ai import AIMessage
+from config import LLM_PROVIDER
+import chatagent
+from chatagent import GREETING, checkpointer, graph, send_message
+
+SESSIONS = 50
+REPLIES = 20
+
+writes = Counter()
+
+
+def count_checkpoint_writes() -> None:
+    """Count the checkpoint writes in writes["total"]."""
+    for name in ("put", "put_writes"):
+        def counted(*args, _original=getattr(checkpointer, name), **kwargs):
+            writes["total"] += 1
+            return _original(*args, **kwargs)
+        setattr(checkpointer, name, counted)
+
+
+def with_plan(thread_config) -> None:
+    send_message(thread_config, "Send an email to bob@example.com about the meeting")
+
+
+def without_plan(thread_config) -> None:
+    graph.update_state(
+        thread_config,
+        {"messages": [AIMessage(content=GREETING)], "current_plan": None, "tools_output": {}},
+        as_node="planner",
+    )
+
+
+PATHS = [
+    # Path, thread setup, replies alternating between two deterministic turns
+    ("decline + re-display", with_plan, ["no", "show plan"]),
+    ("confirm without plan", without_plan, ["yes", "confirm"]),
+]
+
+
+if __name__ == "__main__":
+    if LLM_PROVIDER != "fake":
+        raise SystemExit("run with LLM_PROVIDER=fake")
+    count_checkpoint_writes()
+    print(f"{SESSIONS} sessions x {REPLIES} replies, {type(checkpointer).__name__}")
+    for path, setup, messages in PATHS:
+        for enabled in (False, True):
+            chatagent.DETERMINISTIC_TURNS_ENABLED = enabled
+            latencies = []
+            turn_writes = 0
+            for _ in range(SESSIONS):
+                thread_config = {"configurable": {"thread_id": f"bench-{uuid.uuid4().hex}"}}
+                setup(thread_config)
+                for i in range(REPLIES):
+                    writes.clear()
+                    start = time.perf_counter()
+                    send_message(thread_config, messages[i % 2])
+                    latencies.append(time.perf_counter() - start)
+                    turn_writes += writes["total"]
+            label = "deterministic" if enabled else "graph"
+            print(
+                f"{path:22s} {label:13s} p50 {statistics.median(latencies) * 1000:6.2f} ms, "
+                f"p95 {statistics.quantiles(latencies, n=20)[-1] * 1000:6.2f} ms, "
+                f"{turn_writes / len(latencies):.1f} checkpoint writes per turn"
+            )
@@ -0,0 +1,150 @@
+"""Run app instances behind an in-process router, adding instances while sessions continue.
+
+Instances are started with the fake LLM and share their checkpoint shards. For each
+number of instances, prints the throughput, the sessions that moved to the new
+instance and the replies that did not extend their session's history.
+
+Run from the repository root: python -m bench.scale_out
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+import httpx
+from router import Router, create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run app instances behind an in-process router, adding instances while sessions continue"
+    )
+    parser.add_argument("--max-instances", type=int, default=8)
+    parser.add_argument("--sessions", type=int, default=48)
+    parser.add_argument("--rounds", type=int, default=2, help="modify/change turn pairs per session per step")
+    parser.add_argument("--fake-latency", type=float, default=0.2, help="LLM_FAKE_LATENCY of the instances")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    """Return a local port that is free to listen on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_instance(env: Dict[str, str]) -> tuple:
+    """Start an app instance on a free port and return its process and URL once it answers."""
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--app-dir", ROOT,
+            "--port", str(port),
+            "--log-level", "error",
+        ],
+        cwd=env["HARNESS_DIR"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(600):
+        try:
+            httpx.get(url, timeout=1)
+            return process, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Instance on port {port} did not start")
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Add instances one at a time while the sessions continue, printing each step's throughput."""
+    tmp = tempfile.mkdtemp()
+    env = {
+        **os.environ,
+        "HARNESS_DIR": tmp,
+        "LLM_PROVIDER": "fake",
+        "LLM_FAKE_LATENCY": str(args.fake_latency),
+        "CHECKPOINT_DB": f"{tmp}/checkpoints.db",
+        "CHECKPOINT_SHARDS": str(args.max_instances),
+        "IDEMPOTENCY_DB": f"{tmp}/idempotency.db",
+        "PRODUCT_POOL_PATH": f"{tmp}/product_pool.json",
+        "PRODUCT_POOL_LOW_WATER": "0",
+        "PRODUCT_POOL_HIGH_WATER": "0",
+    }
+    harness_router = Router([])
+    client = httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=create_app(harness_router)),
+        base_url="http://router",
+        timeout=None,
+    )
+    processes = []
+    # Messages each session has seen so far; every reply must extend them
+    history: Dict[str, List[dict]] = {}
+    owners: Dict[str, str] = {}
+    inconsistent = 0
+
+    async def turn(thread_id: str, path: str, **params: str) -> None:
+        nonlocal inconsistent
+        response = await client.get(path, params={"thread_id": thread_id, **params})
+        response.raise_for_status()
+        messages = response.json()["messages"]
+        seen = history.get(thread_id, [])
+        if messages[: len(seen)] != seen or len(messages) <= len(seen):
+            inconsistent += 1
+        history[thread_id] = messages
+
+    sessions = [f"session-{i}" for i in range(args.sessions)]
+    print(f"{args.sessions} sessions, {os.cpu_count()} CPU(s)")
+    try:
+        for count in range(1, args.max_instances + 1):
+            process, url = start_instance(env)
+            processes.append(process)
+            await client.post("/router/instances", params={"url": url})
+            moved = sum(
+                owners.get(s) not in (None, harness_router.ring.node_for(s)) for s in sessions
+            )
+            owners = {s: harness_router.ring.node_for(s) for s in sessions}
+            if count == 1:
+                await asyncio.gather(*(turn(s, "/chat_initiate") for s in sessions))
+                await asyncio.gather(
+                    *(
+                        turn(s, "/chat-continue", response="Generate 3 products and put them in a sheet")
+                        for s in sessions
+                    )
+                )
+
+            start = time.perf_counter()
+            for round in range(args.rounds):
+                await asyncio.gather(*(turn(s, "/chat-continue", response="modify") for s in sessions))
+                await asyncio.gather(
+                    *(
+                        turn(s, "/chat-continue", response=f"change the title to Round {count}.{round}")
+                        for s in sessions
+                    )
+                )
+            elapsed = time.perf_counter() - start
+            turns = args.sessions * args.rounds * 2
+            print(
+                f"{count} instance(s): {turns / elapsed:6.1f} turns/s, "
+                f"{moved:2d} sessions moved to the new instance, inconsistent replies: {inconsistent}"
+            )
+    finally:
+        await client.aclose()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+if __name__ == "__main__":
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(run(parse_args()))
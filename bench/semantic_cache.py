@@ -0,0 +1,52 @@
+"""Print the lookup latency and result of rephrased and changed prompts, and the latency of
+adding entries to a cache shared on disk as it fills up and evicts.
+
+Run from the repository root: python -m bench.semantic_cache
+"""
+import statistics
+import tempfile
+import time
+from utils.semantic_cache import SemanticCache
+
+CACHED = "Generate 10 products and put them in a sheet"
+PROMPTS = [
+    "generate 10 products and put them into a sheet",
+    "Please create 10 products and add them to a spreadsheet",
+    "Generate 20 products and put them in a sheet",
+    "Do not generate 10 products and put them in a sheet",
+    "Generate 10 products and put them in a sheet with prices",
+    "Send an email to bob@example.com",
+]
+
+
+def measure_lookups() -> None:
+    """Print the latency and response of each prompt's lookup."""
+    cache = SemanticCache("demo")
+    cache.add(CACHED, "cached analysis", latency=1.5)
+    for prompt in PROMPTS:
+        start = time.perf_counter()
+        response = cache.lookup(prompt)
+        print(f"{(time.perf_counter() - start) * 1000:.3f} ms  {response!r:20}  {prompt}")
+    print(cache.stats())
+
+
+def measure_adds(max_entries: int = 1000) -> None:
+    """Print the median add latency of a cache on disk filled to twice its capacity, per tenth of it."""
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = SemanticCache("demo", max_entries=max_entries, path=f"{tmp}/analysis")
+        step = max_entries // 10
+        for start_entry in range(0, 2 * max_entries, step):
+            latencies = []
+            for i in range(start_entry, start_entry + step):
+                start = time.perf_counter()
+                cache.add(f"Generate {i} products for catalog {i}", f"analysis {i}")
+                latencies.append(time.perf_counter() - start)
+            print(
+                f"entries {start_entry:5d}-{start_entry + step - 1:5d}: "
+                f"add p50 {statistics.median(latencies) * 1000:.3f} ms"
+            )
+
+
+if __name__ == "__main__":
+    measure_lookups()
+    measure_adds()
@@ -0,0 +1,24 @@
+"""Print the share of keys that move as nodes are added to a HashRing, against modulo
+hashing, and the load of each node relative to a fair share.
+
+Run from the repository root: python -m bench.sharding
+"""
+import random
+from utils.sharding import HashRing, ring_hash
+
+
+if __name__ == "__main__":
+    keys = [f"thread-{random.random()}" for _ in range(100_000)]
+    ring = HashRing(["node-0"])
+    for count in range(2, 9):
+        before = [ring.node_for(key) for key in keys]
+        ring.add(f"node-{count - 1}")
+        after = [ring.node_for(key) for key in keys]
+        moved = sum(a != b for a, b in zip(before, after)) / len(keys)
+        modulo = sum(ring_hash(k) % (count - 1) != ring_hash(k) % count for k in keys) / len(keys)
+        loads = sorted(after.count(node) / len(keys) * count for node in ring.nodes)
+        print(
+            f"{count - 1} -> {count} nodes: {moved:6.1%} of keys moved "
+            f"(modulo hashing {modulo:5.1%}, ideal {1 / count:5.1%}), "
+            f"load min/max {loads[0]:.2f}/{loads[-1]:.2f} x fair share"
+        )
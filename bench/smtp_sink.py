@@ -0,0 +1,45 @@
+"""Compare sending a bulk email with one SMTP session per recipient and with the shared
+session fan-out of send_bulk, against a local SMTP sink.
+
+Run from the repository root: python -m bench.smtp_sink
+"""
+import time
+from utils.email_sender import GmailSender
+from utils.rate_limit import BackendLimiter
+from utils.smtp_sink import SMTPSink
+
+NUM_RECIPIENTS = 1000
+BODY = "Hello ${name},\n\nYour product sheet is ready: https://example.com/sheet\n"
+
+
+def make_sender(port: int) -> GmailSender:
+    """A sender to the sink, without the configured SMTP rate limit."""
+    sender = GmailSender("bench@example.com", None, "127.0.0.1", port, use_tls=False)
+    sender.limiter = BackendLimiter("bench", rate=1e9, burst=10**6, max_concurrency=1)
+    return sender
+
+
+if __name__ == "__main__":
+    recipients = [f"user{i}@example.com" for i in range(NUM_RECIPIENTS)]
+    variables = {r: {"name": f"User {i}"} for i, r in enumerate(recipients)}
+
+    sink = SMTPSink().start()
+    sender = make_sender(sink.port)
+    start = time.perf_counter()
+    for recipient in recipients:
+        sender.send_email_with_attachment(
+            "bench@example.com", recipient, "Products",
+            BODY.replace("${name}", variables[recipient]["name"]),
+        )
+    elapsed = time.perf_counter() - start
+    print(f"one session per recipient: {elapsed:.2f}s, {sink.stats()}")
+    sink.shutdown()
+
+    sink = SMTPSink().start()
+    sender = make_sender(sink.port)
+    start = time.perf_counter()
+    results = sender.send_bulk("bench@example.com", recipients, "Products", BODY, variables)
+    elapsed = time.perf_counter() - start
+    sent = sum(result == "sent" for result in results.values())
+    print(f"shared session fan-out:    {elapsed:.2f}s, {sent} sent, {sink.stats()}")
+    sink.shutdown()
@@ -0,0 +1,102 @@
+"""Compare the analysis wait after send of users typing a message, without speculation and
+with speculative analysis of their drafts at several debounce delays, with the fake LLM.
+
+Run from the repository root: python -m bench.speculation
+"""
+import argparse
+import random
+import statistics
+import threading
+import time
+from typing import Any, Callable, Optional
+from prompts.task_analysis import TASK_ANALYSIS_PROMPT, TASK_ANALYSIS_REQUEST
+from utils.metrics import metrics
+from utils.speculation import Speculator
+# Imported after utils, whose package imports llm
+from llm import FakeChatModel, LLMClient, prompt_messages
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Speculative analysis of typed drafts with the fake LLM")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=1.5, help="fake LLM latency in seconds")
+    parser.add_argument("--edit-rate", type=float, default=0.25, help="share of users changing a number before sending")
+    return parser.parse_args()
+
+
+def make_analyze(latency: float) -> Callable[[str], Any]:
+    """Task analysis with a fake LLM of the given latency, without the semantic cache."""
+    client = LLMClient("analysis", FakeChatModel("analysis", latency))
+
+    def analyze(request: str) -> Any:
+        return client.invoke_json(
+            prompt_messages(TASK_ANALYSIS_PROMPT, TASK_ANALYSIS_REQUEST.format(request=request)),
+            dict,
+            use_cache=False,
+        )
+
+    return analyze
+
+
+def user(
+    args: argparse.Namespace,
+    analyze: Callable[[str], Any],
+    speculator: Optional[Speculator],
+    index: int,
+    rng: random.Random,
+) -> float:
+    """Type a message word by word, sending drafts, then send it; return the analysis wait after send."""
+    count = rng.choice([3, 5, 10, 20])
+    words = f"Generate {count} sample products in the {rng.choice(['books', 'home', 'sports'])} category and share them in a Google Sheet".split()
+    session = f"user-{index}"
+    for typed in range(1, len(words) + 1):
+        # Word-by-word typing with occasional pauses, drafts debounced client-side at word boundaries
+        time.sleep(rng.choice([0.2, 0.25, 0.3, 0.8]))
+        if speculator is not None:
+            speculator.submit(session, " ".join(words[:typed]))
+    time.sleep(1.0)  # Re-reading before hitting send
+    if rng.random() < args.edit_rate:
+        words[1] = str(count + 1)
+    message = " ".join(words)
+    start = time.perf_counter()
+    analysis = speculator.take(session, message) if speculator is not None else None
+    if analysis is None:
+        analysis = analyze(message)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    analyze = make_analyze(args.latency)
+    runs = [("baseline", None)] + [
+        (f"debounce {debounce}s", Speculator(analyze, debounce=debounce, workers=args.users * 4))
+        for debounce in [0.3, 0.6, 1.0]
+    ]
+    for label, speculator in runs:
+        metrics.reset()
+        rng = random.Random(0)
+        threads, waits = [], []
+        for index in range(args.users):
+            seed = rng.random()
+            thread = threading.Thread(
+                target=lambda i=index, s=seed: waits.append(
+                    user(args, analyze, speculator, i, random.Random(s))
+                )
+            )
+            threads.append(thread)
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counters = metrics.snapshot()["counters"]
+        line = (
+            f"{label:14s} analysis wait after send: mean {statistics.mean(waits):.2f}s, "
+            f"p50 {statistics.median(waits):.2f}s, max {max(waits):.2f}s; "
+            f"LLM tokens {counters.get('llm.analysis.total_tokens', 0):.0f}"
+        )
+        if speculator is not None:
+            stats = speculator.stats()
+            line += (
+                f"; hit rate {stats['hit_rate']:.0%}, wasted tokens {stats['wasted_tokens']:.0f}, "
+                f"superseded drafts {counters.get('speculation.superseded', 0):.0f}"
+            )
+        print(line)
@@ -1,20 +1,61 @@
 from langgraph.graph import StateGraph, START, END
-from typing import Literal, List, Dict, Any
+from typing import Callable, Literal, List, Dict, Any, Optional, Tuple
+from langchain_core.messages import HumanMessage
 from langchain_core.messages.ai import AIMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.checkpoint.memory import MemorySaver
-from langgraph.types import interrupt
+from langgraph.config import get_stream_writer
+from langgraph.types import Command, interrupt
 from datetime import datetime
 import json
+import os
+import time
+import uuid
 from utils.tools import (
     generate_products,
     create_google_sheet,
+    upsert_google_sheet,
     export_sheet,
+    export_products,
     send_email,
+    send_bulk_email,
 )
 from interface import TaskAnalysis, Action, Plan, AgentState
-from llm import get_chat_llm
-from prompts.task_analysis import TASK_ANALYSIS_PROMPT
-from prompts.action_plan import ACTION_PLAN_PROMPT
+from llm import get_llm, prompt_messages
+from config import (
+    ACTION_MAX_ATTEMPTS,
+    ACTION_RETRY_DELAY,
+    CHECKPOINT_DB,
+    CHECKPOINT_SHARDS,
+    DETERMINISTIC_TURNS_ENABLED,
+    SHEET_WRITE_MODE,
+    TURN_TIMEOUT,
+)
+from prompts.task_analysis import TASK_ANALYSIS_PROMPT, TASK_ANALYSIS_REQUEST
+from prompts.action_plan import ACTION_PLAN_PROMPT, ACTION_PLAN_REQUEST
+from prompts.plan_modification import (
+    PLAN_MODIFICATION_PROMPT,
+    PLAN_MODIFICATION_REQUEST,
+)
+from utils.metrics import metrics
+from utils.jobs import tool_limiter
+from utils.tenants import current_tenant, tenant_manager
+from utils.speculation import Speculator
+from utils.cancellation import (
+    TurnCancelledError,
+    cancellable_sleep,
+    check_cancelled,
+    turns,
+)
+from utils.rate_limit import is_transient
+from utils.approval_policy import approval_policy
+from utils.response_cache import response_cache
+from utils.audit_log import audit_log
+from utils.idempotency import (
+    SIDE_EFFECT_ACTIONS,
+    idempotency_key,
+    idempotency_store,
+)
 from utils.logger import (
     log_model_message,
     log_user_input,
@@ -22,22 +63,68 @@ from utils.logger import (
     log_error,
 )
 
-llm = get_chat_llm()
+ACTION_FIELDS = ["action_type", "description", "parameters", "status", "subtask_id"]
+# tools_output each action type needs from an earlier action, and the one it produces
+ACTION_INPUTS = {
+    "create_sheet": "products",
+    "export_sheet": "sheet",
+    "send_email": "sheet",
+    "send_bulk_email": "sheet",
+}
+ACTION_OUTPUTS = {"generate_products": "products", "create_sheet": "sheet", "export_sheet": "export_path"}
+# Action types execute_action can run
+ACTION_TYPES = {"generate_products", "create_sheet", "export_sheet", "send_email", "send_bulk_email"}
+RESULT_MARKS = {"completed": "✓", "partial": "◐", "failed": "✗", "skipped": "↷"}
+EXIT_COMMANDS = {"quit", "exit", "goodbye"}
+CONFIRMATIONS = {"yes", "confirm", "proceed"}
+# Replies to the modification request that ask for the plan as it is
+UNCHANGED_PLAN_REPLIES = CONFIRMATIONS | {"no changes", "show plan"}
+# Messages containing these start a new plan instead of modifying the current one
+NEW_PLAN_PHRASES = ("new plan", "new task", "new request", "start over")
+
+
+def compact_json(data: Any) -> str:
+    """Serialize data for embedding in a prompt without whitespace."""
+    return json.dumps(data, separators=(",", ":"))
+
+
+def invoke_llm_json(
+    purpose: str, system_prompt: str, request: str, expect: type, use_cache: bool = True
+) -> Tuple[Any, bool]:
+    """Invoke the LLM routed for the purpose and parse the JSON of its reply.
+
+    Returns the value and whether it was repaired from a truncated or malformed reply.
+    """
+    return get_llm(purpose).invoke_json(
+        prompt_messages(system_prompt, request), expect, use_cache=use_cache, with_repaired=True
+    )
+
+
+def validate_actions(actions: List[Action]) -> None:
+    """Validate the structure and the action type of each action in a plan."""
+    if not isinstance(actions, list):
+        raise ValueError("Actions must be a list")
+    for action in actions:
+        if not isinstance(action, dict) or not all(
+            key in action for key in ACTION_FIELDS
+        ):
+            raise ValueError("Invalid action structure")
+        if not isinstance(action["parameters"], dict):
+            raise ValueError("Action parameters must be an object")
+        if action["action_type"] not in ACTION_TYPES:
+            raise ValueError(f"Unknown action type: {action['action_type']}")
 
 
-def analyze_task(request: str) -> TaskAnalysis:
+def analyze_task(request: str, use_cache: bool = True) -> TaskAnalysis:
     """Analyze the task and determine if it needs to be broken down into subtasks using LLM."""
     try:
-        response = llm.invoke(TASK_ANALYSIS_PROMPT.format(request=request))
-        # Extract JSON from the response
-        content = response.content.strip()
-        # Find the first { and last } to extract the JSON object
-        start = content.find("{")
-        end = content.rfind("}") + 1
-        if start == -1 or end == 0:
-            raise ValueError("No JSON object found in response")
-        json_str = content[start:end]
-        analysis = json.loads(json_str)
+        analysis, _ = invoke_llm_json(
+            "analysis",
+            TASK_ANALYSIS_PROMPT,
+            TASK_ANALYSIS_REQUEST.format(request=request),
+            dict,
+            use_cache,
+        )
 
         # Check if we need clarification
         if "needs_clarification" in analysis and analysis["needs_clarification"]:
@@ -87,10 +174,22 @@ def analyze_task(request: str) -> TaskAnalysis:
         }
 
 
-def create_plan(request: str) -> Plan:
+# Analyzes drafts sent while the user types; partial drafts bypass the semantic cache
+# so they are never served to other requests
+speculator = Speculator(lambda request: analyze_task(request, use_cache=False))
+
+
+def create_plan(request: str, analysis: Optional[TaskAnalysis] = None) -> Plan:
     """Create a detailed plan based on the user's request using LLM."""
+    with metrics.timer("planning.full_replan"):
+        return _create_plan(request, analysis)
+
+
+def _create_plan(request: str, analysis: Optional[TaskAnalysis] = None) -> Plan:
+    """Analyze the request, unless already analyzed, and generate its actions."""
     # First, analyze the task
-    analysis = analyze_task(request)
+    if analysis is None:
+        analysis = analyze_task(request)
 
     # If the analysis indicates we need clarification, return it directly
     if "needs_clarification" in analysis and analysis["needs_clarification"]:
@@ -103,40 +202,161 @@ def create_plan(request: str) -> Plan:
 
     # Generate actions based on the analysis using LLM
     try:
-        response = llm.invoke(
-            ACTION_PLAN_PROMPT.format(analysis=json.dumps(analysis, indent=2))
+        actions, repaired = invoke_llm_json(
+            "planning",
+            ACTION_PLAN_PROMPT,
+            ACTION_PLAN_REQUEST.format(analysis=compact_json(analysis)),
+            list,
         )
 
-        # Parse the LLM response as JSON
-        actions = json.loads(response.content)
-
         # Validate the structure of each action
-        for action in actions:
-            if not all(
-                key in action
-                for key in [
-                    "action_type",
-                    "description",
-                    "parameters",
-                    "status",
-                    "subtask_id",
-                ]
-            ):
-                raise ValueError("Invalid action structure")
+        validate_actions(actions)
 
-        return {
+        plan = {
             "goal": request,
             "analysis": analysis,
             "actions": actions,
             "status": "draft",
+            "confirmation_id": uuid.uuid4().hex,
         }
+        # Repaired replies may be missing actions, so their plans always need confirmation
+        if repaired:
+            plan["repaired"] = True
+        return plan
     except (json.JSONDecodeError, ValueError) as e:
         log_error("Error parsing LLM response for actions", e)
         raise e
 
 
-def execute_action(action: Action, tools_output: Dict[str, Any] = None) -> str:
-    """Execute a single action from the plan."""
+def validate_patch(patch: Dict[str, Any]) -> None:
+    """Validate the structure of a plan patch, raising ValueError if it is malformed."""
+    operations = patch.get("operations", [])
+    if not isinstance(operations, list):
+        raise ValueError("Patch operations must be a list")
+    if not isinstance(patch.get("goal") or "", str):
+        raise ValueError("Patch goal must be a string")
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise ValueError("Patch operations must be objects")
+        op = operation.get("op")
+        if op not in {"add", "remove", "update"}:
+            raise ValueError(f"Unknown patch operation: {op}")
+        if op == "add" and not isinstance(operation.get("action"), dict):
+            raise ValueError("Added actions must be objects")
+        if op == "update":
+            if not isinstance(operation.get("parameters", {}), dict):
+                raise ValueError("Updated parameters must be an object")
+            removed = operation.get("remove_parameters", [])
+            if not isinstance(removed, list) or not all(isinstance(key, str) for key in removed):
+                raise ValueError("Removed parameters must be a list of names")
+
+
+def apply_plan_patch(plan: Plan, patch: Dict[str, Any]) -> Plan:
+    """Apply a structured patch of add/remove/update operations to a copy of the plan."""
+    validate_patch(patch)
+    actions = [
+        {**action, "parameters": dict(action["parameters"]), "status": "pending"}
+        for action in plan["actions"]
+    ]
+    removed = set()
+    additions = []
+
+    for operation in patch.get("operations", []):
+        op = operation["op"]
+        if op == "add":
+            additions.append(operation)
+            continue
+
+        index = operation.get("index")
+        if not isinstance(index, int) or not 0 <= index < len(actions):
+            raise ValueError(f"Invalid action index in patch: {index}")
+
+        if op == "remove":
+            removed.add(index)
+        else:
+            action = actions[index]
+            if "action_type" in operation:
+                action["action_type"] = operation["action_type"]
+            if "description" in operation:
+                action["description"] = operation["description"]
+            action["parameters"].update(operation.get("parameters", {}))
+            for key in operation.get("remove_parameters", []):
+                action["parameters"].pop(key, None)
+
+    actions = [action for i, action in enumerate(actions) if i not in removed]
+    for operation in additions:
+        action = {**operation["action"], "status": "pending"}
+        index = operation.get("index", len(actions))
+        if not isinstance(index, int):
+            index = len(actions)
+        actions.insert(max(0, min(index, len(actions))), action)
+
+    validate_actions(actions)
+    return {
+        **plan,
+        "goal": patch.get("goal") or plan["goal"],
+        "actions": actions,
+        "status": "draft",
+        "confirmation_id": uuid.uuid4().hex,
+    }
+
+
+def modify_plan(plan: Plan, change: str) -> Plan:
+    """Modify an existing plan incrementally, replanning from the change when no patch applies.
+
+    A patched plan gets a fresh analysis of its patched goal, so the plan displayed
+    for confirmation never shows the analysis of the plan before the change.
+    """
+    with metrics.timer("planning.incremental_edit"):
+        try:
+            patch, repaired = invoke_llm_json(
+                "modification",
+                PLAN_MODIFICATION_PROMPT,
+                PLAN_MODIFICATION_REQUEST.format(
+                    goal=plan["goal"],
+                    actions=compact_json(plan["actions"]),
+                    change=change,
+                ),
+                dict,
+            )
+            # An empty patch leaves the requested change unapplied
+            if not patch.get("replan") and patch.get("operations"):
+                patched = apply_plan_patch(plan, patch)
+                analysis = analyze_task(patched["goal"])
+                if not analysis.get("needs_clarification"):
+                    metrics.incr("planning.incremental_edit.applied")
+                    patched["analysis"] = analysis
+                    if repaired:
+                        patched["repaired"] = True
+                    return patched
+        except (json.JSONDecodeError, ValueError) as e:
+            log_error("Error applying plan modification, replanning", e)
+
+    metrics.incr("planning.incremental_edit.fallback")
+    return create_plan(change)
+
+
+def starts_new_plan(message: str) -> bool:
+    """Whether a message asks for a new plan rather than a change to the current one."""
+    text = message.lower()
+    return any(phrase in text for phrase in NEW_PLAN_PHRASES)
+
+
+def bulk_recipients(parameters: Dict[str, Any]) -> List[str]:
+    """Recipients of a send_bulk_email action, given as a list or a comma-separated string."""
+    recipients = parameters.get("recipients") or []
+    if isinstance(recipients, str):
+        recipients = [r.strip() for r in recipients.split(",") if r.strip()]
+    return recipients
+
+
+def execute_action(
+    action: Action, tools_output: Dict[str, Any] = None, thread_id: Optional[str] = None
+) -> str:
+    """Execute a single action from the plan, returning its outcome or raising its error.
+
+    Sheets upserted by a thread are found by that thread only.
+    """
     try:
         if action["action_type"] == "generate_products":
             num_products = int(action["parameters"].get("num_products", 3))
@@ -144,13 +364,32 @@ def execute_action(action: Action, tools_output: Dict[str, Any] = None) -> str:
             products = generate_products.invoke({"num_products": num_products})
             if tools_output is not None:
                 tools_output["products"] = products
-            return f"Generated {len(products)} products successfully"
+            return f"Generated {products['num_rows']} products successfully"
 
         elif action["action_type"] == "create_sheet":
             if not tools_output or "products" not in tools_output:
                 raise ValueError("No product data available. Generate products first.")
 
             title = action["parameters"].get("title", "Product List")
+            mode = action["parameters"].get("mode", SHEET_WRITE_MODE)
+            spreadsheet_id = action["parameters"].get("spreadsheet_id")
+            if mode == "upsert" or spreadsheet_id:
+                # Update the existing spreadsheet instead of creating another one
+                sheet_result = upsert_google_sheet.invoke(
+                    {
+                        "title": title,
+                        "data": tools_output["products"],
+                        "spreadsheet_id": spreadsheet_id,
+                        "thread_id": thread_id,
+                    }
+                )
+                tools_output["sheet"] = sheet_result
+                return (
+                    f"Updated Google Sheet ({sheet_result['updated']} rows changed, "
+                    f"{sheet_result['appended']} added, {sheet_result['removed']} removed): "
+                    f"{sheet_result['shareable_link']}"
+                )
+
             # Use invoke() instead of direct call
             sheet_result = create_google_sheet.invoke(
                 {"title": title, "data": tools_output["products"]}
@@ -160,10 +399,21 @@ def execute_action(action: Action, tools_output: Dict[str, Any] = None) -> str:
             return f"Created Google Sheet: {sheet_result['shareable_link']}"
 
         elif action["action_type"] == "export_sheet":
+            format = action["parameters"].get("format", "csv")
+            if (
+                format == "csv"
+                and tools_output
+                and "sheet" not in tools_output
+                and "products" in tools_output
+            ):
+                # Export generated products locally when no sheet was created
+                export_path = export_products.invoke({"data": tools_output["products"]})
+                tools_output["export_path"] = export_path
+                return f"Exported products to {export_path}"
+
             if not tools_output or "sheet" not in tools_output:
                 raise ValueError("No sheet available. Create a sheet first.")
 
-            format = action["parameters"].get("format", "csv")
             # Use invoke() instead of direct call
             export_path = export_sheet.invoke(
                 {"sheet_id": tools_output["sheet"]["sheet_id"], "format": format}
@@ -207,12 +457,205 @@ def execute_action(action: Action, tools_output: Dict[str, Any] = None) -> str:
 
             return f"Email successfully sent to {recipient} with subject '{subject}'"
 
+        elif action["action_type"] == "send_bulk_email":
+            if not tools_output or "sheet" not in tools_output:
+                raise ValueError("No sheet available. Create a sheet first.")
+
+            recipients = bulk_recipients(action["parameters"])
+            subject = action["parameters"].get("subject", "Product List")
+            body = action["parameters"].get("body") or ""
+            sheet_link = tools_output["sheet"].get("shareable_link")
+            log_action(
+                "send_bulk_email",
+                f"Sending email to {len(recipients)} recipients with subject '{subject}'",
+                f"Email body: {body}",
+            )
+
+            # Templates may place $sheet_link themselves, otherwise append it
+            if "$sheet_link" not in body and "${sheet_link}" not in body:
+                body = f"{body}\n\nSheet link: $sheet_link" if body else "Sheet link: $sheet_link"
+            per_recipient = action["parameters"].get("variables") or {}
+            variables = {
+                recipient: {"sheet_link": sheet_link, **per_recipient.get(recipient, {})}
+                for recipient in recipients
+            }
+
+            results = send_bulk_email.invoke(
+                {
+                    "recipients": recipients,
+                    "subject": subject,
+                    "body": body,
+                    "variables": variables,
+                }
+            )
+            tools_output["email_results"] = results
+            failed = [f"{r} ({result})" for r, result in results.items() if result != "sent"]
+            outcome = f"Sent {len(results) - len(failed)}/{len(results)} emails with subject '{subject}'"
+            if failed and len(failed) == len(results):
+                # Recipients skipped by a cancelled turn are not a failure of the action
+                check_cancelled()
+                raise RuntimeError(f"{outcome}; failed: {', '.join(failed)}")
+            return f"{outcome}; failed: {', '.join(failed)}" if failed else outcome
+
         else:
-            return f"Unknown action type: {action['action_type']}"
+            raise ValueError(f"Unknown action type: {action['action_type']}")
 
     except Exception as e:
         log_error("Error executing action", e)
-        return f"Action failed: {str(e)}"
+        raise
+
+
+def execute_action_once(
+    action: Action,
+    tools_output: Dict[str, Any],
+    key: Optional[str],
+    thread_id: Optional[str] = None,
+) -> str:
+    """Execute an action, replaying its recorded outcome if it already ran under the same key."""
+    if key is None or action["action_type"] not in SIDE_EFFECT_ACTIONS:
+        return execute_action(action, tools_output, thread_id)
+
+    record = idempotency_store.claim(key)
+    if record is not None:
+        metrics.incr("idempotency.replayed")
+        log_action(
+            action["action_type"], f"Replaying recorded outcome of {key}", record["outcome"]
+        )
+        tools_output.update(record["tools_output"])
+        return record["outcome"]
+
+    before = dict(tools_output)
+    try:
+        outcome = execute_action(action, tools_output, thread_id)
+    except BaseException:
+        # Failures are not recorded so that a retry executes the action again
+        idempotency_store.release(key)
+        raise
+    changes = {
+        name: value for name, value in tools_output.items() if before.get(name) is not value
+    }
+    idempotency_store.complete(key, {"outcome": outcome, "tools_output": changes})
+    return outcome
+
+
+def missing_input(action: Action, tools_output: Dict[str, Any]) -> Optional[str]:
+    """The tools_output an action needs from an earlier action that is not there, if any."""
+    needed = ACTION_INPUTS.get(action["action_type"])
+    if needed is None or needed in tools_output:
+        return None
+    # Without a sheet, CSV exports are written from the generated products
+    if (
+        action["action_type"] == "export_sheet"
+        and action["parameters"].get("format", "csv") == "csv"
+        and "products" in tools_output
+    ):
+        return None
+    return needed
+
+
+def subtask_dependencies(plan: Plan) -> Dict[str, List[str]]:
+    """The subtasks each subtask of the plan's analysis depends on, by subtask ID."""
+    subtasks = (plan.get("analysis") or {}).get("subtasks") or []
+    return {
+        subtask.get("id", f"task_{i}"): subtask.get("dependencies") or []
+        for i, subtask in enumerate(subtasks, 1)
+    }
+
+
+def blocking_action(plan: Plan, index: int, tools_output: Dict[str, Any]) -> Optional[Action]:
+    """The earlier action that failed or was skipped and that an action depends on, if any.
+
+    An action depends on the action producing the tools_output it needs, and on the
+    actions of the subtasks its own subtask depends on.
+    """
+    actions = plan["actions"]
+    unsuccessful = [a for a in actions[:index] if a["status"] in {"failed", "skipped"}]
+    if not unsuccessful:
+        return None
+    action = actions[index]
+    needed = missing_input(action, tools_output)
+    dependencies = subtask_dependencies(plan).get(action.get("subtask_id"), [])
+    for earlier in reversed(unsuccessful):
+        if needed is not None and ACTION_OUTPUTS.get(earlier["action_type"]) == needed:
+            return earlier
+        if earlier.get("subtask_id") in dependencies:
+            return earlier
+    return None
+
+
+def action_recipients(
+    action: Action, status: str, tools_output: Dict[str, Any]
+) -> List[Tuple[str, str]]:
+    """The email recipients of an action that ran with the given status, each with its own status."""
+    if action["action_type"] == "send_email":
+        recipient = action["parameters"].get("recipient")
+        if not recipient:
+            return []
+        return [(recipient, "sent" if status == "completed" else status)]
+    if action["action_type"] == "send_bulk_email":
+        recipients = bulk_recipients(action["parameters"])
+        results = tools_output.get("email_results") or {}
+        # The results of this action, not those of an earlier bulk email of the plan
+        if status != "skipped" and set(results) == set(recipients):
+            return list(results.items())
+        return [(recipient, status) for recipient in recipients]
+    return []
+
+
+def partially_failed(action: Action, tools_output: Dict[str, Any]) -> bool:
+    """Whether an action that ran failed for some of its email recipients."""
+    if action["action_type"] != "send_bulk_email":
+        return False
+    results = tools_output.get("email_results") or {}
+    return any(result != "sent" for result in results.values())
+
+
+def run_action(
+    action: Action,
+    tools_output: Dict[str, Any],
+    key: Optional[str],
+    thread_id: Optional[str] = None,
+) -> Tuple[str, str, int]:
+    """Execute an action, retrying transient failures, and return its status, outcome and attempts.
+
+    A bulk email sent to only some of its recipients is "partial". Actions with side
+    effects get a single attempt: their API calls are already retried by the backend
+    limiters, and repeating the whole action could repeat an effect that took place
+    before the failure.
+    """
+    attempts = 1 if action["action_type"] in SIDE_EFFECT_ACTIONS else ACTION_MAX_ATTEMPTS
+    for attempt in range(1, attempts + 1):
+        check_cancelled()
+        with tenant_manager.slot(current_tenant.get(), "tool_calls"), tool_limiter.slot(
+            action["action_type"]
+        ):
+            try:
+                outcome = execute_action_once(action, tools_output, key, thread_id)
+                status = "partial" if partially_failed(action, tools_output) else "completed"
+                return status, outcome, attempt
+            except Exception as e:
+                if attempt == attempts or not is_transient(e):
+                    return "failed", f"Action failed: {e}", attempt
+        metrics.incr(f"actions.{action['action_type']}.retries")
+        cancellable_sleep(ACTION_RETRY_DELAY * 2 ** (attempt - 1))
+
+
+def emit_execution_event(event: str, index: int, action: Action, **fields: Any) -> None:
+    """Write an execution event to the stream of the graph run, for clients streaming the turn."""
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:
+        # Executed outside a graph run, e.g. by batch.py
+        return
+    writer(
+        {
+            "type": event,
+            "index": index,
+            "action_type": action["action_type"],
+            "description": action["description"],
+            **fields,
+        }
+    )
 
 
 def human_node(state: AgentState) -> AgentState:
@@ -223,7 +666,7 @@ def human_node(state: AgentState) -> AgentState:
     user_input = interrupt("Give me your reply")
     log_user_input(user_input)
 
-    if user_input.lower() in {"quit", "exit", "goodbye"}:
+    if user_input.lower() in EXIT_COMMANDS:
         return {
             "messages": [("user", user_input)],
             "current_plan": state.get("current_plan"),
@@ -248,6 +691,10 @@ def maybe_exit_human_node(state: AgentState) -> Literal["planner", "agent", "__e
     if state.get("current_plan") and state.get("needs_confirmation"):
         return "agent"
 
+    # Confirming without a plan gets the agent's error instead of a plan for "yes"
+    if not state.get("current_plan") and state["messages"][-1].content.lower() in CONFIRMATIONS:
+        return "agent"
+
     # Otherwise, go to planner to create/modify the plan
     return "planner"
 
@@ -320,9 +767,18 @@ def format_execution_results(
             "completed_actions": sum(
                 1 for action in plan["actions"] if action["status"] == "completed"
             ),
+            "partial_actions": sum(
+                1 for action in plan["actions"] if action["status"] == "partial"
+            ),
             "failed_actions": sum(
                 1 for action in plan["actions"] if action["status"] == "failed"
             ),
+            "skipped_actions": sum(
+                1 for action in plan["actions"] if action["status"] == "skipped"
+            ),
+            "duration_seconds": round(
+                sum(action.get("duration_seconds", 0) for action in plan["actions"]), 3
+            ),
         },
     }
 
@@ -344,6 +800,17 @@ def format_error_message(error: str) -> str:
     return json.dumps(output)
 
 
+def format_cancellation_message(reason: str) -> str:
+    """Format the message of a turn that was cancelled before it finished."""
+    output = {
+        "type": "cancelled",
+        "title": "Request Cancelled",
+        "message": f"Stopped before finishing: {reason}.",
+        "timestamp": datetime.now().isoformat(),
+    }
+    return json.dumps(output)
+
+
 def format_confirmation_request() -> str:
     """Format the confirmation request message."""
     output = {
@@ -371,21 +838,23 @@ def format_modification_request() -> str:
 #     return ToolNode(tools=AVAILABLE_TOOLS)
 
 
-def planner_node(state: AgentState) -> AgentState:
+# Serialized once, since every session starts with it
+GREETING = json.dumps(
+    {
+        "type": "greeting",
+        "title": "Welcome",
+        "message": "Hello! I can help you generate product data, create Google Sheets, and send emails. What would you like me to do?",
+    }
+)
+
+
+def planner_node(
+    state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
     """The planner node that creates and modifies action plans."""
     if not state.get("messages"):
         return {
-            "messages": [
-                AIMessage(
-                    content=json.dumps(
-                        {
-                            "type": "greeting",
-                            "title": "Welcome",
-                            "message": "Hello! I can help you generate product data, create Google Sheets, and send emails. What would you like me to do?",
-                        }
-                    )
-                )
-            ],
+            "messages": [AIMessage(content=GREETING)],
             "current_plan": None,
             "needs_confirmation": False,
             "finished": False,
@@ -395,10 +864,38 @@ def planner_node(state: AgentState) -> AgentState:
     last_user_msg = state["messages"][-1]
 
     try:
-        # If we have a plan and the user wants to modify it
-        if state.get("current_plan") and "modify" in last_user_msg.content.lower():
-            # Create a new plan based on the modification request
-            new_plan = create_plan(last_user_msg.content)
+        # If we have an unexecuted plan, or the user explicitly wants to modify it
+        current_plan = state.get("current_plan")
+        if (
+            current_plan
+            and current_plan["status"] == "draft"
+            and last_user_msg.content.lower() in UNCHANGED_PLAN_REPLIES
+        ):
+            # Nothing to change: show the same plan again for confirmation
+            return {
+                "messages": [
+                    AIMessage(
+                        content=response_cache.get(
+                            "planner", current_plan, lambda: format_plan_for_display(current_plan)
+                        )
+                    )
+                ],
+                "current_plan": current_plan,
+                "needs_confirmation": True,
+                "finished": False,
+                "tools_output": {},
+            }
+
+        if (
+            current_plan
+            and not starts_new_plan(last_user_msg.content)
+            and (
+                current_plan["status"] == "draft"
+                or "modify" in last_user_msg.content.lower()
+            )
+        ):
+            # Patch the existing plan with the requested change
+            new_plan = modify_plan(current_plan, last_user_msg.content)
             if new_plan["status"] == "needs_clarification":
                 return {
                     "messages": [
@@ -419,8 +916,10 @@ def planner_node(state: AgentState) -> AgentState:
                 "tools_output": {},
             }
 
-        # Create a new plan
-        plan = create_plan(last_user_msg.content)
+        # Create a new plan, reusing the analysis speculated while the user typed
+        thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+        analysis = speculator.take(thread_id, last_user_msg.content) if thread_id else None
+        plan = create_plan(last_user_msg.content, analysis)
 
         # Check if we need clarification
         if plan["status"] == "needs_clarification":
@@ -473,36 +972,43 @@ def agent_node(state: AgentState) -> AgentState:
     last_user_msg = state["messages"][-1]
 
     if state.get("needs_confirmation"):
+        # Plans routed here straight from the planner were auto-approved by the policy
+        auto_approved = isinstance(
+            last_user_msg, AIMessage
+        ) and approval_policy.approves(state["current_plan"])
         # Check if user confirmed the plan
-        if last_user_msg.content.lower() in {"yes", "confirm", "proceed"}:
-            # Execute the plan
+        if auto_approved or last_user_msg.content.lower() in CONFIRMATIONS:
+            # Start executing the plan; each action runs in its own graph step
             plan = state["current_plan"]
-            plan["status"] = "executing"
-            results = []
-            tools_output = {}
-
-            for action in plan["actions"]:
-                outcome = execute_action(action, tools_output)
-                log_action(action["action_type"], action["description"], outcome)
-                action["status"] = "completed"
-                results.append(f"✓ {action['description']}: {outcome}")
-
-            plan["status"] = "completed"
-            return {
-                "messages": [
-                    AIMessage(
-                        content=format_execution_results(plan, results, tools_output)
-                    )
+            plan = {
+                **plan,
+                "actions": [
+                    {
+                        **{key: action[key] for key in ACTION_FIELDS if key in action},
+                        "status": "pending",
+                    }
+                    for action in plan["actions"]
                 ],
+                "status": "executing",
+            }
+            return {
                 "current_plan": plan,
                 "needs_confirmation": False,
                 "finished": False,
-                "tools_output": tools_output,
+                "tools_output": {},
+                "execution_results": [],
+                "next_action": 0,
             }
         else:
             # User declined or wants modifications
             return {
-                "messages": [AIMessage(content=format_modification_request())],
+                "messages": [
+                    AIMessage(
+                        content=response_cache.get(
+                            "agent", "modification_request", format_modification_request
+                        )
+                    )
+                ],
                 "current_plan": state["current_plan"],
                 "needs_confirmation": False,
                 "finished": False,
@@ -512,6 +1018,316 @@ def agent_node(state: AgentState) -> AgentState:
     return state
 
 
+def execute_node(
+    state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
+    """Execute the next pending action of the plan and checkpoint its output."""
+    plan = state["current_plan"]
+    # Side effects are deduplicated per conversation thread, plan and action
+    thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+    index = state.get("next_action", 0)
+    tools_output = dict(state.get("tools_output") or {})
+    results = list(state.get("execution_results") or [])
+    actions = [dict(action) for action in plan["actions"]]
+
+    if index < len(actions):
+        # A cancelled turn stops between actions
+        check_cancelled()
+        action = actions[index]
+        start = time.perf_counter()
+        # Actions depending on one that failed are skipped without calling any API
+        blocker = blocking_action({**plan, "actions": actions}, index, tools_output)
+        if blocker is not None:
+            status, attempts = "skipped", 0
+            reason = "failed" if blocker["status"] == "failed" else "was skipped"
+            outcome = f"Skipped because '{blocker['description']}' {reason}"
+        else:
+            emit_execution_event("action_started", index, action)
+            key = idempotency_key(thread_id, plan, index) if thread_id else None
+            status, outcome, attempts = run_action(action, tools_output, key, thread_id)
+        duration = time.perf_counter() - start
+        log_action(action["action_type"], action["description"], outcome)
+        metrics.incr(f"actions.{status}")
+        metrics.observe(f"actions.{action['action_type']}.duration", duration)
+        action.update(status=status, attempts=attempts, duration_seconds=round(duration, 3))
+        results.append(f"{RESULT_MARKS[status]} {action['description']}: {outcome}")
+        audit_log.record(
+            {
+                "thread_id": thread_id,
+                "tenant_id": current_tenant.get(),
+                "action_type": action["action_type"],
+                "description": action["description"],
+                "status": status,
+                "outcome": outcome,
+                "attempts": attempts,
+                "duration_seconds": action["duration_seconds"],
+                "parameters": action["parameters"],
+                "recipients": action_recipients(action, status, tools_output),
+            }
+        )
+        emit_execution_event(
+            "action_finished",
+            index,
+            action,
+            status=status,
+            outcome=outcome,
+            attempts=attempts,
+            duration_seconds=action["duration_seconds"],
+        )
+        index += 1
+
+    plan = {**plan, "actions": actions}
+    update = {
+        "current_plan": plan,
+        "tools_output": tools_output,
+        "execution_results": results,
+        "next_action": index,
+    }
+
+    if index >= len(actions):
+        completed = all(action["status"] == "completed" for action in actions)
+        plan["status"] = "completed" if completed else "failed"
+        update["messages"] = [
+            AIMessage(content=format_execution_results(plan, results, tools_output))
+        ]
+
+    return update
+
+
+def maybe_continue_execution(state: AgentState) -> Literal["execute", "human"]:
+    """Keep executing while the plan has pending actions."""
+    plan = state.get("current_plan")
+    if plan and plan["status"] == "executing":
+        return "execute"
+    return "human"
+
+
+def run_graph(
+    graph_input: Any,
+    thread_config: RunnableConfig,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> AgentState:
+    """Run the graph to its next interrupt, passing the execution events of the run to on_event."""
+    if on_event is None:
+        return graph.invoke(graph_input, config=thread_config)
+    state = None
+    for mode, chunk in graph.stream(
+        graph_input, config=thread_config, stream_mode=["custom", "values"]
+    ):
+        if mode == "custom":
+            on_event(chunk)
+        else:
+            state = chunk
+    return state
+
+
+def resume_execution(
+    thread_id: str,
+    timeout: Optional[float] = TURN_TIMEOUT,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> AgentState | None:
+    """Resume an interrupted plan execution from its last completed action."""
+    thread_config = {"configurable": {"thread_id": thread_id}}
+    snapshot = graph.get_state(thread_config)
+    if "execute" not in snapshot.next:
+        return None
+    with turns.turn(thread_id, timeout):
+        try:
+            return run_graph(None, thread_config, on_event)
+        except TurnCancelledError as e:
+            return finish_cancelled_turn(thread_config, str(e))
+
+
+def reset_thread(thread_id: str) -> bool:
+    """Delete the checkpoints of a thread, so a reused thread ID starts a new session.
+
+    A turn of the thread in flight is superseded first. Returns whether the thread
+    had checkpoints; new threads cost a single read.
+    """
+    thread_config = {"configurable": {"thread_id": thread_id}}
+    if checkpointer.get_tuple(thread_config) is None:
+        return False
+    with turns.turn(thread_id):
+        checkpointer.delete_thread(thread_id)
+    metrics.incr("sessions.reset")
+    return True
+
+
+def finish_cancelled_turn(thread_config: RunnableConfig, reason: str) -> AgentState:
+    """Leave a thread whose turn was cancelled waiting for the user's next message.
+
+    The node that was interrupted is recorded as having ended the turn. A cancelled
+    execution marks its remaining actions cancelled and keeps only the tools_output
+    of the actions that completed, since a node's writes are discarded when it fails.
+    """
+    metrics.incr("turns.cancelled")
+    log_action("cancel", "Turn cancelled", reason)
+    snapshot = graph.get_state(thread_config)
+    state = snapshot.values
+    if not snapshot.next or snapshot.next[0] == "human":
+        return state
+
+    plan = state.get("current_plan")
+    update = {"needs_confirmation": False}
+    if plan and plan["status"] == "executing":
+        plan = {
+            **plan,
+            "actions": [
+                {**action, "status": "cancelled" if action["status"] == "pending" else action["status"]}
+                for action in plan["actions"]
+            ],
+            "status": "cancelled",
+        }
+        results = list(state.get("execution_results") or [])
+        results.append(f"✗ Cancelled: {reason}")
+        update["current_plan"] = plan
+        update["messages"] = [
+            AIMessage(
+                content=format_execution_results(plan, results, state.get("tools_output"))
+            )
+        ]
+    else:
+        update["messages"] = [AIMessage(content=format_cancellation_message(reason))]
+    graph.update_state(thread_config, update, as_node=snapshot.next[0])
+    return graph.get_state(thread_config).values
+
+
+def thread_exists(thread_config: RunnableConfig) -> bool:
+    """Whether a conversation thread has a checkpoint yet."""
+    return checkpointer.get_tuple(thread_config) is not None
+
+
+def deterministic_turn(
+    values: AgentState, next_nodes: tuple, user_input: str
+) -> Optional[Tuple[str, AgentState]]:
+    """The node that answers a reply, if its answer depends only on the thread's state.
+
+    These are the turns where the human node hands the reply to the agent to decline
+    a plan or to confirm without one, or to the planner to show an unchanged plan
+    again. Returns the node and the state it runs on, or None when the turn needs the
+    graph: an LLM call, an execution, a policy decision or the end of the session.
+    """
+    text = user_input.lower()
+    if next_nodes != ("human",) or values.get("finished") or text in EXIT_COMMANDS:
+        return None
+    state = {
+        **values,
+        "messages": [*values.get("messages", []), HumanMessage(content=user_input)],
+        "finished": False,
+    }
+    node = maybe_exit_human_node(state)
+    plan = values.get("current_plan")
+    if node == "agent" and (not plan or text not in CONFIRMATIONS):
+        return "agent", state
+    if (
+        node == "planner"
+        and plan
+        and plan["status"] == "draft"
+        and text in UNCHANGED_PLAN_REPLIES
+        and not approval_policy.approves(plan)
+    ):
+        return "planner", state
+    return None
+
+
+def run_deterministic_turn(
+    thread_config: RunnableConfig, node: str, state: AgentState
+) -> AgentState:
+    """Run a deterministic node directly and checkpoint only what it changed.
+
+    One checkpoint is written as if the graph had run the node, leaving the thread
+    waiting in the human node as it would be after graph.invoke.
+    """
+    values = {**state, "messages": state["messages"][:-1]}
+    if node == "agent":
+        update = agent_node(state)
+    else:
+        update = planner_node(state, thread_config)
+    delta = {
+        key: value
+        for key, value in update.items()
+        if key != "messages" and values.get(key) != value
+    }
+    delta["messages"] = [state["messages"][-1], *update.get("messages", [])]
+    log_user_input(state["messages"][-1].content)
+    graph.update_state(thread_config, delta, as_node=node)
+    metrics.incr(f"turns.deterministic.{node}")
+    return {**values, **delta, "messages": [*values["messages"], *delta["messages"]]}
+
+
+def send_message(
+    thread_config: RunnableConfig,
+    user_input: str,
+    timeout: Optional[float] = TURN_TIMEOUT,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> AgentState:
+    """Run one conversation turn, starting the thread on its first real message.
+
+    Sessions are initiated without touching the graph, so a thread gets its first
+    checkpoint here, with the greeting replayed ahead of the user's message. The
+    turn can be cancelled through `turns` by thread_id, and is cancelled when it
+    runs past the timeout or a newer message of the thread arrives. Replies whose
+    answer depends only on the thread's state skip the graph. on_event receives the
+    start and outcome of each plan action as it is executed.
+    """
+    with turns.turn(thread_config["configurable"]["thread_id"], timeout):
+        try:
+            if DETERMINISTIC_TURNS_ENABLED:
+                snapshot = graph.get_state(thread_config)
+                if snapshot.values:
+                    turn = deterministic_turn(snapshot.values, snapshot.next, user_input)
+                    if turn is not None:
+                        return run_deterministic_turn(thread_config, *turn)
+                    return run_graph(Command(resume=user_input), thread_config, on_event)
+            elif thread_exists(thread_config):
+                return run_graph(Command(resume=user_input), thread_config, on_event)
+            log_user_input(user_input)
+            state = {
+                "messages": [AIMessage(content=GREETING), ("user", user_input)],
+                "current_plan": None,
+                "needs_confirmation": False,
+                "finished": False,
+                "tools_output": {},
+            }
+            if user_input.lower() in EXIT_COMMANDS:
+                # Ending a session that never started leaves nothing to checkpoint
+                return {**state, "finished": True}
+            return run_graph(state, thread_config, on_event)
+        except TurnCancelledError as e:
+            return finish_cancelled_turn(thread_config, str(e))
+
+
+def checkpoint_shards() -> Optional[List[str]]:
+    """Names of the checkpoint shard files, or None when checkpoints are kept in memory."""
+    if not CHECKPOINT_DB:
+        return None
+    from utils.sharding import shard_paths
+
+    return [os.path.basename(path) for path in shard_paths(CHECKPOINT_DB, CHECKPOINT_SHARDS)]
+
+
+def create_checkpointer():
+    """Create the checkpointer, using SQLite when a checkpoint database is configured.
+
+    With several checkpoint shards, threads are spread over one SQLite file per shard
+    by consistent hashing of their thread_id.
+    """
+    if CHECKPOINT_DB:
+        import sqlite3
+        from langgraph.checkpoint.sqlite import SqliteSaver
+        from utils.sharding import ShardedSaver, shard_paths
+
+        # Shards are placed on the ring by file name, so the directory can move
+        savers = {
+            os.path.basename(path): SqliteSaver(sqlite3.connect(path, check_same_thread=False))
+            for path in shard_paths(CHECKPOINT_DB, CHECKPOINT_SHARDS)
+        }
+        if len(savers) == 1:
+            return next(iter(savers.values()))
+        return ShardedSaver(savers)
+    return MemorySaver()
+
+
 def maybe_route_to_tools(state: AgentState) -> Literal["planner", "agent", "human"]:
     """Route between different nodes based on the state."""
     if not state.get("messages", []):
@@ -520,6 +1336,16 @@ def maybe_route_to_tools(state: AgentState) -> Literal["planner", "agent", "huma
     if state.get("finished", False):
         return "human"
 
+    # Execute low-risk plans in the same turn instead of asking for confirmation
+    plan = state.get("current_plan")
+    if plan and plan["status"] == "draft" and state.get("needs_confirmation"):
+        approved, reason = approval_policy.evaluate(plan)
+        if approved:
+            metrics.incr("approval.auto_approved")
+            log_action("auto_approve", "Plan auto-approved by policy", reason)
+            return "agent"
+        metrics.incr("approval.human_required")
+
     return "human"
 
 
@@ -530,14 +1356,17 @@ graph_builder = StateGraph(AgentState)
 graph_builder.add_node("planner", planner_node)
 graph_builder.add_node("agent", agent_node)
 graph_builder.add_node("human", human_node)
+graph_builder.add_node("execute", execute_node)
 # graph_builder.add_node("tools", create_tool_node())
 
 # Add edges
 graph_builder.add_conditional_edges("planner", maybe_route_to_tools)
-graph_builder.add_conditional_edges("agent", maybe_route_to_tools)
+graph_builder.add_conditional_edges("agent", maybe_continue_execution)
+graph_builder.add_conditional_edges("execute", maybe_continue_execution)
 graph_builder.add_conditional_edges("human", maybe_exit_human_node)
 graph_builder.add_edge(START, "planner")
 
 # Compile the graph
-checkpointer = MemorySaver()
+checkpointer = create_checkpointer()
 graph = graph_builder.compile(checkpointer=checkpointer)
+
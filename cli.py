@@ -1,12 +1,14 @@
+import argparse
 import json
-from chatagent import graph
-from langgraph.types import Command
+from contextlib import nullcontext
+from chatagent import GREETING, send_message
 from rich.console import Console
 from rich.panel import Panel
 from rich.table import Table
 from rich import box
 from rich.text import Text
 from datetime import datetime
+from utils.profiling import profile_turn
 
 console = Console()
 
@@ -104,7 +106,10 @@ def display_message(content: str) -> None:
             table.add_row("📈 Summary", 
                 f"Total Actions: {summary['total_actions']}\n"
                 f"Completed: {summary['completed_actions']}\n"
-                f"Failed: {summary['failed_actions']}"
+                f"Partially failed: {summary.get('partial_actions', 0)}\n"
+                f"Failed: {summary['failed_actions']}\n"
+                f"Skipped: {summary.get('skipped_actions', 0)}\n"
+                f"Duration: {summary.get('duration_seconds', 0):.2f}s"
             )
             
             console.print(Panel(
@@ -120,6 +125,13 @@ def display_message(content: str) -> None:
                 border_style="red"
             ))
         
+        elif msg_type == "cancelled":
+            console.print(Panel(
+                Text(message["message"], style="bold yellow"),
+                title=message["title"],
+                border_style="yellow"
+            ))
+        
         elif msg_type == "confirmation_request":
             console.print(Panel(
                 Text(message["message"], style="bold yellow"),
@@ -145,8 +157,46 @@ def display_message(content: str) -> None:
         # Fallback for non-JSON messages
         console.print(content)
 
-def main():
-    """Main CLI loop."""
+def display_event(event: dict) -> None:
+    """Display the progress of a plan action as it is executed."""
+    if event["type"] == "action_started":
+        console.print(f"[dim]▶ {event['description']}...[/dim]")
+        return
+    style = {"completed": "green", "partial": "yellow", "failed": "red", "skipped": "yellow"}.get(event["status"], "white")
+    retries = f", {event['attempts']} attempts" if event["attempts"] > 1 else ""
+    console.print(
+        f"[{style}]{event['status'].capitalize()}: {event['description']}[/{style}] "
+        f"[dim]({event['duration_seconds']:.2f}s{retries})[/dim]"
+    )
+
+def display_profile(report: dict) -> None:
+    """Display where the time of a profiled turn went, and where its profiles were written."""
+    table = Table(box=box.ROUNDED)
+    table.add_column("Function", style="cyan")
+    table.add_column("Wall (s)", justify="right")
+    table.add_column("CPU (s)", justify="right")
+    table.add_column("Self (s)", justify="right")
+    for spot in report["hot_spots"]:
+        table.add_row(
+            spot["function"],
+            f"{spot['wall_seconds']:.3f}",
+            f"{spot['cpu_seconds']:.3f}",
+            f"{spot['self_seconds']:.3f}",
+        )
+    peak = report["allocated_peak_bytes"]
+    console.print(Panel(
+        table,
+        title=(
+            f"Turn profile: {report['wall_seconds']:.3f}s wall, {report['cpu_seconds']:.3f}s CPU, "
+            f"{report['waiting_seconds']:.3f}s waiting"
+            + (f", {peak / 1024 / 1024:.1f} MiB peak" if peak is not None else "")
+        ),
+        border_style="magenta"
+    ))
+    console.print("\n".join(f"{kind}: {path}" for kind, path in report["files"].items()), style="dim")
+
+def main(profile: bool = False, allocations: bool = False):
+    """Main CLI loop, optionally profiling each turn."""
     console.print("[bold green]Welcome to the Agent CLI![/bold green]")
     console.print("Type 'quit' to exit.\n")
     
@@ -154,18 +204,8 @@ def main():
     thread_id = f"cli_session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
     thread_config = {"configurable": {"thread_id": thread_id}}
     
-    # Initialize the graph
-    state = graph.invoke(
-        {"messages": [],
-         "current_plan": None,
-         "needs_confirmation": False,
-         "finished": False},
-        config=thread_config
-    )
-    
-    # Display initial message
-    if state["messages"]:
-        display_message(state["messages"][-1].content)
+    # The thread's checkpoint is created with the first message
+    display_message(GREETING)
     
     while True:
         try:
@@ -176,15 +216,13 @@ def main():
                 console.print("\n[bold green]Goodbye![/bold green]")
                 break
             
-            # Process the input
-            state = graph.invoke(
-                Command(resume=user_input),
-                config=thread_config
-            )
-            
-            # Display the response
-            if state["messages"]:
-                display_message(state["messages"][-1].content)
+            # Process the input and display the response, profiled as one turn
+            with profile_turn(thread_id, allocations=allocations) if profile else nullcontext() as report:
+                state = send_message(thread_config, user_input, on_event=display_event)
+                if state["messages"]:
+                    display_message(state["messages"][-1].content)
+            if profile:
+                display_profile(report)
             
             # Check if we're done
             if state.get("finished", False):
@@ -197,4 +235,16 @@ def main():
             console.print(f"\n[bold red]Error:[/bold red] {str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Chat with the agent in the terminal")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile each turn, writing speedscope and collapsed-stack files to PROFILE_DIR",
+    )
+    parser.add_argument(
+        "--profile-allocations",
+        action="store_true",
+        help="also trace allocations with tracemalloc, which slows allocation-heavy code",
+    )
+    args = parser.parse_args()
+    main(profile=args.profile or args.profile_allocations, allocations=args.profile_allocations) 
\ No newline at end of file
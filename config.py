@@ -6,18 +6,174 @@ load_dotenv()
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_MODEL = "gpt-3.5-turbo"
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+# Cheaper model for analysis and small edits
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", OPENAI_MODEL)
+
+# LLM Provider Configuration
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai", "local" or "fake"
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")  # OpenAI-compatible server for "local"
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "true").lower() == "true"
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_FAKE_LATENCY = float(os.getenv("LLM_FAKE_LATENCY", "0"))
+# Ask OpenAI-compatible providers for JSON mode when a JSON object is expected
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+
+# Model and request timeout (seconds) per purpose
+LLM_ROUTES = {
+    "analysis": {"model": OPENAI_FAST_MODEL, "timeout": 30},
+    "modification": {"model": OPENAI_FAST_MODEL, "timeout": 30},
+    "planning": {"model": OPENAI_MODEL, "timeout": 60},
+    "products": {"model": OPENAI_MODEL, "timeout": 120},
+}
 
 # Google Sheets Configuration
 GOOGLE_SERVICE_ACCOUNT_PATH = os.getenv("GOOGLE_SERVICE_ACCOUNT_PATH")
+# Default for create_sheet actions: "create" a new spreadsheet, or "upsert" into an existing one
+SHEET_WRITE_MODE = os.getenv("SHEET_WRITE_MODE", "create")
 
 GMAIL_EMAIL = os.getenv("GMAIL_EMAIL")
 GMAIL_APP_PASSWORD = os.getenv("GMAIL_APP_PASSWORD")
+# Threads used to build per-recipient MIME messages for bulk emails
+EMAIL_RENDER_WORKERS = int(os.getenv("EMAIL_RENDER_WORKERS", "8"))
+# Gzip CSV attachments before sending them
+EMAIL_COMPRESS_CSV = os.getenv("EMAIL_COMPRESS_CSV", "false").lower() == "true"
 
 # Logging Configuration
 LOG_FILE = "agent_actions.log"
 LOG_FORMAT = "%(asctime)s - %(message)s"
 LOG_LEVEL = "INFO"
 
+# Plans made only of these action types execute without confirmation; send_email
+# is only auto-approved for recipients in the trusted domains
+AUTO_APPROVE_ACTIONS = [
+    action.strip()
+    for action in os.getenv("AUTO_APPROVE_ACTIONS", "generate_products,export_sheet").split(",")
+    if action.strip()
+]
+TRUSTED_EMAIL_DOMAINS = [
+    domain.strip()
+    for domain in os.getenv("TRUSTED_EMAIL_DOMAINS", "").split(",")
+    if domain.strip()
+]
+
+# Checkpoint Configuration (in-memory when unset)
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB")
+# Threads are spread over this many SQLite files derived from CHECKPOINT_DB
+CHECKPOINT_SHARDS = int(os.getenv("CHECKPOINT_SHARDS", "1"))
+
+# Sticky routing: app instances behind router.py, and virtual nodes per shard or
+# instance on the consistent hash ring
+ROUTER_INSTANCES = [
+    url.strip().rstrip("/")
+    for url in os.getenv("ROUTER_INSTANCES", "").split(",")
+    if url.strip()
+]
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "64"))
+
+# Idempotency records of side-effecting actions, kept for IDEMPOTENCY_TTL seconds
+IDEMPOTENCY_DB = os.getenv("IDEMPOTENCY_DB", "data/idempotency.db")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", str(24 * 60 * 60)))
+# Claims of actions still running after this many seconds are considered abandoned
+IDEMPOTENCY_CLAIM_TIMEOUT = float(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT", "300"))
+
+# Audit log of executed actions: SQLite segments in AUDIT_LOG_DIR, each closed after
+# AUDIT_SEGMENT_ROWS rows or AUDIT_SEGMENT_SECONDS seconds, kept AUDIT_RETENTION_DAYS
+# days (0 = forever); records waiting for the background writer beyond
+# AUDIT_QUEUE_SIZE are dropped rather than slowing down turns
+AUDIT_LOG_ENABLED = os.getenv("AUDIT_LOG_ENABLED", "true").lower() == "true"
+AUDIT_LOG_DIR = os.getenv("AUDIT_LOG_DIR", "data/audit")
+AUDIT_SEGMENT_ROWS = int(os.getenv("AUDIT_SEGMENT_ROWS", "1000000"))
+AUDIT_SEGMENT_SECONDS = float(os.getenv("AUDIT_SEGMENT_SECONDS", str(24 * 60 * 60)))
+AUDIT_RETENTION_DAYS = float(os.getenv("AUDIT_RETENTION_DAYS", "365"))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+
+# Deadline (seconds) of one conversation turn, after which its remaining LLM calls,
+# API calls and actions are cancelled; 0 = none
+TURN_TIMEOUT = float(os.getenv("TURN_TIMEOUT", "300"))
+# Turns in flight, shared by the server's processes so any of them can cancel a turn;
+# empty to keep them per process
+TURNS_DB = os.getenv("TURNS_DB", "data/turns.db")
+
+# Attempts at a plan action without side effects whose failure is transient, and the
+# delay before the first retry in seconds (doubled for each further retry)
+ACTION_MAX_ATTEMPTS = int(os.getenv("ACTION_MAX_ATTEMPTS", "3"))
+ACTION_RETRY_DELAY = float(os.getenv("ACTION_RETRY_DELAY", "1.0"))
+
+# Turns whose reply depends only on the thread's state (declining a plan, confirming
+# without a plan, re-displaying an unchanged plan) skip the graph, with their
+# rendered replies memoized by node and state hash
+DETERMINISTIC_TURNS_ENABLED = os.getenv("DETERMINISTIC_TURNS_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+
+# Profiling of single turns (cli.py --profile, or the X-Profile header when enabled):
+# stack sampling interval in seconds, frames kept per traced allocation, and hot spots
+# to report
+PROFILE_REQUESTS_ENABLED = os.getenv("PROFILE_REQUESTS_ENABLED", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "10"))
+
+# Background Job Configuration
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Job records, shared by the server's processes; empty to keep them in each process's
+# memory, where a poll reaching another worker finds no job. Finished jobs are evicted
+# after JOB_TTL seconds
+JOB_STORE_DB = os.getenv("JOB_STORE_DB", "data/jobs.db")
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+
+# Multi-tenancy: per-tenant credentials and limits (JSON object keyed by tenant ID);
+# requests without a tenant run as the default tenant, which is unlimited unless configured
+TENANTS_PATH = os.getenv("TENANTS_PATH")
+DEFAULT_TENANT = "default"
+TENANT_MAX_CONCURRENCY = int(os.getenv("TENANT_MAX_CONCURRENCY", "4"))  # LLM/tool calls in flight
+TENANT_TOKEN_BUDGET = int(os.getenv("TENANT_TOKEN_BUDGET", "0"))  # tokens per window, 0 = unlimited
+TENANT_BUDGET_WINDOW = float(os.getenv("TENANT_BUDGET_WINDOW", "3600"))
+TENANT_SLOT_TIMEOUT = float(os.getenv("TENANT_SLOT_TIMEOUT", "60"))
+TENANT_CACHE_SIZE = int(os.getenv("TENANT_CACHE_SIZE", "32"))  # cached per-tenant backend instances
+
+# Maximum concurrent calls per tool type across all workers
+TOOL_CONCURRENCY = {
+    "generate_products": 4,
+    "create_sheet": 2,
+    "export_sheet": 2,
+    "send_email": 2,
+    # Each bulk email holds an SMTP session for all of its recipients
+    "send_bulk_email": 1,
+}
+DEFAULT_TOOL_CONCURRENCY = 4
+
+# Speculative task analysis of draft input sent to /chat-draft while the user types
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "true").lower() == "true"
+SPECULATION_DEBOUNCE = float(os.getenv("SPECULATION_DEBOUNCE", "0.3"))  # seconds without a newer draft
+SPECULATION_MIN_CHARS = int(os.getenv("SPECULATION_MIN_CHARS", "12"))
+SPECULATION_SIMILARITY = float(os.getenv("SPECULATION_SIMILARITY", "0.95"))  # near matches
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "120"))
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", "4"))
+SPECULATION_MAX_SESSIONS = int(os.getenv("SPECULATION_MAX_SESSIONS", "1000"))
+
+# Semantic response cache for LLM purposes whose answers can be reused
+# (products are served from the product pool, which needs fresh batches)
+SEMANTIC_CACHE_PURPOSES = ["analysis"]
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "1000"))
+SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR")  # memmapped on disk when set
+
+# Pre-generated product pool
+PRODUCT_CATEGORIES = ["electronics", "clothing", "books", "home", "sports"]
+PRODUCT_POOL_LOW_WATER = int(os.getenv("PRODUCT_POOL_LOW_WATER", "10"))
+PRODUCT_POOL_HIGH_WATER = int(os.getenv("PRODUCT_POOL_HIGH_WATER", "40"))
+PRODUCT_POOL_BATCH = int(os.getenv("PRODUCT_POOL_BATCH", "20"))
+PRODUCT_POOL_PATH = os.getenv("PRODUCT_POOL_PATH", "data/product_pool.json")
+
+# Outbound rate limits per backend (calls per second, burst, max concurrency)
+RATE_LIMITS = {
+    "openai": {"rate": 5.0, "burst": 10, "max_concurrency": 8},
+    "google": {"rate": 1.0, "burst": 5, "max_concurrency": 4},
+    "smtp": {"rate": 0.5, "burst": 5, "max_concurrency": 2},
+}
+
 # Export Configuration
 EXPORT_DIR = "exports"
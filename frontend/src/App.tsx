@@ -113,7 +113,7 @@ function formatMessage(message: string, clarificationQuestions?: string[], conce
           )}
           {data.summary && (
             <div className="text-xs text-green-800 mt-2">
-              <b>Summary:</b> {data.summary.completed_actions} of {data.summary.total_actions} actions completed, {data.summary.failed_actions} failed.
+              <b>Summary:</b> {data.summary.completed_actions} of {data.summary.total_actions} actions completed, {data.summary.partial_actions ? `${data.summary.partial_actions} partially failed, ` : ''}{data.summary.failed_actions} failed{data.summary.skipped_actions ? `, ${data.summary.skipped_actions} skipped` : ''}.
             </div>
           )}
         </div>
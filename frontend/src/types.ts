@@ -24,6 +24,8 @@ export interface Action {
   parameters: Record<string, any>;
   status: string;
   subtask_id: string;
+  attempts?: number;
+  duration_seconds?: number;
 }
 
 export interface Plan {
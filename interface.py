@@ -1,4 +1,4 @@
-from typing import TypedDict, List, Dict, Any, Annotated
+from typing import TypedDict, List, Dict, Any, Annotated, NotRequired
 from langgraph.graph.message import add_messages
 
 class SubTask(TypedDict):
@@ -21,15 +21,19 @@ class Action(TypedDict):
     action_type: str
     description: str
     parameters: Dict[str, str]
-    status: str  # "pending", "completed", "failed"
+    status: str  # "pending", "completed", "partial", "failed", "skipped", "cancelled"
     subtask_id: str  # Reference to the subtask this action fulfills
+    attempts: NotRequired[int]  # Set once executed; 0 when skipped
+    duration_seconds: NotRequired[float]
 
 class Plan(TypedDict):
     """Represents a complete action plan."""
     goal: str
     analysis: TaskAnalysis
     actions: List[Action]
-    status: str  # "draft", "confirmed", "executing", "completed", "cancelled"
+    status: str  # "draft", "confirmed", "executing", "completed", "failed", "cancelled"
+    repaired: NotRequired[bool]  # Parsed from a truncated or malformed LLM reply
+    confirmation_id: NotRequired[str]  # New for each draft; executions confirming it share idempotency keys
 
 class AgentState(TypedDict):
     """State representing the agent's conversation and actions."""
@@ -37,4 +41,6 @@ class AgentState(TypedDict):
     current_plan: Plan | None
     needs_confirmation: bool
     finished: bool
-    tools_output: Dict[str, Any]  # Store tool outputs 
+    tools_output: Dict[str, Any]  # Store tool outputs
+    execution_results: List[str]  # Outcomes of the actions executed so far
+    next_action: int  # Index of the next action to execute
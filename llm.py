@@ -1,16 +1,332 @@
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+import httpx
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
-from config import OPENAI_API_KEY, OPENAI_MODEL
+from config import (
+    OPENAI_API_KEY,
+    OPENAI_MODEL,
+    LLM_PROVIDER,
+    LLM_BASE_URL,
+    LLM_HTTP2,
+    LLM_MAX_CONNECTIONS,
+    LLM_FAKE_LATENCY,
+    LLM_JSON_MODE,
+    LLM_ROUTES,
+    SEMANTIC_CACHE_PURPOSES,
+    SEMANTIC_CACHE_THRESHOLD,
+    SEMANTIC_CACHE_SIZE,
+    SEMANTIC_CACHE_DIR,
+    DEFAULT_TENANT,
+)
+from prompts.json_retry import JSON_RETRY_REQUEST
+from utils.cancellation import check_cancelled, remaining_time
+from utils.json_extract import JSONExtractionError, extract_json, extract_json_repaired
+from utils.metrics import metrics, record_llm_usage
+from utils.rate_limit import BackendLimiter, get_limiter
+from utils.semantic_cache import SemanticCache
+from utils.tenants import current_tenant, tenant_manager
 
-# Initialize the main LLM for the chat agent
-chat_llm = ChatOpenAI(model=OPENAI_MODEL, api_key=OPENAI_API_KEY)
 
-# Initialize the LLM for product data generation
-product_llm = ChatOpenAI(model=OPENAI_MODEL, api_key=OPENAI_API_KEY)
+class LLMClient:
+    """Chat model for one purpose, with a default timeout, optional rate limiting and caching."""
 
-def get_chat_llm() -> ChatOpenAI:
+    def __init__(
+        self,
+        purpose: str,
+        llm: Any,
+        timeout: Optional[float] = None,
+        limiter: Optional[BackendLimiter] = None,
+        cache: Optional[SemanticCache] = None,
+    ):
+        self.purpose = purpose
+        self.llm = llm
+        self.timeout = timeout
+        self.limiter = limiter
+        self.cache = cache
+
+    def invoke(
+        self,
+        input: Any,
+        timeout: Optional[float] = None,
+        use_cache: bool = True,
+        **kwargs: Any,
+    ) -> Any:
+        """Invoke the model, overriding the purpose's timeout for this call if given.
+
+        Calls are not started for a cancelled turn, and time out at the turn's deadline.
+        """
+        # The system prompt is static per purpose, so the request alone keys the cache
+        cache_key = input if isinstance(input, str) else input[-1].content
+        if use_cache and self.cache is not None:
+            cached = self.cache.lookup(cache_key)
+            if cached is not None:
+                return AIMessage(content=cached)
+
+        check_cancelled()
+        if isinstance(self.llm, ChatOpenAI):
+            kwargs["timeout"] = remaining_time(timeout or self.timeout)
+        tenant_id = current_tenant.get()
+        start = time.perf_counter()
+        with tenant_manager.slot(tenant_id, "llm_calls"):
+            try:
+                if self.limiter is None:
+                    response = self.llm.invoke(input, **kwargs)
+                else:
+                    response = self.limiter.call(self.llm.invoke, input, **kwargs)
+            except Exception:
+                # A call cut short by the turn's deadline fails as a cancellation
+                check_cancelled()
+                raise
+        elapsed = time.perf_counter() - start
+        record_llm_usage(self.purpose, response, elapsed)
+        tenant_manager.record_tokens(tenant_id, response)
+
+        if use_cache and self.cache is not None:
+            self.cache.add(cache_key, response.content, elapsed)
+        return response
+
+    def invoke_json(
+        self,
+        messages: List[BaseMessage],
+        expect: Optional[type] = None,
+        timeout: Optional[float] = None,
+        use_cache: bool = True,
+        with_repaired: bool = False,
+    ) -> Any:
+        """Invoke the model and extract JSON from the reply, retrying once if it cannot be parsed.
+
+        Objects are requested through the provider's JSON mode when available. Only
+        replies that parse without repairs are cached. With with_repaired, returns the
+        value and whether it was repaired from a truncated or malformed reply.
+        """
+        cache_key = messages[-1].content
+        if use_cache and self.cache is not None:
+            cached = self.cache.lookup(cache_key)
+            if cached is not None:
+                try:
+                    value = extract_json(cached, expect)
+                    return (value, False) if with_repaired else value
+                except JSONExtractionError:
+                    pass
+
+        kwargs = {}
+        if expect is dict and LLM_JSON_MODE and isinstance(self.llm, ChatOpenAI):
+            kwargs["response_format"] = {"type": "json_object"}
+        start = time.perf_counter()
+        response = self.invoke(messages, timeout, use_cache=False, **kwargs)
+        metrics.incr(f"llm.{self.purpose}.json_parses")
+        try:
+            value, repaired = extract_json_repaired(response.content, expect)
+        except JSONExtractionError:
+            metrics.incr(f"llm.{self.purpose}.json_parse_failures")
+            retry_messages = [
+                *messages,
+                AIMessage(content=response.content),
+                HumanMessage(content=JSON_RETRY_REQUEST),
+            ]
+            response = self.invoke(retry_messages, timeout, use_cache=False, **kwargs)
+            value, repaired = extract_json_repaired(response.content, expect)
+            metrics.incr(f"llm.{self.purpose}.json_retry_successes")
+
+        if use_cache and self.cache is not None and not repaired:
+            self.cache.add(cache_key, response.content, time.perf_counter() - start)
+        return (value, repaired) if with_repaired else value
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.llm, name)
+
+
+class FakeChatModel:
+    """Offline stand-in returning canned responses per purpose, for local runs and benchmarks."""
+
+    def __init__(self, purpose: str, latency: float = 0.0):
+        self.purpose = purpose
+        self.latency = latency
+        # Products made so far, so that every batch has new products
+        self.products_made = 0
+
+    def _content(self, prompt: str) -> Any:
+        """Return the canned response for the purpose."""
+        if self.purpose == "analysis":
+            return {
+                "main_goal": "Generate sample products and share them in a Google Sheet",
+                "complexity": "simple",
+                "subtasks": [],
+                "potential_risks": [],
+                "required_resources": ["Google Sheets"],
+                "estimated_total_time": "1 minute",
+            }
+        if self.purpose == "planning":
+            return [
+                {
+                    "action_type": "generate_products",
+                    "description": "Generate sample products",
+                    "parameters": {"num_products": "3"},
+                    "status": "pending",
+                    "subtask_id": "task_1",
+                },
+                {
+                    "action_type": "create_sheet",
+                    "description": "Create a Google Sheet with the products",
+                    "parameters": {"title": "Product List"},
+                    "status": "pending",
+                    "subtask_id": "task_1",
+                },
+            ]
+        if self.purpose == "modification":
+            # Changes naming a number set the number of products
+            match = re.search(r"Requested change:.*?(\d+)", prompt)
+            if match is None:
+                return {"operations": []}
+            return {
+                "goal": f"Generate {match.group(1)} sample products and share them in a Google Sheet",
+                "operations": [
+                    {"op": "update", "index": 0, "parameters": {"num_products": match.group(1)}}
+                ],
+            }
+        if self.purpose == "products":
+            match = re.search(r"\d+", prompt)
+            count = int(match.group()) if match else 3
+            start, self.products_made = self.products_made, self.products_made + count
+            return [
+                {
+                    "product_id": f"FAKE-{i:05d}",
+                    "name": f"Sample Product {i}",
+                    "description": "Offline sample product",
+                    "price": 9.99 + i,
+                    "category": ["electronics", "clothing", "books"][i % 3],
+                    "stock_quantity": 10 * i,
+                    "rating": 4.0,
+                    "created_at": "2024-01-01T00:00:00",
+                }
+                for i in range(start + 1, start + count + 1)
+            ]
+        return {}
+
+    def invoke(self, input: Any, **kwargs: Any) -> AIMessage:
+        """Return the canned response as an AIMessage with estimated token usage."""
+        messages = [input] if isinstance(input, str) else input
+        contents = [m if isinstance(m, str) else m.content for m in messages]
+        if self.latency:
+            time.sleep(self.latency)
+        content = json.dumps(self._content(contents[-1]))
+        input_tokens = sum(len(c) for c in contents) // 4
+        output_tokens = len(content) // 4
+        return AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+        )
+
+
+def prompt_messages(system_prompt: str, request: str) -> list:
+    """Build a chat input from a static, cacheable system prompt and a small variable request."""
+    return [SystemMessage(content=system_prompt), HumanMessage(content=request)]
+
+
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+_llms: Dict[str, LLMClient] = {}
+# Guards the shared HTTP clients and the LLM clients; reentrant, since creating an LLM
+# client gets the HTTP clients
+_lock = threading.RLock()
+
+
+def get_http_clients() -> tuple:
+    """Get the HTTP clients whose connection pools are shared by all LLM clients."""
+    global _http_client, _http_async_client
+    with _lock:
+        if _http_client is None:
+            limits = httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            )
+            _http_client = httpx.Client(http2=LLM_HTTP2, limits=limits)
+            _http_async_client = httpx.AsyncClient(http2=LLM_HTTP2, limits=limits)
+        return _http_client, _http_async_client
+
+
+def create_cache(purpose: str) -> Optional[SemanticCache]:
+    """Create the semantic response cache of a purpose, if it is cacheable."""
+    if purpose not in SEMANTIC_CACHE_PURPOSES:
+        return None
+    return SemanticCache(
+        purpose,
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        max_entries=SEMANTIC_CACHE_SIZE,
+        path=f"{SEMANTIC_CACHE_DIR}/{purpose}" if SEMANTIC_CACHE_DIR else None,
+    )
+
+
+def create_llm(
+    purpose: str, api_key: Optional[str] = None, cached: bool = True
+) -> LLMClient:
+    """Create the LLM client for a purpose according to the configured provider and route."""
+    route = LLM_ROUTES.get(purpose, {"model": OPENAI_MODEL, "timeout": 60})
+    cache = create_cache(purpose) if cached else None
+    if LLM_PROVIDER == "fake":
+        return LLMClient(
+            purpose,
+            FakeChatModel(purpose, LLM_FAKE_LATENCY),
+            cache=cache,
+        )
+
+    http_client, http_async_client = get_http_clients()
+    api_key = api_key or OPENAI_API_KEY
+    # Retries are handled by the shared limiter, which honors Retry-After
+    llm = ChatOpenAI(
+        model=route["model"],
+        api_key=api_key if LLM_PROVIDER == "openai" else api_key or "local",
+        base_url=LLM_BASE_URL if LLM_PROVIDER == "local" else None,
+        max_retries=0,
+        http_client=http_client,
+        http_async_client=http_async_client,
+    )
+    return LLMClient(purpose, llm, route["timeout"], get_limiter("openai"), cache)
+
+
+def get_llm(purpose: str) -> LLMClient:
+    """Get the LLM client for a purpose ("analysis", "planning", "modification", "products").
+
+    Named tenants get their own clients, with their own API key if configured and no
+    semantic cache, so cached responses are never shared between tenants.
+    """
+    tenant_id = current_tenant.get()
+    if tenant_id != DEFAULT_TENANT:
+        api_key = tenant_manager.settings(tenant_id).get("openai_api_key")
+        # Held around the lookup, so concurrent first calls create a single client
+        with _lock:
+            return tenant_manager.backend(
+                tenant_id, f"llm:{purpose}", lambda: create_llm(purpose, api_key, cached=False)
+            )
+    with _lock:
+        if purpose not in _llms:
+            _llms[purpose] = create_llm(purpose)
+        return _llms[purpose]
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Return the semantic cache statistics of every cached purpose."""
+    with _lock:
+        return {
+            purpose: client.cache.stats()
+            for purpose, client in _llms.items()
+            if client.cache is not None
+        }
+
+
+def get_chat_llm() -> LLMClient:
     """Get the main chat LLM instance."""
-    return chat_llm
+    return get_llm("planning")
 
-def get_product_llm() -> ChatOpenAI:
+def get_product_llm() -> LLMClient:
     """Get the product generation LLM instance."""
-    return product_llm 
+    return get_llm("products")
+
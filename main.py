@@ -1,11 +1,45 @@
-from fastapi import FastAPI
-from chatagent import graph
+import asyncio
+import json
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from chatagent import GREETING, checkpoint_shards, reset_thread, resume_execution, send_message, speculator
+from llm import get_cache_stats
+from utils.tools import product_pool
+from utils.jobs import JobQueue, QueueFullError
+from utils.metrics import metrics
+from utils.rate_limit import limiters
+from utils.cancellation import turns
+from utils.audit_log import audit_log, parse_time
+from utils.profiling import profile_turn
+from utils.tenants import (
+    TenantQuotaError,
+    UnknownTenantError,
+    tenant_context,
+    tenant_manager,
+    tenant_thread_id,
+)
+from config import DEFAULT_TENANT, PROFILE_REQUESTS_ENABLED, SPECULATION_ENABLED, TURN_TIMEOUT
+from langchain_core.messages import AIMessage
 from langgraph.types import Command
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, Dict, Any, List, Literal
+from typing import Callable, Optional, Dict, Any, List, Literal
+
+jobs = JobQueue()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await jobs.start()
+    product_pool.load()
+    product_pool.refill_async()
+    yield
+    await jobs.stop()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -20,6 +54,8 @@ class Action(BaseModel):
     parameters: Dict[str, Any]
     status: str
     subtask_id: str
+    attempts: Optional[int] = None
+    duration_seconds: Optional[float] = None
 
 class SubTask(BaseModel):
     description: str
@@ -85,29 +121,325 @@ def format_state_for_response(state: Dict[str, Any]) -> ChatResponse:
         finished=state.get("finished", False)
     )
 
+# Sessions are initiated without running the graph, so the response is built once
+GREETING_RESPONSE = format_state_for_response({"messages": [AIMessage(content=GREETING)]})
+GREETING_PAYLOAD = GREETING_RESPONSE.model_dump_json()
+MAX_BULK_SESSIONS = 10_000
+# How often a waiting request checks whether its client went away
+DISCONNECT_POLL_INTERVAL = 0.5
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the Confirmation Agent API!"}
 
+def check_known_tenant(tenant_id: str) -> None:
+    """Reject a request with 404 when its tenant is not configured."""
+    try:
+        tenant_manager.check_known(tenant_id)
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def check_tenant(tenant_id: str) -> None:
+    """Reject a request for an unknown tenant, or with 429 when its tenant has used up its token budget."""
+    check_known_tenant(tenant_id)
+    try:
+        tenant_manager.check_budget(tenant_id)
+    except TenantQuotaError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "60"})
+
 @app.get("/chat_initiate")
-def start_chat(thread_id: str):
-    """Start a new chat session."""
-    thread_config = {"configurable": {"thread_id": thread_id}}    
-    state = graph.invoke(
-        {"messages": [],
-         "current_plan": None,
-         "needs_confirmation": False,
-         "finished": False}, 
-        config=thread_config)
+def start_chat(thread_id: str, tenant_id: str = DEFAULT_TENANT):
+    """Start a new chat session; its checkpoint is created with the first message.
+
+    A thread ID that was already used starts over: its checkpoints are deleted.
+    """
+    check_tenant(tenant_id)
+    reset_thread(tenant_thread_id(tenant_id, thread_id))
+    return Response(content=GREETING_PAYLOAD, media_type="application/json")
+
+@app.get("/chat_initiate_bulk")
+def start_chats(count: int = Query(1, ge=1, le=MAX_BULK_SESSIONS)):
+    """Start many chat sessions at once, e.g. for load tests, returning their thread IDs."""
+    return {
+        "thread_ids": [uuid.uuid4().hex for _ in range(count)],
+        "response": GREETING_RESPONSE,
+    }
+
+def run_turn(
+    thread_id: str,
+    response: str,
+    tenant_id: str = DEFAULT_TENANT,
+    timeout: Optional[float] = None,
+    on_event: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> ChatResponse:
+    """Run one conversation turn to completion, or until cancelled, on behalf of a tenant."""
+    thread_config = {"configurable": {"thread_id": tenant_thread_id(tenant_id, thread_id)}}
+    start = time.perf_counter()
+    with tenant_context(tenant_id):
+        try:
+            state = send_message(thread_config, response, timeout or TURN_TIMEOUT, on_event)
+        finally:
+            tenant_manager.record(tenant_id, turns=1, wall_time=time.perf_counter() - start)
+
+    return format_state_for_response(state)
 
+def run_resume(thread_id: str, tenant_id: str = DEFAULT_TENANT) -> ChatResponse:
+    """Resume an interrupted plan execution on behalf of a tenant."""
+    start = time.perf_counter()
+    with tenant_context(tenant_id):
+        try:
+            state = resume_execution(tenant_thread_id(tenant_id, thread_id))
+        finally:
+            tenant_manager.record(tenant_id, wall_time=time.perf_counter() - start)
+    if state is None:
+        raise ValueError(f"No interrupted execution for thread {thread_id}")
     return format_state_for_response(state)
 
+def submit_job(fn, *args) -> Dict[str, str]:
+    """Queue a background job, rejecting it with 503 when the queue is full."""
+    try:
+        return {"job_id": jobs.submit(fn, *args)}
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+def run_profiled(name: str, allocations: bool, report: Dict[str, Any], fn, *args):
+    """Run fn under the profiler on the current thread, filling report with the profile summary."""
+    try:
+        with profile_turn(name, allocations=allocations) as profile:
+            return fn(*args)
+    finally:
+        report.update(profile)
+
+def server_timing(report: Dict[str, Any]) -> str:
+    """Format a profile summary as a Server-Timing header, shown by browser dev tools."""
+    return ", ".join(
+        f"{name};dur={report[key] * 1000:.1f}"
+        for name, key in [("wall", "wall_seconds"), ("cpu", "cpu_seconds"), ("wait", "waiting_seconds")]
+    )
+
+async def run_until_disconnected(request: Request, thread_id: str, fn, *args):
+    """Run a turn in the threadpool, cancelling it if the client disconnects before it finishes."""
+    task = asyncio.ensure_future(run_in_threadpool(fn, *args))
+    cancelled = False
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+        if done:
+            return task.result()
+        if not cancelled and await request.is_disconnected():
+            # The turn unwinds at its next check and leaves the thread consistent
+            cancelled = turns.cancel(thread_id, "client disconnected")
+
 @app.get("/chat-continue")
-def continue_chat(thread_id: str, response: str):
-    """Continue an existing chat session."""
-    thread_config = {"configurable": {"thread_id": thread_id}}
-    state = graph.invoke(
-        Command(resume=response), 
-        config=thread_config)
+async def continue_chat(
+    request: Request,
+    thread_id: str,
+    response: str,
+    background: bool = False,
+    tenant_id: str = DEFAULT_TENANT,
+    timeout: Optional[float] = Query(None, gt=0),
+    x_profile: Optional[str] = Header(None),
+    http_response: Response = None,
+):
+    """Continue an existing chat session, optionally as a background job.
+
+    The turn is cancelled after `timeout` seconds (TURN_TIMEOUT by default), when
+    the client disconnects, or through /chat-cancel. With PROFILE_REQUESTS_ENABLED,
+    an `X-Profile: 1` header profiles the turn (`X-Profile: allocations` also traces
+    allocations): its wall, CPU and waiting time come back in Server-Timing, and the
+    profile files are written to PROFILE_DIR.
+    """
+    check_tenant(tenant_id)
+    if background:
+        return submit_job(run_turn, thread_id, response, tenant_id, timeout)
+    turn = (run_turn, thread_id, response, tenant_id, timeout)
+    report: Dict[str, Any] = {}
+    if PROFILE_REQUESTS_ENABLED and x_profile:
+        allocations = x_profile.lower() == "allocations"
+        turn = (run_profiled, f"{tenant_id}-{thread_id}", allocations, report, *turn)
+    try:
+        result = await run_until_disconnected(
+            request, tenant_thread_id(tenant_id, thread_id), *turn
+        )
+    except TenantQuotaError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "60"})
+    if report:
+        http_response.headers["Server-Timing"] = server_timing(report)
+        http_response.headers["X-Profile-Path"] = report["files"]["speedscope"]
+    return result
+
+def server_sent_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.get("/chat-stream")
+async def stream_chat(
+    request: Request,
+    thread_id: str,
+    response: str,
+    tenant_id: str = DEFAULT_TENANT,
+    timeout: Optional[float] = Query(None, gt=0),
+):
+    """Continue a chat session, streaming its progress as Server-Sent Events.
+
+    Each plan action executed by the turn produces an `action` event when it starts
+    and when it finishes, with its status, outcome, attempts and duration. The turn
+    ends with a `response` event carrying the same body as /chat-continue, or an
+    `error` event. Cancellation works as for /chat-continue.
+    """
+    check_tenant(tenant_id)
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event: Dict[str, Any]) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, event)
+
+    async def stream():
+        turn = asyncio.ensure_future(
+            run_until_disconnected(
+                request,
+                tenant_thread_id(tenant_id, thread_id),
+                run_turn,
+                thread_id,
+                response,
+                tenant_id,
+                timeout,
+                on_event,
+            )
+        )
+        while not turn.done() or not events.empty():
+            next_event = asyncio.ensure_future(events.get())
+            await asyncio.wait({turn, next_event}, return_when=asyncio.FIRST_COMPLETED)
+            if next_event.done():
+                yield server_sent_event("action", next_event.result())
+            else:
+                next_event.cancel()
+        try:
+            result = turn.result()
+        except TenantQuotaError as e:
+            yield server_sent_event("error", {"status_code": 429, "detail": str(e)})
+            return
+        except Exception as e:
+            # The response has started, so the error is reported in the stream
+            yield server_sent_event("error", {"status_code": 500, "detail": str(e)})
+            return
+        yield server_sent_event("response", result.model_dump())
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.post("/chat-cancel")
+def cancel_chat(thread_id: str, tenant_id: str = DEFAULT_TENANT):
+    """Cancel the turn in flight of a chat session, e.g. when the user abandons it.
+
+    The turn stops before its next LLM call, API call or action, and returns
+    with the thread waiting for the next message.
+    """
+    check_known_tenant(tenant_id)
+    return {"cancelled": turns.cancel(tenant_thread_id(tenant_id, thread_id))}
+
+@app.get("/chat-draft")
+def draft_chat(thread_id: str, draft: str, tenant_id: str = DEFAULT_TENANT):
+    """Accept the draft of the next message, debounced by the client, to analyze it speculatively."""
+    if not SPECULATION_ENABLED:
+        return {"scheduled": False}
+    check_tenant(tenant_id)
+    with tenant_context(tenant_id):
+        scheduled = speculator.submit(tenant_thread_id(tenant_id, thread_id), draft)
+    return {"scheduled": scheduled}
+
+@app.get("/chat-resume")
+async def resume_chat(thread_id: str, background: bool = False, tenant_id: str = DEFAULT_TENANT):
+    """Resume a plan execution that was interrupted, e.g. by a crashed worker."""
+    check_tenant(tenant_id)
+    if background:
+        return submit_job(run_resume, thread_id, tenant_id)
+    try:
+        return await run_in_threadpool(run_resume, thread_id, tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TenantQuotaError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "60"})
+
+@app.get("/jobs")
+def get_jobs_stats():
+    """Return the job queue depth and capacity."""
+    return jobs.stats()
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Return the status and, once finished, the result of a background job."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/tenants/{tenant_id}/usage")
+def get_tenant_usage(tenant_id: str):
+    """Return a tenant's tokens, LLM and tool calls, emails, wall time and remaining budget."""
+    check_known_tenant(tenant_id)
+    return tenant_manager.usage(tenant_id)
+
+@app.get("/audit/actions")
+def get_audited_actions(
+    thread_id: Optional[str] = None,
+    tenant_id: str = DEFAULT_TENANT,
+    action_type: Optional[str] = None,
+    recipient: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Return the tenant's executed actions matching the filters, newest first.
+
+    since and until are timestamps, ISO dates or times ago such as 7d; e.g. the
+    emails sent to an address last week are ?recipient=...&since=7d.
+    """
+    check_known_tenant(tenant_id)
+    if thread_id is not None:
+        thread_id = tenant_thread_id(tenant_id, thread_id)
+    try:
+        start = parse_time(since) if since else None
+        end = parse_time(until) if until else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return audit_log.query(thread_id, tenant_id, action_type, recipient, status, start, end, limit)
+
+@app.post("/audit/compact")
+def compact_audit_log():
+    """Merge small audit log segments and delete records past retention."""
+    return audit_log.compact()
+
+
+@app.get("/checkpoints")
+def get_checkpoints():
+    """Return the checkpoint shard files of this instance, or null when checkpoints are in memory.
+
+    router.py only sends threads to instances sharing the same shards.
+    """
+    return {"shards": checkpoint_shards()}
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Return in-process counters and timings, e.g. LLM tokens and latency per purpose."""
+    snapshot = metrics.snapshot()
+    counters = snapshot["counters"]
+    # Share of LLM replies per purpose whose JSON could not be parsed on the first attempt
+    parse_failure_rate = {
+        name[len("llm."):-len(".json_parses")]: round(
+            counters.get(name.replace("json_parses", "json_parse_failures"), 0) / count, 4
+        )
+        for name, count in counters.items()
+        if name.endswith(".json_parses") and count
+    }
+    return {
+        **snapshot,
+        "json_parse_failure_rate": parse_failure_rate,
+        "rate_limits": {name: limiter.stats() for name, limiter in limiters.items()},
+        "semantic_cache": get_cache_stats(),
+        "speculation": speculator.stats(),
+        "turns_in_flight": turns.in_flight(),
+        "product_pool": product_pool.stats(),
+        "audit_log": audit_log.stats(),
+    }
 
-    return format_state_for_response(state)
@@ -1,25 +1,26 @@
-ACTION_PLAN_PROMPT = """Based on the following task analysis, create a detailed action plan.
-Analysis: {analysis}
+ACTION_PLAN_PROMPT = """Based on the task analysis given by the user, create a detailed action plan.
 
 For each subtask, create one or more specific actions that will accomplish it.
-Use the following action types where appropriate:
+Use only the following action types:
 - generate_products: For generating product data (requires num_products parameter)
-- create_sheet: For creating Google Sheets (requires title and data parameters)
+- create_sheet: For creating Google Sheets (requires title and data parameters. Set mode to "upsert", or give a spreadsheet_id, to update the sheet this conversation created, or the given one, instead of creating a new one)
 - send_email: For sending emails (requires recipient, body and subject parameters. Optionally will include the shareable sheet link in the body)
-- custom_action: For other types of actions
+- send_bulk_email: For sending the same email to several people (requires recipients list, body and subject parameters. The body may use $recipient and $sheet_link placeholders)
 
 Format the response as a JSON array of actions with the following structure:
 [
-    {{
+    {
         "action_type": "string",
         "description": "string",
-        "parameters": {{
+        "parameters": {
             "key": "value"
-        }},
+        },
         "status": "pending",
         "subtask_id": "task_X"
-    }}
+    }
 ]
 
 Ensure the actions are specific, actionable, and aligned with the subtasks.
 IMPORTANT: Do not include any text before or after the JSON array. Just the JSON array."""
+
+ACTION_PLAN_REQUEST = """Analysis: {analysis}"""
@@ -0,0 +1,2 @@
+# Sent after a reply that could not be parsed, asking the model to repeat it as bare JSON
+JSON_RETRY_REQUEST = """Your previous reply could not be parsed as JSON. Reply again with only the JSON, without any explanation or code fences."""
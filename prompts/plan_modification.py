@@ -0,0 +1,22 @@
+PLAN_MODIFICATION_PROMPT = """You are editing an existing action plan. Apply the change requested by the user with the smallest possible patch.
+The user gives the goal, the current actions (indexed from 0) and the requested change.
+
+Format the response as a JSON object with the following structure:
+{
+    "goal": "the goal with the change applied",
+    "operations": [
+        {"op": "update", "index": 0, "description": "optional new description", "parameters": {"key": "new value"}, "remove_parameters": ["key"]},
+        {"op": "remove", "index": 1},
+        {"op": "add", "index": 2, "action": {"action_type": "string", "description": "string", "parameters": {"key": "value"}, "status": "pending", "subtask_id": "task_X"}}
+    ]
+}
+
+Indexes in "update" and "remove" refer to the current actions. Indexes in "add" refer to the position in the resulting plan.
+Only include the parameters that change in "update" operations.
+Always include the goal, rewritten to describe the plan after the change.
+If the change replaces the task entirely, asks for a new plan or cannot be expressed as a patch, respond with {"replan": true}.
+IMPORTANT: Do not include any text before or after the JSON object. Just the JSON object."""
+
+PLAN_MODIFICATION_REQUEST = """Goal: {goal}
+Current actions: {actions}
+Requested change: {change}"""
@@ -1,4 +1,4 @@
-PRODUCT_GENERATION_PROMPT = """Generate {num_products} realistic product entries with the following fields:
+PRODUCT_GENERATION_PROMPT = """Generate the number of realistic product entries requested by the user with the following fields:
 - product_id (unique string)
 - name (string)
 - description (string)
@@ -9,6 +9,10 @@ PRODUCT_GENERATION_PROMPT = """Generate {num_products} realistic product entries
 - created_at (ISO date string)
 
 Return the data as a JSON array of objects. Make the data realistic and varied.
-Include different categories like electronics, clothing, books, etc.
+Unless the user asks for a single category, include different categories like electronics, clothing, books, etc.
 Ensure prices are realistic for each category.
-IMPORTANT: Do not include any text before or after the JSON array. Just the JSON array.""" 
\ No newline at end of file
+IMPORTANT: Do not include any text before or after the JSON array. Just the JSON array.""" 
+
+PRODUCT_GENERATION_REQUEST = """Generate {num_products} products."""
+
+PRODUCT_CATEGORY_REQUEST = """Generate {num_products} products in the {category} category."""
@@ -1,5 +1,4 @@
-TASK_ANALYSIS_PROMPT = """Analyze the following task and determine if it has the essential information needed to proceed.
-Task: {request}
+TASK_ANALYSIS_PROMPT = """Analyze the task given by the user and determine if it has the essential information needed to proceed.
 
 Essential information required for different task types:
 1. For email tasks (MUST have):
@@ -16,7 +15,7 @@ Optional information (nice to have but not required):
 - Complex dependencies
 
 If ANY essential information is missing, respond with:
-{{
+{
     "needs_clarification": true,
     "clarification_questions": [
         "Specific question about missing essential information"
@@ -24,7 +23,7 @@ If ANY essential information is missing, respond with:
     "concerns": [
         "Specific concern about missing essential information"
     ]
-}}
+}
 
 If ALL essential information is present (even if optional details are missing), provide a structured analysis including:
 1. Main goal
@@ -38,22 +37,24 @@ If ALL essential information is present (even if optional details are missing),
 6. Total estimated time
 
 Format the response as a JSON object with the following structure:
-{{
+{
     "main_goal": "string",
     "complexity": "simple|moderate|complex",
     "subtasks": [
-        {{
+        {
             "description": "string",
             "estimated_time": "string",
             "dependencies": ["task_1", "task_2", ...]
-        }}
+        }
     ],
     "potential_risks": ["string"],
     "required_resources": ["string"],
     "estimated_total_time": "string"
-}}
+}
 
 Note: If the task is simple, the 'subtasks' array should be empty.
 IMPORTANT: Ensure the analysis is concise and only decomposes tasks when necessary.
 IMPORTANT: Your response MUST be a valid JSON object.
-IMPORTANT: Only ask for clarification if essential information is missing.""" 
\ No newline at end of file
+IMPORTANT: Only ask for clarification if essential information is missing.""" 
+
+TASK_ANALYSIS_REQUEST = """Task: {request}"""
@@ -0,0 +1,119 @@
+"""Report prompt tokens per template, split into the cacheable prefix and the variable request.
+
+Usage: python -m prompts.token_report [--model MODEL] [--history FILE]
+"""
+import argparse
+import json
+from datetime import datetime
+from typing import Callable, Dict, List
+from prompts.action_plan import ACTION_PLAN_PROMPT, ACTION_PLAN_REQUEST
+from prompts.plan_modification import PLAN_MODIFICATION_PROMPT, PLAN_MODIFICATION_REQUEST
+from prompts.product_generation import PRODUCT_GENERATION_PROMPT, PRODUCT_GENERATION_REQUEST
+from prompts.task_analysis import TASK_ANALYSIS_PROMPT, TASK_ANALYSIS_REQUEST
+
+SAMPLE_ANALYSIS = {
+    "main_goal": "Generate 10 products, put them in a sheet and email it to bob@example.com",
+    "complexity": "moderate",
+    "subtasks": [],
+    "potential_risks": ["Invalid email address"],
+    "required_resources": ["Google Sheets", "Gmail"],
+    "estimated_total_time": "5 minutes",
+}
+
+SAMPLE_ACTIONS = [
+    {
+        "action_type": "send_email",
+        "description": "Email the sheet",
+        "parameters": {"recipient": "bob@example.com", "subject": "Products"},
+        "status": "pending",
+        "subtask_id": "task_1",
+    }
+]
+
+# Template name -> (static prefix, variable request with sample values)
+TEMPLATES = {
+    "task_analysis": (
+        TASK_ANALYSIS_PROMPT,
+        TASK_ANALYSIS_REQUEST.format(
+            request="Generate 10 products, put them in a sheet and email it to bob@example.com"
+        ),
+    ),
+    "action_plan": (
+        ACTION_PLAN_PROMPT,
+        ACTION_PLAN_REQUEST.format(
+            analysis=json.dumps(SAMPLE_ANALYSIS, separators=(",", ":"))
+        ),
+    ),
+    "plan_modification": (
+        PLAN_MODIFICATION_PROMPT,
+        PLAN_MODIFICATION_REQUEST.format(
+            goal=SAMPLE_ANALYSIS["main_goal"],
+            actions=json.dumps(SAMPLE_ACTIONS, separators=(",", ":")),
+            change="Send it to alice@example.com instead",
+        ),
+    ),
+    "product_generation": (
+        PRODUCT_GENERATION_PROMPT,
+        PRODUCT_GENERATION_REQUEST.format(num_products=10),
+    ),
+}
+
+
+def get_token_counter(model: str) -> Callable[[str], int]:
+    """Return a token counter for the model, approximating when tiktoken is unavailable."""
+    try:
+        import tiktoken
+
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    except Exception:
+        # tiktoken is missing or cannot download its encoding (offline)
+        return lambda text: len(text) // 4
+
+
+def count_prompt_tokens(model: str) -> List[Dict[str, int]]:
+    """Count the prefix, request and total tokens of every template."""
+    count = get_token_counter(model)
+    report = []
+    for name, (prefix, request) in TEMPLATES.items():
+        prefix_tokens, request_tokens = count(prefix), count(request)
+        report.append(
+            {
+                "template": name,
+                "prefix_tokens": prefix_tokens,
+                "request_tokens": request_tokens,
+                "total_tokens": prefix_tokens + request_tokens,
+            }
+        )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--history", help="Append the report as a JSON line to this file")
+    args = parser.parse_args()
+
+    report = count_prompt_tokens(args.model)
+    print(f"{'template':<20}{'prefix':>8}{'request':>9}{'total':>8}")
+    for row in report:
+        print(
+            f"{row['template']:<20}{row['prefix_tokens']:>8}"
+            f"{row['request_tokens']:>9}{row['total_tokens']:>8}"
+        )
+
+    if args.history:
+        with open(args.history, "a") as f:
+            record = {
+                "timestamp": datetime.now().isoformat(),
+                "model": args.model,
+                "templates": report,
+            }
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+from collections import Counter, OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+import itertools
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from config import DEFAULT_TENANT, ROUTER_INSTANCES, SHARD_VNODES
+from utils.sharding import HashRing
+from utils.tenants import tenant_thread_id
+
+# Background jobs are local to the instance that accepted them
+MAX_TRACKED_JOBS = 10_000
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "host",
+    "keep-alive",
+    "transfer-encoding",
+}
+
+
+class Router:
+    """Sends each request to the app instance owning its conversation thread on a consistent hash ring.
+
+    Requests without a thread are spread round-robin; job lookups go to the
+    instance that accepted the job. Threads move between instances when the ring
+    changes, so every instance must keep its checkpoints in the same shared shards.
+    """
+
+    def __init__(self, instances: List[str], vnodes: int = SHARD_VNODES):
+        self.ring = HashRing(instances, vnodes)
+        self.jobs: "OrderedDict[str, str]" = OrderedDict()
+        self.round_robin = itertools.count()
+        self.forwarded: Counter = Counter()
+        self.client: Optional[httpx.AsyncClient] = None
+        self.checkpoint_shards: Optional[List[str]] = None
+
+    def _client(self) -> httpx.AsyncClient:
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=None)
+        return self.client
+
+    async def check_instance(self, url: str) -> None:
+        """Check that an instance shares the checkpoint shards of the others, raising ValueError if not."""
+        try:
+            response = await self._client().get(f"{url}/checkpoints", timeout=10)
+            response.raise_for_status()
+            shards = response.json()["shards"]
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            raise ValueError(f"Could not read the checkpoint shards of {url}: {e}")
+        if not shards:
+            raise ValueError(
+                f"{url} keeps its checkpoints in memory: set CHECKPOINT_DB to a database shared by all instances"
+            )
+        others = [node for node in self.ring.nodes if node != url]
+        if others and self.checkpoint_shards not in (None, shards):
+            raise ValueError(
+                f"{url} uses checkpoint shards {shards}, the other instances {self.checkpoint_shards}"
+            )
+        self.checkpoint_shards = shards
+
+    def route(self, path: str, params: Dict[str, str]) -> str:
+        """Return the instance that should serve a request."""
+        if path.startswith("jobs/") and path[len("jobs/"):] in self.jobs:
+            return self.jobs[path[len("jobs/"):]]
+        if not self.ring.nodes:
+            raise LookupError("No app instances to route to")
+        thread_id = params.get("thread_id")
+        if thread_id:
+            tenant_id = params.get("tenant_id", DEFAULT_TENANT)
+            return self.ring.node_for(tenant_thread_id(tenant_id, thread_id))
+        nodes = self.ring.nodes
+        return nodes[next(self.round_robin) % len(nodes)]
+
+    def track_job(self, job_id: str, instance: str) -> None:
+        """Remember which instance accepted a background job."""
+        self.jobs[job_id] = instance
+        while len(self.jobs) > MAX_TRACKED_JOBS:
+            self.jobs.popitem(last=False)
+
+    async def forward(self, request: Request, path: str) -> Response:
+        """Proxy a request to its instance and stream the response back as it arrives."""
+        client = self._client()
+        try:
+            instance = self.route(path, request.query_params)
+        except LookupError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        headers = {
+            name: value
+            for name, value in request.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        }
+        upstream = await client.send(
+            client.build_request(
+                request.method,
+                f"{instance}/{path}",
+                params=request.query_params,
+                content=request.stream(),
+                headers=headers,
+            ),
+            stream=True,
+        )
+        self.forwarded[instance] += 1
+        response_headers = {
+            name: value
+            for name, value in upstream.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS
+        }
+        if request.query_params.get("background", "").lower() == "true" and upstream.is_success:
+            # The job ID is needed before replying, and the reply is small
+            content = await upstream.aread()
+            await upstream.aclose()
+            self.track_job(upstream.json()["job_id"], instance)
+            return Response(content=content, status_code=upstream.status_code, headers=response_headers)
+
+        async def body() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in upstream.aiter_bytes():
+                    yield chunk
+            finally:
+                await upstream.aclose()
+
+        return StreamingResponse(body(), status_code=upstream.status_code, headers=response_headers)
+
+
+def create_app(router: Router) -> FastAPI:
+    """Create the routing app, with endpoints to add and remove instances while serving.
+
+    The app refuses to start unless its instances share their checkpoint shards.
+    """
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        for url in router.ring.nodes:
+            await router.check_instance(url)
+        yield
+        if router.client is not None:
+            await router.client.aclose()
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/router/instances")
+    def get_instances():
+        """Return the instances on the ring and the requests forwarded to each."""
+        return {
+            "instances": router.ring.nodes,
+            "forwarded": dict(router.forwarded),
+        }
+
+    @app.post("/router/instances")
+    async def add_instance(url: str):
+        """Add an instance sharing the checkpoint shards of the others; only the threads it now owns move to it."""
+        url = url.rstrip("/")
+        try:
+            await router.check_instance(url)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        router.ring.add(url)
+        return {"instances": router.ring.nodes}
+
+    @app.delete("/router/instances")
+    def remove_instance(url: str):
+        """Remove an instance; its threads move to the following instances on the ring."""
+        router.ring.remove(url.rstrip("/"))
+        return {"instances": router.ring.nodes}
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "DELETE"])
+    async def forward(path: str, request: Request):
+        return await router.forward(request, path)
+
+    return app
+
+
+router = Router(ROUTER_INSTANCES)
+app = create_app(router)
+
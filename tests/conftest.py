@@ -0,0 +1,51 @@
+"""Test configuration: run the agent offline, with its state in a temporary directory.
+
+Settings are read from the environment when config.py is imported, so they are set
+here, before any test module imports the application.
+"""
+import json
+import os
+import sys
+import tempfile
+import rsa
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STATE_DIR = tempfile.mkdtemp(prefix="agent-tests-")
+
+
+def write_service_account(path: str) -> str:
+    """Write service account credentials that load without reaching Google."""
+    _, private_key = rsa.newkeys(1024)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "type": "service_account",
+                "project_id": "tests",
+                "private_key_id": "tests",
+                "private_key": private_key.save_pkcs1().decode(),
+                "client_email": "tests@tests.iam.gserviceaccount.com",
+                "client_id": "tests",
+                "token_uri": "https://oauth2.googleapis.com/token",
+            },
+            f,
+        )
+    return path
+
+
+TEST_ENV = {
+    "LLM_PROVIDER": "fake",
+    "GOOGLE_SERVICE_ACCOUNT_PATH": write_service_account(
+        os.path.join(STATE_DIR, "service_account.json")
+    ),
+    "IDEMPOTENCY_DB": os.path.join(STATE_DIR, "idempotency.db"),
+    "TURNS_DB": os.path.join(STATE_DIR, "turns.db"),
+    "JOB_STORE_DB": os.path.join(STATE_DIR, "jobs.db"),
+    "AUDIT_LOG_DIR": os.path.join(STATE_DIR, "audit"),
+    "PRODUCT_POOL_PATH": os.path.join(STATE_DIR, "product_pool.json"),
+}
+# Set empty rather than removed, so a developer's .env cannot fill them in
+for name in ("OPENAI_API_KEY", "GMAIL_EMAIL", "GMAIL_APP_PASSWORD", "CHECKPOINT_DB", "TENANTS_PATH"):
+    TEST_ENV[name] = ""
+os.environ.update(TEST_ENV)
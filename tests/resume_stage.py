@@ -0,0 +1,131 @@
+"""One stage of test_resume, run in a child process so that it can be killed.
+
+"run" drafts and confirms the plan of RESUME_ACTIONS, dying at the --crash point;
+"resume" resumes it with resume_execution. Sheets side effects are appended to the
+--effects file, and emails are sent to the SMTP sink at --smtp-port. The statuses of
+the plan's actions are printed on a line starting with RESULT.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Every action after the first has a side effect
+RESUME_ACTIONS = [
+    ("generate_products", {"num_products": "3"}),
+    ("create_sheet", {"title": "Product List"}),
+    ("send_email", {"recipient": "ada@example.com", "subject": "Products"}),
+    ("send_email", {"recipient": "bob@example.com", "subject": "Products"}),
+    ("export_sheet", {"format": "csv"}),
+]
+THREAD_ID = "resume-test"
+
+
+class StandInSheets:
+    """Google Sheets stand-in recording its side effects in the effects file."""
+
+    def __init__(self, effects: str):
+        self.effects = effects
+
+    def effect(self, name: str) -> None:
+        with open(self.effects, "a") as f:
+            f.write(f"{name}\n")
+
+    def create_sheet(self, title: str) -> str:
+        self.effect("create_sheet")
+        return "sheet-1"
+
+    def add_data_to_sheet(self, spreadsheet_id: str, data) -> None:
+        pass
+
+    def get_shareable_link(self, spreadsheet_id: str) -> str:
+        return f"https://sheets/{spreadsheet_id}"
+
+    def export_as_csv(self, spreadsheet_id: str, output_path: str) -> str:
+        self.effect("export_sheet")
+        return output_path
+
+
+def crash_at(crash: str) -> None:
+    """Kill this process at a point of the execution.
+
+    "recorded:N" dies once action N's outcome is recorded, before its step is
+    checkpointed; "checkpointed:N" dies right after its step is checkpointed.
+    """
+    from chatagent import checkpointer, idempotency_store
+
+    kind, index = crash.split(":")
+    index = int(index)
+    claim, complete, put = idempotency_store.claim, idempotency_store.complete, checkpointer.put
+
+    def claim_after_crash(key):
+        # Checkpoints are written in the background, so the next action could otherwise
+        # be claimed before the crash and stay claimed for the claim timeout
+        if kind == "checkpointed" and key.endswith(f":{index + 1}"):
+            threading.Event().wait()
+        return claim(key)
+
+    def complete_and_crash(key, result):
+        complete(key, result)
+        if kind == "recorded" and key.endswith(f":{index}"):
+            os.kill(os.getpid(), signal.SIGKILL)
+
+    def put_and_crash(config, checkpoint, metadata, new_versions):
+        saved = put(config, checkpoint, metadata, new_versions)
+        if kind == "checkpointed" and checkpoint["channel_values"].get("next_action") == index + 1:
+            os.kill(os.getpid(), signal.SIGKILL)
+        return saved
+
+    idempotency_store.claim = claim_after_crash
+    idempotency_store.complete = complete_and_crash
+    checkpointer.put = put_and_crash
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("stage", choices=["run", "resume"])
+    parser.add_argument("--crash")
+    parser.add_argument("--smtp-port", type=int, required=True)
+    parser.add_argument("--effects", required=True)
+    args = parser.parse_args()
+
+    import utils.tools as tools
+    from chatagent import graph, resume_execution, send_message
+    from utils.email_sender import GmailSender
+
+    tools.sheets_manager = StandInSheets(args.effects)
+    tools.gmail_sender = GmailSender(
+        "agent@example.com", None, "127.0.0.1", args.smtp_port, use_tls=False
+    )
+    if args.crash:
+        crash_at(args.crash)
+
+    thread_config = {"configurable": {"thread_id": THREAD_ID}}
+    if args.stage == "run":
+        state = send_message(thread_config, "Generate 3 products and put them in a sheet")
+        actions = [
+            {
+                "action_type": action_type,
+                "description": f"{action_type} {json.dumps(parameters)}",
+                "parameters": parameters,
+                "status": "pending",
+                "subtask_id": "task_1",
+            }
+            for action_type, parameters in RESUME_ACTIONS
+        ]
+        plan = {**state["current_plan"], "actions": actions}
+        graph.update_state(thread_config, {"current_plan": plan}, as_node="planner")
+        state = send_message(thread_config, "yes")
+    else:
+        # A plan killed after its last step finished has nothing left to resume
+        state = resume_execution(THREAD_ID) or graph.get_state(thread_config).values
+    statuses = [action["status"] for action in state["current_plan"]["actions"]]
+    print("RESULT " + json.dumps(statuses))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from utils.cancellation import CancelToken, TurnCancelledError, current_cancel_token
+from utils.idempotency import IdempotencyStore, idempotency_key
+
+PLAN = {
+    "goal": "Send the sheet",
+    "confirmation_id": "draft-1",
+    "actions": [
+        {"action_type": "create_sheet", "description": "Create", "parameters": {}},
+        {"action_type": "send_email", "description": "Email", "parameters": {}},
+    ],
+}
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two stores on one file, as two server workers would open it."""
+    path = str(tmp_path / "idempotency.db")
+    return [IdempotencyStore(path, poll_interval=0.01), IdempotencyStore(path, poll_interval=0.01)]
+
+
+def test_concurrent_duplicate_submissions_run_each_action_once(stores):
+    side_effects = []
+    lock = threading.Lock()
+
+    def execute(submission: int) -> list:
+        store = stores[submission % len(stores)]
+        outcomes = []
+        for index, action in enumerate(PLAN["actions"]):
+            key = idempotency_key("thread-1", PLAN, index)
+            record = store.claim(key)
+            if record is None:
+                time.sleep(0.1)  # The side effect takes a while
+                with lock:
+                    side_effects.append(action["action_type"])
+                record = {"outcome": f"{action['action_type']} done by {submission}"}
+                store.complete(key, record)
+            outcomes.append(record["outcome"])
+        return outcomes
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        outcomes = list(pool.map(execute, range(8)))
+
+    assert sorted(side_effects) == ["create_sheet", "send_email"]
+    assert all(outcome == outcomes[0] for outcome in outcomes)
+
+
+def test_released_claims_are_executed_again(stores):
+    key = idempotency_key("thread-2", PLAN, 0)
+    assert stores[0].claim(key) is None
+    stores[0].release(key)
+
+    assert stores[1].claim(key) is None
+
+
+def test_cancelled_turn_stops_waiting_on_a_claim(stores):
+    key = idempotency_key("thread-3", PLAN, 0)
+    assert stores[0].claim(key) is None
+    token = current_cancel_token.set(CancelToken(timeout=0.2))
+    start = time.monotonic()
+    try:
+        with pytest.raises(TurnCancelledError):
+            stores[1].claim(key)
+    finally:
+        current_cancel_token.reset(token)
+    assert time.monotonic() - start < 2
+
+
+def test_redrafted_plan_gets_new_keys():
+    redrafted = {**PLAN, "confirmation_id": "draft-2"}
+    assert idempotency_key("thread-1", PLAN, 0) != idempotency_key("thread-1", redrafted, 0)
+    assert idempotency_key("thread-1", PLAN, 0) != idempotency_key("thread-2", PLAN, 0)
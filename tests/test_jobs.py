@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+import pytest
+from utils.jobs import MemoryJobStore, SQLiteJobStore
+
+
+def job(job_id: str, finished_at=None) -> dict:
+    return {
+        "job_id": job_id,
+        "status": "completed" if finished_at else "running",
+        "created_at": datetime.now().isoformat(),
+        "finished_at": finished_at,
+        "result": None,
+        "error": None,
+    }
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    if request.param == "memory":
+        return lambda: MemoryJobStore(ttl=60)
+    return lambda: SQLiteJobStore(str(tmp_path / "jobs" / "jobs.db"), ttl=60)
+
+
+def test_finished_jobs_are_evicted_after_ttl(make_store):
+    store = make_store()
+    expired = (datetime.now() - timedelta(seconds=120)).isoformat()
+    store.save(job("old", finished_at=expired))
+    store.save(job("recent", finished_at=datetime.now().isoformat()))
+    store.save(job("running"))
+
+    store.save(job("new"))
+
+    assert store.get("old") is None
+    assert [store.get(job_id)["job_id"] for job_id in ("recent", "running", "new")] == [
+        "recent", "running", "new"
+    ]
+
+
+def test_sqlite_jobs_are_shared_between_processes(tmp_path):
+    # Two stores on one file, as two server workers would open it
+    path = str(tmp_path / "jobs.db")
+    worker, poller = SQLiteJobStore(path), SQLiteJobStore(path)
+    worker.save(job("job-1"))
+    worker.update("job-1", status="completed", result={"ok": True})
+
+    assert poller.get("job-1")["result"] == {"ok": True}
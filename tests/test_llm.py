@@ -0,0 +1,30 @@
+import threading
+import time
+import utils  # noqa: F401  # utils must be imported first, as its package imports llm
+import llm
+
+
+def test_concurrent_first_calls_share_one_connection_pool(monkeypatch):
+    created = []
+
+    class SlowClient:
+        def __init__(self, **kwargs):
+            # Widen the window between checking for the client and setting it
+            time.sleep(0.05)
+            created.append(self)
+
+    monkeypatch.setattr(llm, "_http_client", None)
+    monkeypatch.setattr(llm, "_http_async_client", None)
+    monkeypatch.setattr(llm.httpx, "Client", SlowClient)
+    monkeypatch.setattr(llm.httpx, "AsyncClient", SlowClient)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(llm.get_http_clients())) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 2
+    assert len(set(results)) == 1
@@ -0,0 +1,73 @@
+import uuid
+import pytest
+import chatagent
+
+
+def draft_plan(thread_config: dict) -> dict:
+    """Draft the fake LLM's plan in a new thread, then decline it to be asked for changes."""
+    state = chatagent.send_message(thread_config, "Generate 3 products and put them in a Google Sheet")
+    assert state["current_plan"]["status"] == "draft"
+    state = chatagent.send_message(thread_config, "no")
+    assert not state["needs_confirmation"]
+    return state["current_plan"]
+
+
+@pytest.fixture
+def thread_config() -> dict:
+    return {"configurable": {"thread_id": f"test-{uuid.uuid4().hex}"}}
+
+
+def test_change_patches_plan_and_refreshes_analysis(thread_config, monkeypatch):
+    plan = draft_plan(thread_config)
+    analyzed = []
+    analyze_task = chatagent.analyze_task
+
+    def record_analysis(request: str, use_cache: bool = True):
+        analyzed.append(request)
+        return {**analyze_task(request, use_cache), "main_goal": request}
+
+    monkeypatch.setattr(chatagent, "analyze_task", record_analysis)
+    state = chatagent.send_message(thread_config, "Make it 5 products instead")
+
+    patched = state["current_plan"]
+    assert patched["actions"][0]["parameters"]["num_products"] == "5"
+    assert patched["actions"][1:] == plan["actions"][1:]
+    assert "5" in patched["goal"] and patched["goal"] != plan["goal"]
+    # The displayed analysis is that of the patched goal, not of the original plan
+    assert analyzed == [patched["goal"]]
+    assert patched["analysis"]["main_goal"] == patched["goal"]
+    assert patched["confirmation_id"] != plan["confirmation_id"]
+
+
+def test_new_plan_request_is_not_patched(thread_config, monkeypatch):
+    draft_plan(thread_config)
+
+    def fail_modification(plan, change):
+        raise AssertionError("a new plan request was sent to modify_plan")
+
+    monkeypatch.setattr(chatagent, "modify_plan", fail_modification)
+    message = "Now make a totally new plan: generate 7 books"
+    state = chatagent.send_message(thread_config, message)
+
+    assert state["current_plan"]["goal"] == message
+    assert state["needs_confirmation"]
+
+
+@pytest.mark.parametrize(
+    "patch",
+    [
+        {"replan": True},
+        {"operations": []},
+        {"operations": [{"op": "remove", "index": 9}]},
+        {"operations": [{"op": "update", "index": 0, "action_type": "custom_action"}]},
+    ],
+)
+def test_unapplied_patch_replans_from_the_change_alone(thread_config, monkeypatch, patch):
+    plan = draft_plan(thread_config)
+    monkeypatch.setattr(chatagent, "invoke_llm_json", lambda *args, **kwargs: (patch, False))
+    replanned = []
+    monkeypatch.setattr(chatagent, "create_plan", lambda request: replanned.append(request) or plan)
+
+    chatagent.modify_plan(plan, "Send it to bob@example.com")
+
+    assert replanned == ["Send it to bob@example.com"]
@@ -0,0 +1,116 @@
+import json
+import os
+from utils.product_pool import ProductPool, fake_products, stable_product_id
+from utils.tenants import tenant_context, tenant_manager
+# Imported after utils, whose package imports llm
+from llm import FakeChatModel, LLMClient, prompt_messages
+
+
+class FakeGenerator:
+    """Product generator calling the fake LLM through an accounted LLM client."""
+
+    def __init__(self):
+        self.llm = LLMClient("products", FakeChatModel("products"))
+
+    def generate_products(self, num_products, category=None):
+        return self.llm.invoke_json(prompt_messages("", f"Generate {num_products} products"), list)
+
+
+class RepeatingGenerator:
+    """Product generator returning the same products on every call."""
+
+    def generate_products(self, num_products, category=None):
+        return fake_products(num_products, category, seed=1)
+
+
+def write_exited_pool(path: str) -> str:
+    """Persist the pool file of a process that exited, and return its name."""
+    name = f"{path}.999999999-deadbeef"
+    with open(name, "w") as f:
+        json.dump({"buffers": {"books": fake_products(5, "books")}, "fake_seed": 0}, f)
+    return name
+
+
+def test_pool_files_are_claimed_on_load_not_on_creation(tmp_path):
+    path = str(tmp_path / "product_pool.json")
+    exited = write_exited_pool(path)
+
+    pool = ProductPool(FakeGenerator(), categories=["books"], path=path)
+    assert pool.stats() == {"books": 0}
+    assert os.path.exists(exited)
+
+    pool.load()
+    assert pool.stats() == {"books": 5}
+    assert not os.path.exists(exited)
+
+
+def test_refills_are_not_accounted_to_the_current_tenant(tmp_path):
+    pool = ProductPool(
+        FakeGenerator(), categories=["books"], high_water=10, batch_size=5, path=None
+    )
+    before = tenant_manager.usage("default")["usage"]
+
+    with tenant_context("default"):
+        pool.refill()
+
+    assert pool.stats() == {"books": 10}
+    assert tenant_manager.usage("default")["usage"] == before
+
+
+def test_products_keep_their_id_when_generated_again():
+    pool = ProductPool(FakeGenerator(), categories=["books"], path=None)
+    generated = pool._generate(3, "books")
+
+    for product in generated:
+        assert product["product_id"] == stable_product_id("books", product["name"])
+    assert len({product["product_id"] for product in generated}) == 3
+
+
+def test_a_category_buffers_each_product_once():
+    pool = ProductPool(
+        RepeatingGenerator(), categories=["books"], high_water=20, batch_size=5, path=None
+    )
+    pool.refill()
+
+    assert pool.stats() == {"books": 5}
+
+
+def test_a_take_returns_each_product_once():
+    pool = ProductPool(
+        RepeatingGenerator(), categories=["books"], low_water=0, high_water=5, batch_size=5, path=None
+    )
+    pool.refill()
+
+    # The shortfall is generated again, repeating the products taken from the buffer
+    taken = [product["product_id"] for product in pool.take(8)]
+
+    assert len(taken) == len(set(taken)) == 5
+
+
+def test_products_taken_before_a_restart_are_not_served_again(tmp_path):
+    path = str(tmp_path / "product_pool.json")
+    exited = ProductPool(
+        FakeGenerator(), categories=["books"], low_water=0, high_water=10, batch_size=5, path=path
+    )
+    exited.refill()
+    taken = {product["product_id"] for product in exited.take(4)}
+
+    # Another pool of this process owns other files, so it takes over the exited pool's
+    restarted = ProductPool(FakeGenerator(), categories=["books"], high_water=10, path=path)
+    restarted.load()
+
+    buffered = {product["product_id"] for product in restarted.buffers["books"]}
+    assert len(buffered) == 6
+    assert not buffered & taken
+
+
+def test_a_product_generated_again_after_it_was_served_keeps_its_id():
+    pool = ProductPool(
+        RepeatingGenerator(), categories=["books"], low_water=0, high_water=5, batch_size=5, path=None
+    )
+    pool.refill()
+    first = [product["product_id"] for product in pool.take(5)]
+    pool.refill()
+
+    # The same product, so sheets upserted with it keep its row
+    assert [product["product_id"] for product in pool.take(5)] == first
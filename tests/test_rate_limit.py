@@ -0,0 +1,68 @@
+import smtplib
+import pytest
+from utils.rate_limit import BackendLimiter
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int, message: str = "", reasons: tuple = ()):
+        super().__init__(message or str(status_code))
+        self.status_code = status_code
+        # Like googleapiclient's HttpError
+        self.error_details = [{"reason": reason} for reason in reasons]
+
+
+def flaky(*errors: Exception):
+    """A call failing with each error in turn, then succeeding; returns it and its call log."""
+    calls = []
+
+    def call():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+
+    return call, calls
+
+
+@pytest.fixture
+def limiter():
+    return BackendLimiter("test", rate=1e6, burst=1000, max_concurrency=4, base_delay=0.001)
+
+
+@pytest.mark.parametrize(
+    "error",
+    [
+        StatusError(429),
+        StatusError(403, "rateLimitExceeded"),
+        StatusError(403, "userRateLimitExceeded"),
+        StatusError(403, "Forbidden", reasons=("rateLimitExceeded",)),
+        StatusError(403, "Forbidden", reasons=("userRateLimitExceeded",)),
+        smtplib.SMTPDataError(451, b"try later"),
+    ],
+)
+def test_throttled_calls_are_retried_even_when_not_idempotent(limiter, error):
+    call, calls = flaky(error)
+    assert limiter.call(call, idempotent=False) == "ok"
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize(
+    "error",
+    [StatusError(503), TimeoutError("timed out"), smtplib.SMTPServerDisconnected("dropped")],
+)
+def test_ambiguous_failures_are_retried_only_when_idempotent(limiter, error):
+    call, calls = flaky(error)
+    assert limiter.call(call) == "ok"
+    assert len(calls) == 2
+
+    call, calls = flaky(error)
+    with pytest.raises(type(error)):
+        limiter.call(call, idempotent=False)
+    assert len(calls) == 1
+
+
+def test_other_403s_are_not_retried(limiter):
+    call, calls = flaky(StatusError(403, "Forbidden", reasons=("insufficientPermissions",)))
+    with pytest.raises(StatusError):
+        limiter.call(call)
+    assert len(calls) == 1
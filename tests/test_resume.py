@@ -0,0 +1,64 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+from collections import Counter
+import pytest
+from resume_stage import RESUME_ACTIONS
+from utils.smtp_sink import SMTPSink
+
+STAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resume_stage.py")
+CRASHES = [
+    f"{kind}:{index}"
+    for index in range(1, len(RESUME_ACTIONS))
+    for kind in ("recorded", "checkpointed")
+]
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(signal, "SIGKILL"), reason="kills processes with SIGKILL"
+)
+
+
+@pytest.fixture(scope="module")
+def smtp_sink():
+    sink = SMTPSink().start()
+    yield sink
+    sink.shutdown()
+
+
+def run_stage(stage: str, tmp_path, smtp_sink, crash: str = None) -> subprocess.CompletedProcess:
+    """Run a stage of the plan execution in a new process sharing the thread's stores."""
+    env = {
+        **os.environ,
+        "CHECKPOINT_DB": str(tmp_path / "checkpoints.db"),
+        "CHECKPOINT_SHARDS": "1",
+        "IDEMPOTENCY_DB": str(tmp_path / "idempotency.db"),
+        "TURNS_DB": str(tmp_path / "turns.db"),
+        "AUDIT_LOG_DIR": str(tmp_path / "audit"),
+        "PRODUCT_POOL_PATH": str(tmp_path / "product_pool.json"),
+    }
+    command = [
+        sys.executable, STAGE, stage,
+        "--smtp-port", str(smtp_sink.port),
+        "--effects", str(tmp_path / "effects.txt"),
+    ]
+    if crash:
+        command += ["--crash", crash]
+    return subprocess.run(command, cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120)
+
+
+@pytest.mark.parametrize("crash", CRASHES)
+def test_killed_execution_resumes_with_each_side_effect_once(crash, tmp_path, smtp_sink):
+    emails = smtp_sink.stats()["messages"]
+
+    run = run_stage("run", tmp_path, smtp_sink, crash)
+    assert run.returncode == -signal.SIGKILL, run.stderr[-2000:]
+    resumed = run_stage("resume", tmp_path, smtp_sink)
+    assert resumed.returncode == 0, resumed.stderr[-2000:]
+
+    results = [line for line in resumed.stdout.splitlines() if line.startswith("RESULT ")]
+    assert json.loads(results[-1][len("RESULT "):]) == ["completed"] * len(RESUME_ACTIONS)
+    effects = Counter((tmp_path / "effects.txt").read_text().split())
+    effects["send_email"] = smtp_sink.stats()["messages"] - emails
+    assert effects == Counter(action_type for action_type, _ in RESUME_ACTIONS[1:])
@@ -0,0 +1,78 @@
+import multiprocessing
+import pytest
+from config import SEMANTIC_CACHE_THRESHOLD
+from utils.semantic_cache import SemanticCache
+
+CACHED = "Generate 10 laptop products and put them in a Google Sheet"
+
+
+@pytest.fixture
+def cache():
+    cache = SemanticCache("test", threshold=SEMANTIC_CACHE_THRESHOLD)
+    cache.add(CACHED, "cached analysis")
+    return cache
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "Create 10 laptop products and put them in a Google Sheet",
+        "Please generate 10 laptop products and put them in a Google Sheet",
+        "generate 10 laptop products, and put them into a google sheet.",
+        "Make 10 laptop products and add them to a Google spreadsheet",
+        "Could you create 10 laptop items and put them in the Google Sheet?",
+    ],
+)
+def test_paraphrases_hit(cache, prompt):
+    assert cache.lookup(prompt) == "cached analysis"
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    [
+        "Generate 20 laptop products and put them in a Google Sheet",
+        "Do not generate 10 laptop products and put them in a Google Sheet",
+        "Generate 10 laptop products and don't put them in a Google Sheet",
+        "Generate 10 laptop products and put them in a Google Sheet with prices",
+        "Generate 10 phone products and put them in a Google Sheet",
+        "Generate 10 laptop products and put them in a Google Sheet and email bob@example.com",
+        "Generate 10 laptop products and email them",
+    ],
+)
+def test_near_misses_are_rejected(cache, prompt):
+    assert cache.lookup(prompt) is None
+
+
+def add_prompts(path: str, worker: int) -> None:
+    cache = SemanticCache("test", path=path, max_entries=100)
+    for i in range(5):
+        cache.add(f"Generate {i} products for catalog {worker}", f"analysis {worker}-{i}")
+
+
+def test_processes_sharing_a_path_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "analysis")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=add_prompts, args=(path, worker)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    cache = SemanticCache("test", path=path, max_entries=100)
+    assert cache.stats()["entries"] == 20
+    for worker in range(4):
+        for i in range(5):
+            assert cache.lookup(f"Generate {i} products for catalog {worker}") == f"analysis {worker}-{i}"
+
+
+def test_entries_added_after_a_log_rewrite_reach_other_caches(tmp_path):
+    path = str(tmp_path / "analysis")
+    first = SemanticCache("test", path=path, max_entries=2)
+    second = SemanticCache("test", path=path, max_entries=2)
+    for i in range(10):
+        first.add(f"Generate {i} products", f"analysis {i}")
+        assert second.lookup(f"Generate {i} products") == f"analysis {i}"
+    # Rewritten instead of growing with every entry
+    with open(f"{path}.jsonl") as f:
+        assert len(f.readlines()) <= 1 + 2 * 2
+    assert SemanticCache("test", path=path, max_entries=2).stats()["entries"] == 2
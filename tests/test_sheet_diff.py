@@ -0,0 +1,39 @@
+from utils.product_pool import fake_products, stable_product_id
+from utils.product_table import ProductTable
+from utils.sheet_diff import changed_ranges, diff_rows, index_rows
+from utils.sheets_manager import UPSERT_KEY
+
+
+def sheet_values(products) -> list:
+    for product in products:
+        product["product_id"] = stable_product_id(product["category"], product["name"])
+    return ProductTable.from_records(products).to_sheet_values()
+
+
+def test_unchanged_products_are_not_rewritten():
+    products = fake_products(6, "books", seed=1)
+    current = sheet_values(products)
+    changed = [dict(product) for product in products]
+    changed[2]["price"] += 1
+    new = sheet_values(changed)
+
+    diff = diff_rows(index_rows(current, UPSERT_KEY), new, UPSERT_KEY, len(current))
+
+    assert (diff["updated"], diff["appended"], diff["removed"]) == (1, 0, 0)
+    assert changed_ranges(diff["writes"]) == [{"range": "A4", "values": [new[3]]}]
+
+
+def test_removed_rows_leave_no_gaps():
+    products = fake_products(6, "books", seed=1)
+    current = sheet_values(products)
+    new = sheet_values([dict(product) for product in products[1:]])
+
+    diff = diff_rows(index_rows(current, UPSERT_KEY), new, UPSERT_KEY, len(current))
+
+    assert (diff["updated"], diff["appended"], diff["removed"]) == (0, 0, 1)
+    assert diff["num_rows"] == len(new)
+    rows = [list(row) for row in current]
+    for position, row in diff["writes"]:
+        rows[position] = row
+    assert sorted(map(str, rows[1:len(new)])) == sorted(map(str, new[1:]))
+    assert all(cell == "" for cell in rows[len(new)])
@@ -0,0 +1,49 @@
+import threading
+import time
+import pytest
+from utils.cancellation import CancelToken, TurnCancelledError, current_cancel_token
+from utils.speculation import Speculator
+
+MESSAGE = "Generate 3 products and put them in a sheet"
+
+
+@pytest.fixture
+def stuck_speculator():
+    """Speculator whose analysis does not finish until the test ends."""
+    release = threading.Event()
+
+    def analyze(request):
+        release.wait()
+        return {"main_goal": request}
+
+    speculator = Speculator(analyze, debounce=0)
+    assert speculator.submit("session", MESSAGE)
+    yield speculator
+    release.set()
+
+
+def run_turn(token: CancelToken, fn):
+    context_token = current_cancel_token.set(token)
+    try:
+        return fn()
+    finally:
+        current_cancel_token.reset(context_token)
+
+
+def test_waiting_stops_at_the_turn_deadline(stuck_speculator):
+    start = time.monotonic()
+    analysis = run_turn(CancelToken(timeout=0.3), lambda: stuck_speculator.take("session", MESSAGE))
+
+    # A miss, so that the caller analyzes the message itself
+    assert analysis is None
+    assert time.monotonic() - start < 1
+
+
+def test_waiting_stops_when_the_turn_is_cancelled(stuck_speculator):
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel, ["cancelled by the user"]).start()
+    start = time.monotonic()
+
+    with pytest.raises(TurnCancelledError):
+        run_turn(token, lambda: stuck_speculator.take("session", MESSAGE))
+    assert time.monotonic() - start < 1
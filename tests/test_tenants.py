@@ -0,0 +1,65 @@
+import statistics
+import threading
+import time
+from utils.rate_limit import BackendLimiter
+from utils.tenants import TenantManager, tenant_context
+
+CALL_SECONDS = 0.05
+
+
+def quiet_latencies(per_tenant_limit: int, duration: float = 1.5) -> list:
+    """Latencies of a quiet tenant's sequential calls to a backend shared with a noisy tenant.
+
+    32 threads of the noisy tenant flood the backend, which has 8 calls in flight.
+    """
+    manager = TenantManager(
+        {
+            "noisy": {"max_concurrency": per_tenant_limit},
+            "quiet": {"max_concurrency": per_tenant_limit},
+        }
+    )
+    backend = BackendLimiter("shared", rate=1e9, burst=10**6, max_concurrency=8)
+    backend.concurrency.limit = 8
+    stop = threading.Event()
+    latencies = []
+
+    def call(tenant_id: str) -> float:
+        start = time.perf_counter()
+        with tenant_context(tenant_id), manager.slot(tenant_id, "llm_calls"):
+            backend.call(time.sleep, CALL_SECONDS)
+        return time.perf_counter() - start
+
+    def flood() -> None:
+        while not stop.is_set():
+            call("noisy")
+
+    def trickle() -> None:
+        while not stop.is_set():
+            latency = call("quiet")
+            if not stop.is_set():
+                latencies.append(latency)
+
+    threads = [threading.Thread(target=flood) for _ in range(32)]
+    threads.append(threading.Thread(target=trickle))
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def test_noisy_tenant_does_not_starve_a_quiet_one():
+    latencies = quiet_latencies(per_tenant_limit=4)
+
+    # The noisy tenant holds at most 4 of the backend's 8 slots, so quiet calls do not queue
+    assert len(latencies) >= 10
+    assert statistics.median(latencies) < 2 * CALL_SECONDS
+
+
+def test_without_a_per_tenant_limit_the_quiet_tenant_queues():
+    latencies = quiet_latencies(per_tenant_limit=0)
+
+    # Its calls wait behind the noisy tenant's, if they get through at all
+    assert not latencies or statistics.median(latencies) > 2 * CALL_SECONDS
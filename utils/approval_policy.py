@@ -0,0 +1,41 @@
+from typing import List, Optional, Tuple
+from config import AUTO_APPROVE_ACTIONS, TRUSTED_EMAIL_DOMAINS
+from interface import Plan
+
+EMAIL_ACTIONS = {"send_email", "send_bulk_email"}
+
+
+class ApprovalPolicy:
+    """Decide whether a plan is low-risk enough to execute without human confirmation."""
+
+    def __init__(self, auto_approve_actions: List[str], trusted_domains: List[str]):
+        self.auto_approve_actions = set(auto_approve_actions)
+        self.trusted_domains = {domain.lower() for domain in trusted_domains}
+
+    def evaluate(self, plan: Optional[Plan]) -> Tuple[bool, str]:
+        """Return whether the plan is auto-approved and why."""
+        if not plan or not plan.get("actions"):
+            return False, "Plan has no actions"
+        if plan.get("repaired"):
+            return False, "Plan was repaired from a truncated or malformed reply"
+        for action in plan["actions"]:
+            action_type = action["action_type"]
+            if action_type not in self.auto_approve_actions:
+                return False, f"{action_type} requires confirmation"
+            if action_type in EMAIL_ACTIONS:
+                parameters = action["parameters"]
+                recipients = parameters.get("recipients") or parameters.get("recipient") or ""
+                if isinstance(recipients, str):
+                    recipients = recipients.split(",")
+                for recipient in recipients:
+                    domain = str(recipient).strip().rpartition("@")[2].lower()
+                    if domain not in self.trusted_domains:
+                        return False, f"{recipient} is an external recipient"
+        return True, "All actions are low-risk"
+
+    def approves(self, plan: Optional[Plan]) -> bool:
+        """Check whether the plan is auto-approved."""
+        return self.evaluate(plan)[0]
+
+
+approval_policy = ApprovalPolicy(AUTO_APPROVE_ACTIONS, TRUSTED_EMAIL_DOMAINS)
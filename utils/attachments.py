@@ -0,0 +1,135 @@
+import base64
+import gzip
+import os
+import re
+import shutil
+import smtplib
+import tempfile
+import uuid
+import weakref
+from email import policy
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.utils import getaddresses
+from typing import IO, List
+
+# Multiple of 57 bytes so every chunk encodes to whole 76-character base64 lines
+CHUNK_SIZE = 57 * 16 * 1024
+
+
+def encode_stream(source: IO[bytes], target: IO[bytes]) -> None:
+    """Base64-encode a file into MIME lines chunk by chunk."""
+    while chunk := source.read(CHUNK_SIZE):
+        target.write(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+
+
+class EncodedAttachment:
+    """Attachment encoded once into a spool file on disk and streamed into each message that uses it."""
+
+    def __init__(self, path: str, compress: bool = False):
+        self.filename = os.path.basename(path)
+        maintype, subtype = "application", "octet-stream"
+        fd, self.spool_path = tempfile.mkstemp(suffix=".b64")
+        self._finalizer = weakref.finalize(self, os.remove, self.spool_path)
+        with os.fdopen(fd, "wb") as spool, open(path, "rb") as source:
+            if compress:
+                self.filename += ".gz"
+                subtype = "gzip"
+                with tempfile.TemporaryFile() as compressed:
+                    with gzip.GzipFile(fileobj=compressed, mode="wb") as gz:
+                        shutil.copyfileobj(source, gz, CHUNK_SIZE)
+                    compressed.seek(0)
+                    encode_stream(compressed, spool)
+            else:
+                encode_stream(source, spool)
+        self.size = os.path.getsize(self.spool_path)
+
+        part = MIMEBase(maintype, subtype, name=self.filename)
+        part["Content-Transfer-Encoding"] = "base64"
+        part.add_header("Content-Disposition", "attachment", filename=self.filename)
+        self.headers = part.as_bytes(policy=policy.SMTP)
+
+    def send_to(self, sock) -> None:
+        """Write the encoded content to a socket, with sendfile where the socket supports it."""
+        if self.size:
+            with open(self.spool_path, "rb") as f:
+                sock.sendfile(f)
+
+    def close(self) -> None:
+        """Remove the spool file."""
+        self._finalizer()
+
+    def __enter__(self) -> "EncodedAttachment":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class StreamedMessage:
+    """MIME message whose attachments are streamed from their spool files instead of held in memory."""
+
+    def __init__(self, message: MIMEMultipart, attachments: List[EncodedAttachment]):
+        self.message = message
+        self.attachments = attachments
+        # Fixed up front since the attachments are written outside the email generator
+        message.set_boundary(f"===============_{uuid.uuid4().hex}==")
+
+    def __getitem__(self, key: str):
+        return self.message[key]
+
+    def _head(self) -> bytes:
+        """Serialize the headers and body parts, without the closing boundary."""
+        head = self.message.as_bytes(policy=policy.SMTP)
+        closing = f"--{self.message.get_boundary()}--".encode()
+        return head[: head.rindex(closing)]
+
+    def _recipients(self) -> List[str]:
+        fields = self.message.get_all("to", []) + self.message.get_all("cc", [])
+        return [address for _, address in getaddresses(fields)]
+
+    def send(self, server: smtplib.SMTP) -> None:
+        """Send the message over an open SMTP session, streaming the DATA section."""
+        sender = self.message["from"]
+        recipients = self._recipients()
+        server.ehlo_or_helo_if_needed()
+        code, response = server.mail(sender)
+        if code != 250:
+            server.rset()
+            raise smtplib.SMTPSenderRefused(code, response, sender)
+        refused = {}
+        for recipient in recipients:
+            code, response = server.rcpt(recipient)
+            if code not in (250, 251):
+                refused[recipient] = (code, response)
+        if len(refused) == len(recipients):
+            server.rset()
+            raise smtplib.SMTPRecipientsRefused(refused)
+
+        server.putcmd("data")
+        code, response = server.getreply()
+        if code != 354:
+            raise smtplib.SMTPDataError(code, response)
+        sock = server.sock
+        # Base64 lines never start with a period, so only the head needs dot-stuffing
+        sock.sendall(re.sub(rb"(?m)^\.", b"..", self._head()))
+        boundary = self.message.get_boundary().encode()
+        for attachment in self.attachments:
+            sock.sendall(b"--" + boundary + b"\r\n" + attachment.headers)
+            attachment.send_to(sock)
+            sock.sendall(b"\r\n")
+        sock.sendall(b"--" + boundary + b"--\r\n.\r\n")
+        code, response = server.getreply()
+        if code != 250:
+            raise smtplib.SMTPDataError(code, response)
+
+    def as_bytes(self) -> bytes:
+        """Materialize the full message, e.g. for inspection."""
+        boundary = self.message.get_boundary().encode()
+        parts = [self._head()]
+        for attachment in self.attachments:
+            with open(attachment.spool_path, "rb") as f:
+                parts.append(b"--" + boundary + b"\r\n" + attachment.headers + f.read() + b"\r\n")
+        parts.append(b"--" + boundary + b"--\r\n")
+        return b"".join(parts)
+
@@ -0,0 +1,564 @@
+import atexit
+import json
+import math
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from config import (
+    AUDIT_LOG_DIR,
+    AUDIT_LOG_ENABLED,
+    AUDIT_QUEUE_SIZE,
+    AUDIT_RETENTION_DAYS,
+    AUDIT_SEGMENT_ROWS,
+    AUDIT_SEGMENT_SECONDS,
+)
+from utils.logger import log_error
+from utils.metrics import metrics
+
+# Segments are named by the times of their first and last records in milliseconds
+# ("open" while written) and their writer: a pid and a token per AuditLog instance
+SEGMENT_PATTERN = re.compile(r"^actions-(\d{13})-(\d{13}|open)-(\d+-[0-9a-f]{8})\.db$")
+# Lock files: renaming or deleting segments takes the segments lock exclusively and
+# queries take it shared, and one process at a time holds the compaction lock
+SEGMENTS_LOCK = "segments.lock"
+COMPACTION_LOCK = "compaction.lock"
+LOCK_TIMEOUT = 30.0
+ACTION_COLUMNS = [
+    "ts",
+    "thread_id",
+    "tenant_id",
+    "action_type",
+    "description",
+    "status",
+    "outcome",
+    "attempts",
+    "duration_seconds",
+    "parameters",
+]
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS actions (id INTEGER PRIMARY KEY, ts REAL NOT NULL, "
+    "thread_id TEXT, tenant_id TEXT, action_type TEXT NOT NULL, description TEXT, "
+    "status TEXT, outcome TEXT, attempts INTEGER, duration_seconds REAL, parameters TEXT)",
+    # One row per email recipient of an action, with whether it was sent to
+    "CREATE TABLE IF NOT EXISTS recipients ("
+    "action_id INTEGER NOT NULL, recipient TEXT NOT NULL, ts REAL NOT NULL, status TEXT)",
+]
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS actions_ts ON actions (ts)",
+    "CREATE INDEX IF NOT EXISTS actions_thread ON actions (thread_id, ts)",
+    "CREATE INDEX IF NOT EXISTS actions_type ON actions (action_type, ts)",
+    "CREATE INDEX IF NOT EXISTS recipients_recipient ON recipients (recipient, ts)",
+]
+WRITE_BATCH = 1000
+# Writers of the AuditLog instances of this process
+live_writers: Set[str] = set()
+RELATIVE_TIME = re.compile(r"^(\d+(?:\.\d+)?)([smhdw])$")
+TIME_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_time(value: str) -> float:
+    """Parse a Unix timestamp, an ISO date or time, or a time ago such as 7d, 12h or 30m."""
+    value = value.strip()
+    match = RELATIVE_TIME.match(value)
+    if match:
+        return time.time() - float(match.group(1)) * TIME_UNITS[match.group(2)]
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError(f"Invalid time: {value}; expected a timestamp, an ISO date or e.g. 7d")
+
+
+def segment_path(directory: str, start: float, end: Optional[float], writer: str) -> str:
+    last = "open" if end is None else f"{math.ceil(end * 1000):013d}"
+    return os.path.join(directory, f"actions-{math.floor(start * 1000):013d}-{last}-{writer}.db")
+
+
+def parse_segment(path: str) -> Tuple[float, Optional[float], str]:
+    """Times of the first and last records of a segment (None while open) and its writer."""
+    start, end, writer = SEGMENT_PATTERN.match(os.path.basename(path)).groups()
+    return int(start) / 1000, None if end == "open" else int(end) / 1000, writer
+
+
+def writer_alive(writer: str) -> bool:
+    """Whether the writer of an open segment may still be writing it."""
+    pid = int(writer.split("-")[0])
+    if pid == os.getpid():
+        return writer in live_writers
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def connect_read_only(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+
+
+class AuditLog:
+    """Append-only log of executed actions in SQLite segment files, indexed for querying.
+
+    Records are queued by `record` and written in batches by a background thread,
+    so executing an action never waits on the log. Every instance writes its own
+    open segment until it holds `segment_rows` records or spans `segment_seconds`,
+    then closes it by renaming it after its time range. Closed segments are never
+    modified, only merged by `compact` and deleted once their records are past
+    retention. Queries visit the segments overlapping their time range, latest
+    first, until no other segment can hold one of the `limit` latest records.
+    """
+
+    def __init__(
+        self,
+        directory: str = AUDIT_LOG_DIR,
+        segment_rows: int = AUDIT_SEGMENT_ROWS,
+        segment_seconds: float = AUDIT_SEGMENT_SECONDS,
+        retention_days: float = AUDIT_RETENTION_DAYS,
+        queue_size: int = AUDIT_QUEUE_SIZE,
+        enabled: bool = AUDIT_LOG_ENABLED,
+    ):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.segment_seconds = segment_seconds
+        self.retention_days = retention_days
+        self.enabled = enabled
+        self.pid = os.getpid()
+        self.writer_id = f"{self.pid}-{uuid.uuid4().hex[:8]}"
+        live_writers.add(self.writer_id)
+        self.queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=queue_size)
+        # Guards the open segment of this writer
+        self.lock = threading.Lock()
+        self.writer: Optional[threading.Thread] = None
+        # Owned by the writer thread
+        self.conn: Optional[sqlite3.Connection] = None
+        self.segment: Optional[str] = None
+        self.segment_opened = 0.0
+        self.segment_count = 0
+
+    def record(self, entry: Dict[str, Any]) -> bool:
+        """Queue an action record for writing, returning False if it was dropped.
+
+        The entry holds ACTION_COLUMNS (ts defaults to now) and optionally
+        "recipients", a list of (email, status) pairs.
+        """
+        if not self.enabled:
+            return False
+        self._start()
+        try:
+            self.queue.put_nowait({"ts": time.time(), **entry})
+        except queue.Full:
+            metrics.incr("audit_log.dropped")
+            return False
+        return True
+
+    def flush(self) -> None:
+        """Wait until every queued record is written."""
+        if self.writer is not None:
+            self.queue.join()
+
+    def close(self) -> None:
+        """Write the queued records and close the open segment."""
+        self.flush()
+        with self.lock:
+            if self.conn is not None:
+                self._close_segment()
+
+    def _start(self) -> None:
+        if self.writer is None or self.pid != os.getpid():
+            with self.lock:
+                if self.writer is None or self.pid != os.getpid():
+                    # Worker processes forked after import write their own segments
+                    if self.pid != os.getpid():
+                        self.pid = os.getpid()
+                        self.writer_id = f"{self.pid}-{uuid.uuid4().hex[:8]}"
+                        live_writers.add(self.writer_id)
+                        self.conn, self.segment = None, None
+                    os.makedirs(self.directory, exist_ok=True)
+                    self.writer = threading.Thread(target=self._run, name="audit-log", daemon=True)
+                    self.writer.start()
+                    atexit.register(self.close)
+                    # Closes the segments left open by writers that exited
+                    self._compact_in_background()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < WRITE_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+                metrics.incr("audit_log.written", len(batch))
+            except Exception as e:
+                metrics.incr("audit_log.write_errors", len(batch))
+                log_error("Error writing the audit log", e)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _compact_in_background(self) -> None:
+        threading.Thread(target=self.compact, name="audit-log-compaction", daemon=True).start()
+
+    def segments(self) -> List[str]:
+        """Paths of the segments, by time of their first record."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [name for name in os.listdir(self.directory) if SEGMENT_PATTERN.match(name)]
+        return [os.path.join(self.directory, name) for name in sorted(names)]
+
+    @contextmanager
+    def _segments_lock(
+        self, exclusive: bool, name: str = SEGMENTS_LOCK, timeout: float = LOCK_TIMEOUT
+    ) -> Iterator[None]:
+        """Hold a lock shared by the processes using the directory, in a SQLite lock file."""
+        conn = sqlite3.connect(
+            os.path.join(self.directory, name), timeout=timeout, isolation_level=None
+        )
+        try:
+            if exclusive:
+                conn.execute("BEGIN EXCLUSIVE")
+            else:
+                conn.execute("BEGIN")
+                conn.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            try:
+                yield
+            finally:
+                conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _connect(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-65536")
+        for statement in SCHEMA + INDEXES:
+            conn.execute(statement)
+        conn.commit()
+        return conn
+
+    def _segment_full(self, ts: float) -> bool:
+        return self.segment_count >= self.segment_rows or (
+            bool(self.segment_seconds) and ts - self.segment_opened >= self.segment_seconds
+        )
+
+    def _open_segment(self, ts: float) -> None:
+        if self.conn is not None:
+            try:
+                self._close_segment()
+            except sqlite3.Error as e:
+                # Left open by this writer, and closed by the next compaction
+                log_error("Error closing an audit log segment", e)
+            metrics.incr("audit_log.rotations")
+            self._compact_in_background()
+        self.segment = segment_path(self.directory, ts, None, self.writer_id)
+        # Queries only ever see segments that have their tables
+        creating = f"{self.segment}.creating"
+        conn = sqlite3.connect(creating)
+        for statement in SCHEMA + INDEXES:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+        os.replace(creating, self.segment)
+        self.conn = self._connect(self.segment)
+        self.segment_opened, self.segment_count = ts, 0
+
+    def _close_segment(self) -> None:
+        conn, path = self.conn, self.segment
+        try:
+            with self._segments_lock(exclusive=True):
+                self._seal(path, conn)
+        finally:
+            conn.close()
+            self.conn, self.segment = None, None
+
+    def _seal(self, path: str, conn: sqlite3.Connection) -> None:
+        """Close a segment no longer written and rename it after its time range.
+
+        Called with the segments lock held, so that no query has the file open.
+        """
+        try:
+            first, last = conn.execute("SELECT min(ts), max(ts) FROM actions").fetchone()
+            # Closed segments are read-only files without a write-ahead log
+            conn.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            conn.close()
+        if first is None:
+            self._remove([path])
+        else:
+            os.replace(path, segment_path(self.directory, first, last, parse_segment(path)[2]))
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        ts = min(entry["ts"] for entry in batch)
+        with self.lock:
+            if self.conn is None or self._segment_full(ts):
+                self._open_segment(ts)
+            with self.conn:
+                for entry in batch:
+                    values = [
+                        json.dumps(entry.get(column), default=str)
+                        if column == "parameters"
+                        else entry.get(column)
+                        for column in ACTION_COLUMNS
+                    ]
+                    action_id = self.conn.execute(
+                        f"INSERT INTO actions ({', '.join(ACTION_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' * len(ACTION_COLUMNS))})",
+                        values,
+                    ).lastrowid
+                    recipients = entry.get("recipients") or []
+                    if recipients:
+                        self.conn.executemany(
+                            "INSERT INTO recipients VALUES (?, ?, ?, ?)",
+                            [
+                                (action_id, email.strip().lower(), entry["ts"], status)
+                                for email, status in recipients
+                            ],
+                        )
+            self.segment_count += len(batch)
+
+    def query(
+        self,
+        thread_id: Optional[str] = None,
+        tenant_id: Optional[str] = None,
+        action_type: Optional[str] = None,
+        recipient: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Recorded actions matching every given filter, latest first.
+
+        With a recipient, each record is an email action with that recipient, and
+        carries the recipient's own status, e.g. "sent".
+        """
+        columns = ", ".join(f"a.{column}" for column in ACTION_COLUMNS)
+        if recipient is not None:
+            sql = (
+                f"SELECT {columns}, r.recipient, r.status FROM recipients r "
+                "JOIN actions a ON a.id = r.action_id"
+            )
+            ts = "r.ts"
+            conditions, params = ["r.recipient = ?"], [recipient.strip().lower()]
+        else:
+            sql = f"SELECT {columns}, NULL, NULL FROM actions a"
+            ts = "a.ts"
+            conditions, params = [], []
+        for column, value in [
+            ("thread_id", thread_id),
+            ("tenant_id", tenant_id),
+            ("action_type", action_type),
+            ("status", status),
+        ]:
+            if value is not None:
+                conditions.append(f"a.{column} = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append(f"{ts} >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append(f"{ts} < ?")
+            params.append(until)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += f" ORDER BY {ts} DESC LIMIT ?"
+
+        if not os.path.isdir(self.directory):
+            return []
+        results: List[Dict[str, Any]] = []
+        # No segment is renamed or deleted while the lock is held
+        with self._segments_lock(exclusive=False):
+            # Segments of several writers overlap in time; open ones may hold the latest records
+            segments = []
+            for path in self.segments():
+                start, end, _ = parse_segment(path)
+                if end is not None and (
+                    (until is not None and start >= until) or (since is not None and end < since)
+                ):
+                    continue
+                segments.append((math.inf if end is None else end, path))
+            segments.sort(reverse=True)
+            for end, path in segments:
+                if len(results) >= limit and end < results[-1]["ts"]:
+                    break
+                conn = connect_read_only(path)
+                try:
+                    rows = conn.execute(sql, params + [limit]).fetchall()
+                finally:
+                    conn.close()
+                for row in rows:
+                    record = dict(zip(ACTION_COLUMNS, row))
+                    record["time"] = datetime.fromtimestamp(record["ts"]).isoformat()
+                    record["parameters"] = json.loads(record["parameters"] or "null")
+                    if recipient is not None:
+                        record["recipient"], record["recipient_status"] = row[-2], row[-1]
+                    results.append(record)
+                results.sort(key=lambda record: record["ts"], reverse=True)
+                del results[limit:]
+        return results
+
+    def compact(self) -> Dict[str, int]:
+        """Close abandoned segments, delete records past retention and merge small segments.
+
+        Segments open in running writers are left alone. Runs of closed segments
+        are merged while their records fit in one segment, so the number of files
+        a query opens stays low. Only one process compacts at a time.
+        """
+        result = {"closed_segments": 0, "deleted_segments": 0, "merged_segments": 0}
+        if not os.path.isdir(self.directory):
+            return {**result, "segments": 0}
+        try:
+            with self._segments_lock(exclusive=True, name=COMPACTION_LOCK, timeout=0):
+                self._compact(result)
+                metrics.incr("audit_log.compactions")
+        except sqlite3.OperationalError as e:
+            # Another process is compacting
+            if "locked" not in str(e):
+                raise
+        return {**result, "segments": len(self.segments())}
+
+    def _compact(self, result: Dict[str, int]) -> None:
+        # Segments left open by writers that exited, or by this one after a failed rotation
+        with self.lock:
+            for path in self.segments():
+                _, end, writer = parse_segment(path)
+                if end is None and path != self.segment and (
+                    writer == self.writer_id or not writer_alive(writer)
+                ):
+                    with self._segments_lock(exclusive=True):
+                        self._seal(path, sqlite3.connect(path))
+                    result["closed_segments"] += 1
+
+        cutoff = time.time() - self.retention_days * 86400 if self.retention_days else None
+        runs: List[Tuple[List[str], int]] = []
+        for path in self.segments():
+            start, end, _ = parse_segment(path)
+            if end is None:
+                continue
+            if cutoff is not None and end < cutoff:
+                with self._segments_lock(exclusive=True):
+                    self._remove([path])
+                result["deleted_segments"] += 1
+                continue
+            conn = connect_read_only(path)
+            try:
+                rows = conn.execute(
+                    "SELECT count(*) FROM actions WHERE ts >= ?", [cutoff or 0]
+                ).fetchone()[0]
+            finally:
+                conn.close()
+            if runs and runs[-1][1] + rows <= self.segment_rows:
+                runs[-1] = (runs[-1][0] + [path], runs[-1][1] + rows)
+            else:
+                runs.append(([path], rows))
+        for paths, _ in runs:
+            expiring = cutoff is not None and parse_segment(paths[0])[0] < cutoff
+            if len(paths) > 1 or expiring:
+                self._merge(paths, cutoff)
+                result["merged_segments"] += len(paths)
+
+    def _merge(self, paths: List[str], cutoff: Optional[float]) -> None:
+        """Rewrite closed segments into one file, keeping the records from cutoff on."""
+        merged = os.path.join(self.directory, f"compacting-{self.writer_id}.tmp")
+        self._remove([merged])
+        conn = sqlite3.connect(f"file:{merged}", uri=True)
+        try:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            offset = 0
+            for path in paths:
+                conn.execute("ATTACH DATABASE ? AS segment", [f"file:{path}?mode=ro"])
+                with conn:
+                    # Action IDs are shifted past those of the segments merged so far
+                    conn.execute(
+                        f"INSERT INTO actions SELECT id + ?, {', '.join(ACTION_COLUMNS)} "
+                        "FROM segment.actions WHERE ts >= ? ORDER BY id",
+                        [offset, cutoff or 0],
+                    )
+                    conn.execute(
+                        "INSERT INTO recipients SELECT action_id + ?, recipient, ts, status "
+                        "FROM segment.recipients WHERE ts >= ?",
+                        [offset, cutoff or 0],
+                    )
+                offset = conn.execute("SELECT coalesce(max(id), 0) FROM actions").fetchone()[0]
+                conn.execute("DETACH DATABASE segment")
+            # Building the indexes once the rows are in is faster than maintaining them
+            for statement in INDEXES:
+                conn.execute(statement)
+            conn.execute("ANALYZE")
+            conn.commit()
+            first, last = conn.execute("SELECT min(ts), max(ts) FROM actions").fetchone()
+        finally:
+            conn.close()
+        with self._segments_lock(exclusive=True):
+            if first is None:
+                self._remove(paths + [merged])
+                return
+            target = segment_path(self.directory, first, last, self.writer_id)
+            os.replace(merged, target)
+            self._remove([path for path in paths if path != target])
+
+    def _remove(self, paths: List[str]) -> None:
+        for path in paths:
+            for suffix in ("", "-journal", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number and size of the segments and the records waiting to be written."""
+        segments = self.segments()
+        return {
+            "segments": len(segments),
+            "open_segments": sum(1 for path in segments if parse_segment(path)[1] is None),
+            "bytes": sum(os.path.getsize(path) for path in segments if os.path.exists(path)),
+            "queued": self.queue.qsize(),
+        }
+
+
+audit_log = AuditLog()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query or compact the action audit log")
+    parser.add_argument("--dir", default=AUDIT_LOG_DIR, help="segment directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    query_parser = commands.add_parser("query", help="print matching actions as JSON Lines, newest first")
+    for name in ("thread-id", "tenant-id", "action-type", "recipient", "status"):
+        query_parser.add_argument(f"--{name}")
+    query_parser.add_argument("--since", type=parse_time, help="e.g. 7d, 2024-05-01 or a timestamp")
+    query_parser.add_argument("--until", type=parse_time)
+    query_parser.add_argument("--limit", type=int, default=100)
+    commands.add_parser("compact", help="merge small segments and delete records past retention")
+    commands.add_parser("stats", help="print the number and size of the segments")
+    args = parser.parse_args()
+
+    if args.command == "query":
+        log = AuditLog(args.dir)
+        for record in log.query(
+            args.thread_id, args.tenant_id, args.action_type, args.recipient, args.status,
+            args.since, args.until, args.limit,
+        ):
+            print(json.dumps(record))
+    elif args.command == "compact":
+        print(json.dumps(AuditLog(args.dir).compact()))
+    else:
+        print(json.dumps(AuditLog(args.dir).stats()))
@@ -0,0 +1,302 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Union
+from config import TURN_TIMEOUT, TURNS_DB
+from utils.logger import log_error
+from utils.metrics import metrics
+
+# How often waits on locks and semaphores check whether their turn was cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
+
+class TurnCancelledError(BaseException):
+    """Raised inside a conversation turn that was cancelled or ran past its deadline.
+
+    Like asyncio.CancelledError, it is not an Exception, so the handlers that turn
+    tool and LLM errors into failed results let it through.
+    """
+
+
+class CancelToken:
+    """Cancellation flag and deadline of one conversation turn, checked between units of work."""
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self.event = threading.Event()
+        # Set once the turn has unwound, so a newer turn of the thread may start
+        self.done = threading.Event()
+
+    def cancel(self, reason: str) -> None:
+        """Request cancellation; the turn stops at its next check."""
+        if self.reason is None:
+            self.reason = reason
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self.event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("turn deadline exceeded")
+        return self.event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline, or None without one."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self) -> None:
+        """Raise TurnCancelledError if the turn was cancelled or is past its deadline."""
+        if self.cancelled:
+            raise TurnCancelledError(self.reason)
+
+    def sleep(self, seconds: float) -> None:
+        """Sleep, waking up to raise TurnCancelledError as soon as the turn is cancelled."""
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self.event.wait(remaining)
+        else:
+            self.event.wait(seconds)
+        self.check()
+
+
+# Token of the turn being run; LangGraph runs nodes with the caller's context
+current_cancel_token: ContextVar[Optional[CancelToken]] = ContextVar(
+    "current_cancel_token", default=None
+)
+
+
+def check_cancelled() -> None:
+    """Raise TurnCancelledError if the current turn was cancelled; a no-op outside turns."""
+    token = current_cancel_token.get()
+    if token is not None:
+        token.check()
+
+
+def cancellation_requested() -> bool:
+    """Whether the current turn was cancelled, for loops that stop without raising."""
+    token = current_cancel_token.get()
+    return token is not None and token.cancelled
+
+
+def remaining_time(timeout: Optional[float] = None) -> Optional[float]:
+    """Cap a timeout at the time left until the current turn's deadline."""
+    token = current_cancel_token.get()
+    remaining = token.remaining() if token is not None else None
+    if remaining is None:
+        return timeout
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def cancellable_sleep(seconds: float) -> None:
+    """Sleep, raising TurnCancelledError early if the current turn is cancelled."""
+    token = current_cancel_token.get()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+def cancellable_acquire(
+    lock: Union[threading.Lock, threading.Semaphore], timeout: Optional[float] = None
+) -> bool:
+    """Acquire a lock or semaphore, raising TurnCancelledError early if the current turn is cancelled.
+
+    Returns False if the timeout passed first, like lock.acquire(timeout=...).
+    """
+    token = current_cancel_token.get()
+    if token is None:
+        # Semaphores read timeout=-1 as already expired, unlike locks
+        return lock.acquire() if timeout is None else lock.acquire(timeout=timeout)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        wait = CANCEL_POLL_INTERVAL
+        if deadline is not None:
+            wait = max(0.0, min(wait, deadline - time.monotonic()))
+        if lock.acquire(timeout=wait):
+            return True
+        token.check()
+        if deadline is not None and time.monotonic() >= deadline:
+            return False
+
+
+class TurnRegistry:
+    """Turns in flight per conversation thread, so they can be cancelled by thread_id.
+
+    A thread runs one turn at a time: starting a turn cancels the thread's turn in
+    flight, e.g. when the user sends a new message, and waits for it to unwind.
+
+    With a path, turns are also recorded in a SQLite file shared by the server's
+    processes, e.g. gunicorn workers, so a cancel request or a newer message
+    handled by one process reaches a turn running in another. Each process polls
+    the file for cancellations of its own turns every CANCEL_POLL_INTERVAL seconds
+    while it runs any, and keeps their heartbeat fresh. A turn whose heartbeat is
+    older than stale_after seconds was left by a process that died.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        heartbeat_interval: float = 2.0,
+        stale_after: float = 10.0,
+    ):
+        self.active: Dict[str, CancelToken] = {}
+        self.lock = threading.Lock()
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.heartbeat_interval = heartbeat_interval
+        self.stale_after = stale_after
+        self.conn: Optional[sqlite3.Connection] = None
+        self.db_lock = threading.Lock()
+        self.watcher: Optional[threading.Thread] = None
+        if path:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None, timeout=30
+            )
+            with self.db_lock:
+                self.conn.execute(
+                    "CREATE TABLE IF NOT EXISTS turns ("
+                    "thread_id TEXT PRIMARY KEY, owner TEXT, heartbeat REAL, cancel_reason TEXT)"
+                )
+
+    def _claim(self, thread_id: str) -> None:
+        """Record the thread's turn in the shared file, after any turn of another process unwound."""
+        superseded = False
+        while True:
+            with self.db_lock:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self.conn.execute(
+                        "SELECT owner, heartbeat FROM turns WHERE thread_id = ?", [thread_id]
+                    ).fetchone()
+                    now = time.time()
+                    if row is None or row[0] == self.owner or now - row[1] > self.stale_after:
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO turns VALUES (?, ?, ?, NULL)",
+                            [thread_id, self.owner, now],
+                        )
+                        self.conn.execute("COMMIT")
+                        return
+                    if not superseded:
+                        self.conn.execute(
+                            "UPDATE turns SET cancel_reason = 'superseded by a newer message' "
+                            "WHERE thread_id = ? AND cancel_reason IS NULL",
+                            [thread_id],
+                        )
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            if not superseded:
+                metrics.incr("turns.superseded")
+                superseded = True
+            time.sleep(CANCEL_POLL_INTERVAL)
+
+    def _release(self, thread_id: str) -> None:
+        with self.db_lock:
+            self.conn.execute(
+                "DELETE FROM turns WHERE thread_id = ? AND owner = ?", [thread_id, self.owner]
+            )
+
+    def _watch(self) -> None:
+        """Deliver cancellations requested through the shared file to this process's turns."""
+        last_heartbeat = 0.0
+        while True:
+            time.sleep(CANCEL_POLL_INTERVAL)
+            with self.lock:
+                if not self.active:
+                    self.watcher = None
+                    return
+            try:
+                with self.db_lock:
+                    requested = self.conn.execute(
+                        "SELECT thread_id, cancel_reason FROM turns "
+                        "WHERE owner = ? AND cancel_reason IS NOT NULL",
+                        [self.owner],
+                    ).fetchall()
+                    if time.time() - last_heartbeat >= self.heartbeat_interval:
+                        last_heartbeat = time.time()
+                        self.conn.execute(
+                            "UPDATE turns SET heartbeat = ? WHERE owner = ?",
+                            [last_heartbeat, self.owner],
+                        )
+            except sqlite3.Error as e:
+                log_error("Error polling turn cancellations", e)
+                continue
+            for thread_id, reason in requested:
+                with self.lock:
+                    token = self.active.get(thread_id)
+                if token is not None:
+                    token.cancel(reason)
+
+    @contextmanager
+    def turn(self, thread_id: str, timeout: Optional[float] = TURN_TIMEOUT) -> Iterator[CancelToken]:
+        """Run the enclosed turn of a thread under a new cancel token and deadline."""
+        token = CancelToken(timeout)
+        while True:
+            with self.lock:
+                previous = self.active.get(thread_id)
+                if previous is None:
+                    self.active[thread_id] = token
+                    break
+            previous.cancel("superseded by a newer message")
+            metrics.incr("turns.superseded")
+            previous.done.wait()
+        try:
+            if self.conn is not None:
+                self._claim(thread_id)
+                with self.lock:
+                    if self.watcher is None:
+                        self.watcher = threading.Thread(target=self._watch, daemon=True)
+                        self.watcher.start()
+        except BaseException:
+            with self.lock:
+                del self.active[thread_id]
+            token.done.set()
+            raise
+        reset = current_cancel_token.set(token)
+        try:
+            yield token
+        finally:
+            current_cancel_token.reset(reset)
+            if self.conn is not None:
+                self._release(thread_id)
+            with self.lock:
+                if self.active.get(thread_id) is token:
+                    del self.active[thread_id]
+            token.done.set()
+
+    def cancel(self, thread_id: str, reason: str = "cancelled by the user") -> bool:
+        """Cancel the turn in flight of a thread, in any process; returns whether there was one."""
+        with self.lock:
+            token = self.active.get(thread_id)
+        if token is not None:
+            token.cancel(reason)
+        elif self.conn is None:
+            return False
+        else:
+            with self.db_lock:
+                cursor = self.conn.execute(
+                    "UPDATE turns SET cancel_reason = ? "
+                    "WHERE thread_id = ? AND cancel_reason IS NULL AND heartbeat > ?",
+                    [reason, thread_id, time.time() - self.stale_after],
+                )
+            if not cursor.rowcount:
+                return False
+        metrics.incr("turns.cancel_requests")
+        return True
+
+    def in_flight(self) -> int:
+        """Number of turns currently running in this process."""
+        with self.lock:
+            return len(self.active)
+
+
+turns = TurnRegistry(TURNS_DB)
+
@@ -1,19 +1,38 @@
-import os
 import smtplib
+from concurrent.futures import ThreadPoolExecutor
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-from typing import List, Optional
-from config import GMAIL_EMAIL, GMAIL_APP_PASSWORD
+from string import Template
+from typing import Any, Dict, List, Optional, Tuple, Union
+from config import (
+    GMAIL_EMAIL,
+    GMAIL_APP_PASSWORD,
+    EMAIL_RENDER_WORKERS,
+    EMAIL_COMPRESS_CSV,
+)
+from utils.attachments import EncodedAttachment, StreamedMessage
+from utils.cancellation import TurnCancelledError, cancellation_requested
+from utils.rate_limit import get_limiter
 
 
 class GmailSender:
-    def __init__(self, email: str, app_password: str):
+    def __init__(
+        self,
+        email: str,
+        app_password: str,
+        smtp_server: str = "smtp.gmail.com",
+        smtp_port: int = 587,
+        use_tls: bool = True,
+        compress_csv: bool = EMAIL_COMPRESS_CSV,
+    ):
         """Initialize with Gmail address and app password."""
         self.email = email
         self.app_password = app_password
-        self.smtp_server = "smtp.gmail.com"
-        self.smtp_port = 587
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.use_tls = use_tls
+        self.compress_csv = compress_csv
+        self.limiter = get_limiter("smtp")
 
     def create_message(
         self,
@@ -21,9 +40,9 @@ class GmailSender:
         to: str,
         subject: str,
         body: str,
-        attachments: Optional[List[str]] = None,
-    ) -> MIMEMultipart:
-        """Create a message with optional attachments."""
+        attachments: Optional[List[Union[str, EncodedAttachment]]] = None,
+    ) -> Union[MIMEMultipart, StreamedMessage]:
+        """Create a message, streaming any attachments from disk when it is sent."""
         message = MIMEMultipart()
         message["to"] = to
         message["from"] = sender
@@ -33,25 +52,69 @@ class GmailSender:
         msg = MIMEText(body)
         message.attach(msg)
 
-        # Add attachments
-        if attachments:
-            for file_path in attachments:
-                with open(file_path, "rb") as f:
-                    part = MIMEApplication(f.read(), Name=os.path.basename(file_path))
-                part["Content-Disposition"] = (
-                    f'attachment; filename="{os.path.basename(file_path)}"'
-                )
-                message.attach(part)
+        if not attachments:
+            return message
+        return StreamedMessage(message, self.encode_attachments(attachments))
 
-        return message
+    def encode_attachment(self, file_path: str) -> EncodedAttachment:
+        """Encode an attachment once so it can be streamed into any number of messages."""
+        compress = self.compress_csv and file_path.lower().endswith(".csv")
+        return EncodedAttachment(file_path, compress=compress)
 
-    def send_message(self, message: MIMEMultipart) -> None:
-        """Send the message using SMTP."""
+    def encode_attachments(
+        self, attachments: Optional[List[Union[str, EncodedAttachment]]]
+    ) -> List[EncodedAttachment]:
+        """Encode every attachment that is not encoded yet."""
+        return [
+            attachment
+            if isinstance(attachment, EncodedAttachment)
+            else self.encode_attachment(attachment)
+            for attachment in attachments or []
+        ]
+
+    def _open_session(self) -> smtplib.SMTP:
+        """Connect and log in to the SMTP server."""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
         try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            if self.use_tls:
                 server.starttls()
+            if self.app_password:
                 server.login(self.email, self.app_password)
-                server.send_message(message)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    @staticmethod
+    def _transmit(
+        server: smtplib.SMTP, message: Union[MIMEMultipart, StreamedMessage]
+    ) -> None:
+        """Send a message over an open session."""
+        if isinstance(message, StreamedMessage):
+            message.send(server)
+        else:
+            server.send_message(message)
+
+    @staticmethod
+    def _close_session(server: smtplib.SMTP) -> None:
+        """End a session, dropping the connection if the server does not answer QUIT."""
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            try:
+                server.close()
+            except OSError:
+                pass
+
+    def _send(self, message: Union[MIMEMultipart, StreamedMessage]) -> None:
+        """Open an SMTP session and send the message."""
+        with self._open_session() as server:
+            self._transmit(server, message)
+
+    def send_message(self, message: Union[MIMEMultipart, StreamedMessage]) -> None:
+        """Send the message using SMTP under the shared SMTP rate limiter."""
+        try:
+            self.limiter.call(self._send, message, idempotent=False)
         except Exception as e:
             raise Exception(f"Error sending message: {str(e)}")
 
@@ -61,9 +124,10 @@ class GmailSender:
         to: str,
         subject: str,
         body: str,
-        attachments: Optional[List[str]] = None,
+        attachments: Optional[List[Union[str, EncodedAttachment]]] = None,
     ) -> None:
         """Send an email with optional attachments."""
+        encoded = []
         try:
             # Validate inputs
             if not all([sender, to, subject]):
@@ -75,10 +139,108 @@ class GmailSender:
             elif isinstance(body, list):
                 body = "\n".join(body)
 
-            message = self.create_message(sender, to, subject, body, attachments)
+            encoded = self.encode_attachments(attachments)
+            message = self.create_message(sender, to, subject, body, encoded)
             self.send_message(message)
         except Exception as e:
             raise Exception(f"Failed to send email: {str(e)}")
+        finally:
+            # Only release the attachments encoded for this email
+            for attachment in encoded:
+                if attachment not in (attachments or []):
+                    attachment.close()
+
+    def render_messages(
+        self,
+        sender: str,
+        recipients: List[str],
+        subject: str,
+        body: str,
+        variables: Optional[Dict[str, Dict[str, Any]]] = None,
+        attachments: Optional[List[EncodedAttachment]] = None,
+    ) -> List[Tuple[str, Union[MIMEMultipart, StreamedMessage]]]:
+        """Render the subject and body templates per recipient and build the messages in parallel.
+
+        Templates use string.Template syntax ($recipient, ${name}, ...); variables maps
+        each recipient to its own template values.
+        """
+        subject_template = Template(subject)
+        body_template = Template(body)
+        variables = variables or {}
+
+        def build(recipient: str) -> Tuple[str, Union[MIMEMultipart, StreamedMessage]]:
+            values = {"recipient": recipient, **variables.get(recipient, {})}
+            return recipient, self.create_message(
+                sender,
+                recipient,
+                subject_template.safe_substitute(values),
+                body_template.safe_substitute(values),
+                attachments,
+            )
+
+        with ThreadPoolExecutor(max_workers=EMAIL_RENDER_WORKERS) as pool:
+            return list(pool.map(build, recipients))
+
+    def send_bulk(
+        self,
+        sender: str,
+        recipients: List[str],
+        subject: str,
+        body: str,
+        variables: Optional[Dict[str, Dict[str, Any]]] = None,
+        attachments: Optional[List[str]] = None,
+    ) -> Dict[str, str]:
+        """Send a templated email to every recipient over a shared SMTP session.
+
+        Each message is sent under the SMTP rate limiter, which retries transient
+        failures on a new session. Returns a mapping of recipient to "sent" or the
+        reason it failed, e.g. "cancelled" for recipients left when the conversation
+        turn was cancelled. A failure never discards the results of the recipients
+        already sent to.
+        """
+        if not sender or not subject:
+            raise ValueError("Sender and subject are required")
+
+        results = {}
+        server = None
+
+        def send(message: Union[MIMEMultipart, StreamedMessage]) -> None:
+            nonlocal server
+            if server is None:
+                server = self._open_session()
+            try:
+                self._transmit(server, message)
+            except (smtplib.SMTPServerDisconnected, OSError):
+                # The shared session is broken; the next message opens a new one
+                self._close_session(server)
+                server = None
+                raise
+
+        # Encode each attachment once and stream it into every recipient's message
+        encoded = self.encode_attachments(attachments)
+        try:
+            messages = self.render_messages(
+                sender, recipients, subject, body or "", variables, encoded
+            )
+            for recipient, message in messages:
+                # Emails already sent stay sent; the rest are skipped once the turn is cancelled
+                if cancellation_requested():
+                    results[recipient] = "cancelled"
+                    continue
+                try:
+                    self.limiter.call(send, message, idempotent=False)
+                    results[recipient] = "sent"
+                except TurnCancelledError:
+                    results[recipient] = "cancelled"
+                except Exception as e:
+                    results[recipient] = f"failed: {str(e)}"
+        finally:
+            if server is not None:
+                self._close_session(server)
+            for attachment in encoded:
+                if attachment not in (attachments or []):
+                    attachment.close()
+        return results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+from config import IDEMPOTENCY_DB, IDEMPOTENCY_TTL, IDEMPOTENCY_CLAIM_TIMEOUT
+from interface import Plan
+from utils.cancellation import cancellable_sleep
+
+# Actions whose side effects must not be repeated when a plan is executed twice
+SIDE_EFFECT_ACTIONS = {"create_sheet", "export_sheet", "send_email", "send_bulk_email"}
+
+
+def plan_hash(plan: Plan) -> str:
+    """Hash the goal, actions and confirmation ID of a plan, ignoring execution status."""
+    content = {
+        "confirmation_id": plan.get("confirmation_id"),
+        "goal": plan.get("goal"),
+        "actions": [
+            {
+                "action_type": action.get("action_type"),
+                "description": action.get("description"),
+                "parameters": action.get("parameters"),
+            }
+            for action in plan.get("actions", [])
+        ],
+    }
+    data = json.dumps(content, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def idempotency_key(thread_id: str, plan: Plan, index: int) -> str:
+    """Derive the key of one action of a plan executed in a conversation thread.
+
+    Duplicate confirmations of a draft share its keys; the same plan drafted again
+    gets a new confirmation ID, so it executes again.
+    """
+    return f"{thread_id}:{plan_hash(plan)[:32]}:{index}"
+
+
+class IdempotencyStore:
+    """Durable record of executed actions, so re-executions replay results instead of side effects."""
+
+    def __init__(
+        self,
+        path: str = IDEMPOTENCY_DB,
+        ttl: float = IDEMPOTENCY_TTL,
+        claim_timeout: float = IDEMPOTENCY_CLAIM_TIMEOUT,
+        poll_interval: float = 0.05,
+    ):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.claim_timeout = claim_timeout
+        self.poll_interval = poll_interval
+        self.conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS actions ("
+                "key TEXT PRIMARY KEY, status TEXT, result TEXT, updated_at REAL)"
+            )
+            self.conn.execute(
+                "DELETE FROM actions WHERE status = 'completed' AND updated_at < ?",
+                [time.time() - ttl],
+            )
+
+    def claim(self, key: str) -> Optional[Dict[str, Any]]:
+        """Claim an action before executing it.
+
+        Returns None if the caller now owns the action and must execute it, or the
+        recorded result if it already completed. Waits while another execution of the
+        same action is in progress, taking over claims older than the claim timeout.
+        Raises TurnCancelledError if the current turn is cancelled while waiting.
+        """
+        while True:
+            with self.lock:
+                self.conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self.conn.execute(
+                        "SELECT status, result, updated_at FROM actions WHERE key = ?",
+                        [key],
+                    ).fetchone()
+                    now = time.time()
+                    if (
+                        row is None
+                        or (row[0] == "pending" and now - row[2] > self.claim_timeout)
+                        or (row[0] == "completed" and now - row[2] > self.ttl)
+                    ):
+                        self.conn.execute(
+                            "INSERT OR REPLACE INTO actions VALUES (?, 'pending', NULL, ?)",
+                            [key, now],
+                        )
+                        self.conn.execute("COMMIT")
+                        return None
+                    self.conn.execute("COMMIT")
+                except Exception:
+                    self.conn.execute("ROLLBACK")
+                    raise
+            if row[0] == "completed":
+                return json.loads(row[1])
+            cancellable_sleep(self.poll_interval)
+
+    def complete(self, key: str, result: Dict[str, Any]) -> None:
+        """Record the result of a claimed action."""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE actions SET status = 'completed', result = ?, updated_at = ? WHERE key = ?",
+                [json.dumps(result, default=str), time.time(), key],
+            )
+
+    def release(self, key: str) -> None:
+        """Give up a claim without recording a result, e.g. after a failure, so it can be retried."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM actions WHERE key = ? AND status = 'pending'", [key]
+            )
+
+
+idempotency_store = IdempotencyStore()
+
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from config import (
+    JOB_WORKERS,
+    JOB_QUEUE_SIZE,
+    JOB_STORE_DB,
+    JOB_TTL,
+    TOOL_CONCURRENCY,
+    DEFAULT_TOOL_CONCURRENCY,
+)
+from utils.cancellation import cancellable_acquire
+from utils.logger import log_error
+from utils.metrics import metrics
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+
+class ToolLimiter:
+    """Bound the number of concurrent calls per tool type across all workers."""
+
+    def __init__(self, limits: Dict[str, int], default: int):
+        self.limits = limits
+        self.default = default
+        self.semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self.lock = threading.Lock()
+
+    def _semaphore(self, tool_type: str) -> threading.BoundedSemaphore:
+        """Return the semaphore for a tool type, creating it on first use."""
+        with self.lock:
+            if tool_type not in self.semaphores:
+                self.semaphores[tool_type] = threading.BoundedSemaphore(
+                    self.limits.get(tool_type, self.default)
+                )
+            return self.semaphores[tool_type]
+
+    @contextmanager
+    def slot(self, tool_type: str) -> Iterator[None]:
+        """Hold one of the concurrency slots of a tool type for the enclosed block."""
+        semaphore = self._semaphore(tool_type)
+        with metrics.timer(f"tools.{tool_type}.slot_wait"):
+            cancellable_acquire(semaphore)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+def expiry_cutoff(ttl: float) -> str:
+    """The finished_at before which finished jobs are evicted, as an ISO timestamp."""
+    return (datetime.now() - timedelta(seconds=ttl)).isoformat()
+
+
+class MemoryJobStore:
+    """Keep job records in process memory, evicting finished jobs after ttl seconds.
+
+    Records are only visible to the process that ran the job, so with several server
+    workers a poll of /jobs/{job_id} reaching another worker finds no job.
+    """
+
+    def __init__(self, ttl: float = JOB_TTL):
+        self.ttl = ttl
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def save(self, job: Dict[str, Any]) -> None:
+        """Store a new job record, evicting expired ones."""
+        cutoff = expiry_cutoff(self.ttl)
+        with self.lock:
+            for job_id in [
+                job_id
+                for job_id, record in self.jobs.items()
+                if record["finished_at"] and record["finished_at"] < cutoff
+            ]:
+                del self.jobs[job_id]
+            self.jobs[job["job_id"]] = dict(job)
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        """Update fields of a job record."""
+        with self.lock:
+            self.jobs[job_id].update(fields)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of a job record, or None if unknown."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+
+class SQLiteJobStore:
+    """Keep job records in a SQLite database shared by the server's processes.
+
+    Records survive restarts and are visible to every worker, whichever ran the job.
+    Finished jobs are evicted after ttl seconds.
+    """
+
+    FIELDS = ["job_id", "status", "created_at", "finished_at", "result", "error"]
+
+    def __init__(self, path: str, ttl: float = JOB_TTL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.ttl = ttl
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "job_id TEXT PRIMARY KEY, status TEXT, created_at TEXT, "
+                "finished_at TEXT, result TEXT, error TEXT)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)"
+            )
+
+    def save(self, job: Dict[str, Any]) -> None:
+        """Store a new job record, evicting expired ones."""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "DELETE FROM jobs WHERE finished_at < ?", [expiry_cutoff(self.ttl)]
+            )
+            self.conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?)",
+                [job.get("job_id"), job.get("status"), job.get("created_at"),
+                 job.get("finished_at"), json.dumps(job.get("result")), job.get("error")],
+            )
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        """Update fields of a job record."""
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        columns = ", ".join(f"{key} = ?" for key in fields)
+        with self.lock, self.conn:
+            self.conn.execute(
+                f"UPDATE jobs SET {columns} WHERE job_id = ?",
+                [*fields.values(), job_id],
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job record, or None if unknown."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE job_id = ?", [job_id]
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(self.FIELDS, row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+
+class JobQueue:
+    """Bounded asyncio job queue drained by a pool of workers running jobs in threads."""
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        max_size: int = JOB_QUEUE_SIZE,
+        store: Any = None,
+    ):
+        self.workers = workers
+        self.max_size = max_size
+        if store is None:
+            store = SQLiteJobStore(JOB_STORE_DB) if JOB_STORE_DB else MemoryJobStore()
+        self.store = store
+        self.queue: Optional[asyncio.Queue] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        """Start the worker pool on the running event loop."""
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Stop the workers, leaving unfinished jobs queued."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        self.executor.shutdown(wait=False)
+
+    def submit(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> str:
+        """Queue a job and return its ID; raises QueueFullError when at capacity.
+
+        The job is recorded before it is queued, so a worker never updates a job
+        that has no record yet.
+        """
+        if self.queue is None:
+            raise RuntimeError("Job queue has not been started")
+        job_id = uuid.uuid4().hex
+        self.store.save(
+            {
+                "job_id": job_id,
+                "status": "queued",
+                "created_at": datetime.now().isoformat(),
+                "finished_at": None,
+                "result": None,
+                "error": None,
+            }
+        )
+        try:
+            self.queue.put_nowait((job_id, fn, args, kwargs))
+        except asyncio.QueueFull:
+            self.store.update(
+                job_id, status="rejected", finished_at=datetime.now().isoformat()
+            )
+            metrics.incr("jobs.rejected")
+            raise QueueFullError("Job queue is full, retry later")
+        metrics.incr("jobs.submitted")
+        return job_id
+
+    async def _worker(self) -> None:
+        """Take jobs off the queue and run them until cancelled."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id, fn, args, kwargs = await self.queue.get()
+            try:
+                self.store.update(job_id, status="running")
+                with metrics.timer("jobs.run"):
+                    result = await loop.run_in_executor(
+                        self.executor, lambda: fn(*args, **kwargs)
+                    )
+                if hasattr(result, "model_dump"):
+                    result = result.model_dump()
+                self.store.update(
+                    job_id,
+                    status="completed",
+                    result=result,
+                    finished_at=datetime.now().isoformat(),
+                )
+                metrics.incr("jobs.completed")
+            except Exception as e:
+                log_error(f"Background job {job_id} failed", e)
+                self.store.update(
+                    job_id,
+                    status="failed",
+                    error=str(e),
+                    finished_at=datetime.now().isoformat(),
+                )
+                metrics.incr("jobs.failed")
+            finally:
+                self.queue.task_done()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the record of a job, or None if unknown."""
+        return self.store.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the current queue depth and capacity."""
+        return {
+            "queued": self.queue.qsize() if self.queue else 0,
+            "max_size": self.max_size,
+            "workers": self.workers,
+        }
+
+
+tool_limiter = ToolLimiter(TOOL_CONCURRENCY, DEFAULT_TOOL_CONCURRENCY)
+
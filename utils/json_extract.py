@@ -0,0 +1,137 @@
+import json
+import re
+from typing import Any, Optional, Tuple
+from utils.metrics import metrics
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+MAX_CANDIDATES = 20
+
+_decoder = json.JSONDecoder()
+
+
+class JSONExtractionError(ValueError):
+    """Raised when no JSON value of the expected type can be recovered from a text."""
+
+
+def strip_code_fences(text: str) -> str:
+    """Return the contents of the first fenced code block, or the text itself."""
+    start = text.find("```")
+    if start == -1:
+        return text
+    start = text.find("\n", start)
+    if start == -1:
+        return text
+    end = text.find("```", start)
+    return text[start + 1 : end if end != -1 else len(text)]
+
+
+def at_end(text: str, position: int, value: Any) -> bool:
+    """Whether a scalar ends the text, with nothing after it to show it is complete."""
+    return not isinstance(value, (list, dict)) and WHITESPACE.match(text, position).end() >= len(text)
+
+
+def decode_lenient(text: str, position: int) -> Tuple[Any, int, bool]:
+    """Decode the value at a position, tolerating trailing or missing commas and truncation.
+
+    Returns the value, its end and whether it was cut off. Incomplete list elements
+    are dropped; incomplete object members are kept only if they are containers. A
+    scalar at the very end of the text may be cut short ("12" of "125"), so it counts
+    as incomplete.
+    """
+    try:
+        value, end = _decoder.raw_decode(text, position)
+        return value, end, False
+    except json.JSONDecodeError:
+        if position >= len(text) or text[position] not in "[{":
+            raise
+    is_list = text[position] == "["
+    container = [] if is_list else {}
+    position += 1
+    while True:
+        position = WHITESPACE.match(text, position).end()
+        if position >= len(text):
+            return container, position, True
+        char = text[position]
+        if char in "]}":
+            return container, position + 1, False
+        if char == ",":
+            position += 1
+            continue
+        try:
+            if is_list:
+                value, position, truncated = decode_lenient(text, position)
+                if truncated or at_end(text, position, value):
+                    return container, len(text), True
+                container.append(value)
+            else:
+                key, position = _decoder.raw_decode(text, position)
+                position = WHITESPACE.match(text, position).end()
+                if text[position : position + 1] != ":":
+                    return container, len(text), True
+                position = WHITESPACE.match(text, position + 1).end()
+                value, position, truncated = decode_lenient(text, position)
+                if truncated or at_end(text, position, value):
+                    if truncated and isinstance(value, (list, dict)):
+                        container[key] = value
+                    return container, len(text), True
+                container[key] = value
+        except json.JSONDecodeError:
+            return container, len(text), True
+
+
+def extract_json(text: str, expect: Optional[type] = None) -> Any:
+    """Extract a JSON value (optionally a dict or list) from an LLM response.
+
+    Tries a plain parse, then each opening bracket after stripping code fences and
+    preambles, and finally repairs trailing commas and truncated output.
+    """
+    return extract_json_repaired(text, expect)[0]
+
+
+def extract_json_repaired(text: str, expect: Optional[type] = None) -> Tuple[Any, bool]:
+    """Extract a JSON value like extract_json, and whether it had to be repaired."""
+    text = text.strip()
+    try:
+        value = json.loads(text)
+        if expect is None or isinstance(value, expect):
+            return value, False
+    except json.JSONDecodeError:
+        pass
+
+    text = strip_code_fences(text)
+    openers = re.compile({dict: r"\{", list: r"\["}.get(expect, r"[{\[]"))
+    # Keep the longest top-level value, remembering the first candidate that failed to parse
+    best, best_start, best_end, failed = None, None, None, None
+    position = 0
+    for _ in range(MAX_CANDIDATES):
+        match = openers.search(text, position)
+        if match is None:
+            break
+        start = match.start()
+        try:
+            value, end = _decoder.raw_decode(text, start)
+        except json.JSONDecodeError:
+            if failed is None:
+                failed = start
+            position = start + 1
+            continue
+        if (expect is None or isinstance(value, expect)) and (
+            best_start is None or end - start > best_end - best_start
+        ):
+            best, best_start, best_end = value, start, end
+        position = end
+
+    # A truncated or malformed value enclosing the best candidate is the real answer
+    if failed is not None and (best_start is None or failed < best_start):
+        value, end, _ = decode_lenient(text, failed)
+        if (expect is None or isinstance(value, expect)) and (
+            best_start is None or end >= best_end
+        ):
+            metrics.incr("llm.json.repaired")
+            return value, True
+    if best_start is not None:
+        return best, False
+    raise JSONExtractionError(
+        f"No JSON {getattr(expect, '__name__', 'value')} found in response"
+    )
+
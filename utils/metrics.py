@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+
+class Metrics:
+    """Thread-safe in-process counters and timings."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """Increment a counter."""
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Record a duration sample."""
+        with self._lock:
+            timing = self._timings.setdefault(
+                name, {"count": 0, "total": 0.0, "max": 0.0}
+            )
+            timing["count"] += 1
+            timing["total"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Time the enclosed block and record it under the given name."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a copy of all counters and timings."""
+        with self._lock:
+            timings = {
+                name: {
+                    **timing,
+                    "avg": timing["total"] / timing["count"] if timing["count"] else 0.0,
+                }
+                for name, timing in self._timings.items()
+            }
+            return {"counters": dict(self._counters), "timings": timings}
+
+    def reset(self) -> None:
+        """Clear all recorded metrics."""
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
+
+# Token totals of the LLM calls made in the current context, while tracked
+_usage_tracker: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "usage_tracker", default=None
+)
+
+
+@contextmanager
+def track_llm_usage() -> Iterator[Dict[str, float]]:
+    """Collect the token usage of the LLM calls made in the enclosed block."""
+    usage: Dict[str, float] = defaultdict(float)
+    token = _usage_tracker.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage_tracker.reset(token)
+
+
+def record_llm_usage(purpose: str, response: Any, elapsed: float) -> None:
+    """Record latency and token usage of an LLM response for the given purpose."""
+    metrics.observe(f"llm.{purpose}.latency", elapsed)
+    metrics.incr(f"llm.{purpose}.calls")
+    usage = getattr(response, "usage_metadata", None) or {}
+    tracker = _usage_tracker.get()
+    for key in ("input_tokens", "output_tokens", "total_tokens"):
+        if key in usage:
+            metrics.incr(f"llm.{purpose}.{key}", usage[key])
+            if tracker is not None:
+                tracker[key] += usage[key]
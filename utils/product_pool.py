@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import uuid
+import zlib
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional
+from config import (
+    PRODUCT_CATEGORIES,
+    PRODUCT_POOL_LOW_WATER,
+    PRODUCT_POOL_HIGH_WATER,
+    PRODUCT_POOL_BATCH,
+    PRODUCT_POOL_PATH,
+)
+from utils.logger import log_error
+from utils.metrics import metrics
+from utils.tenants import unaccounted
+
+REQUIRED_FIELDS = [
+    "product_id", "name", "description", "price",
+    "category", "stock_quantity", "rating", "created_at",
+]
+
+# Word lists and price ranges for the offline fallback generator
+FAKE_CATALOG = {
+    "electronics": (["Wireless", "Smart", "Portable", "Ultra"], ["Headphones", "Speaker", "Charger", "Monitor"], (19.0, 899.0)),
+    "clothing": (["Classic", "Slim", "Organic", "Everyday"], ["T-Shirt", "Jacket", "Jeans", "Sneakers"], (9.0, 199.0)),
+    "books": (["The Silent", "A Brief", "Modern", "Hidden"], ["Garden", "History", "Cookbook", "Journey"], (5.0, 49.0)),
+    "home": (["Ceramic", "Bamboo", "Cozy", "Minimal"], ["Lamp", "Mug Set", "Blanket", "Shelf"], (8.0, 249.0)),
+    "sports": (["Pro", "Trail", "Flex", "Endurance"], ["Yoga Mat", "Water Bottle", "Running Shoes", "Dumbbells"], (7.0, 299.0)),
+}
+
+
+# Pool files of one process: "<path>.<owner>", or "<path>.<owner>.claimed-<claimer>"
+# while another process is taking over the products of an owner that exited
+POOL_FILE_PATTERN = re.compile(r"(\d+-[0-9a-f]+)(?:\.claimed-(\d+-[0-9a-f]+))?$")
+
+
+def stable_product_id(category: str, name: str) -> str:
+    """Return the ID of the product with a name in a category, the same whenever it is generated."""
+    key = f"{category}:{' '.join(name.lower().split())}"
+    return f"PRD-{hashlib.blake2b(key.encode(), digest_size=8).hexdigest().upper()}"
+
+
+def owner_alive(owner: str, current: str) -> bool:
+    """Whether the process that owns a pool file may still be using it."""
+    pid = int(owner.split("-")[0])
+    if pid == os.getpid():
+        return owner == current
+    if os.name != "posix":
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fake_products(num_products: int, category: str, seed: int = 0) -> List[Dict[str, Any]]:
+    """Generate deterministic sample products locally, without the LLM."""
+    rng = random.Random(zlib.crc32(f"{category}:{seed}".encode()))
+    adjectives, nouns, (low, high) = FAKE_CATALOG.get(
+        category, (["Sample"], ["Item"], (5.0, 99.0))
+    )
+    base_date = datetime(2024, 1, 1)
+    products = []
+    for i in range(num_products):
+        name = f"{rng.choice(adjectives)} {rng.choice(nouns)} {rng.randint(100, 999)}"
+        products.append(
+            {
+                "product_id": f"FAKE-{category[:3].upper()}-{seed:06d}-{i:04d}",
+                "name": name,
+                "description": f"{name} from our {category} collection.",
+                "price": round(rng.uniform(low, high), 2),
+                "category": category,
+                "stock_quantity": rng.randint(0, 500),
+                "rating": round(rng.uniform(1.0, 5.0), 1),
+                "created_at": (base_date + timedelta(days=rng.randint(0, 365))).isoformat(),
+            }
+        )
+    return products
+
+
+def validate_product(product: Dict[str, Any]) -> Dict[str, Any]:
+    """Check and coerce the fields of a product, raising ValueError if it is invalid."""
+    if not all(field in product for field in REQUIRED_FIELDS):
+        raise ValueError("Invalid product structure")
+    return {
+        **product,
+        "name": str(product["name"]),
+        "description": str(product["description"]),
+        "price": float(product["price"]),
+        "category": str(product["category"]).lower(),
+        "stock_quantity": int(product["stock_quantity"]),
+        "rating": min(5.0, max(1.0, float(product["rating"]))),
+        "created_at": str(product["created_at"]),
+    }
+
+
+class ProductPool:
+    """Buffer of validated products per category, refilled in the background.
+
+    Product IDs are derived from the category and name, so a product keeps its ID when
+    it is generated again. A category buffers each product at most once and take()
+    returns each product at most once, but a product generated again after it was
+    taken can be served again, under the same ID.
+
+    Each buffered product is served once across restarts: each process persists its
+    own buffers to "<path>.<owner>" and appends the IDs of the products it takes to
+    "<path>.<owner>.consumed" until the next save. load() takes over the files of
+    processes that exited. Refills serve every tenant, so their LLM calls are not
+    accounted to any.
+    """
+
+    def __init__(
+        self,
+        generator: Any,
+        categories: List[str] = PRODUCT_CATEGORIES,
+        low_water: int = PRODUCT_POOL_LOW_WATER,
+        high_water: int = PRODUCT_POOL_HIGH_WATER,
+        batch_size: int = PRODUCT_POOL_BATCH,
+        path: Optional[str] = PRODUCT_POOL_PATH,
+    ):
+        self.generator = generator
+        self.categories = categories
+        self.low_water = low_water
+        self.high_water = high_water
+        self.batch_size = batch_size
+        self.path = path
+        self.buffers: Dict[str, Deque[Dict[str, Any]]] = {
+            category: deque() for category in categories
+        }
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.file = f"{path}.{self.owner}"
+        self.consumed = f"{self.file}.consumed"
+        self.persisted = False
+        self.fake_seed = 0
+        self.next_category = 0
+        self.lock = threading.Lock()
+        self.refilling = False
+
+    def load(self) -> None:
+        """Take over the buffered products persisted by processes that exited.
+
+        Called when a server starts rather than on import, so that importing the tools
+        does not claim other processes' files.
+        """
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path) or "."
+        prefix = f"{os.path.basename(self.path)}."
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return
+        claimed = []
+        for name in names:
+            match = POOL_FILE_PATTERN.fullmatch(name[len(prefix):]) if name.startswith(prefix) else None
+            if not match:
+                continue
+            owner, claimer = match.groups()
+            if owner_alive(claimer or owner, self.owner):
+                continue
+            base = f"{self.path}.{owner}"
+            # Renaming is atomic: only one process takes over each file
+            try:
+                os.rename(os.path.join(directory, name), f"{base}.claimed-{self.owner}")
+            except FileNotFoundError:
+                continue
+            claimed.append(base)
+            self._load_file(base)
+        if claimed:
+            self._save()
+            for base in claimed:
+                for suffix in (f".claimed-{self.owner}", ".consumed", ".consumed.old"):
+                    try:
+                        os.remove(f"{base}{suffix}")
+                    except FileNotFoundError:
+                        pass
+
+    def _load_file(self, base: str) -> None:
+        """Add the products of a claimed pool file that were not consumed."""
+        consumed = set()
+        for marker in (f"{base}.consumed", f"{base}.consumed.old"):
+            try:
+                with open(marker) as f:
+                    consumed.update(line.strip() for line in f)
+            except FileNotFoundError:
+                pass
+        try:
+            with open(f"{base}.claimed-{self.owner}") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log_error("Error loading product pool", e)
+            return
+        buffered = {p["product_id"] for products in self.buffers.values() for p in products}
+        for category, products in state.get("buffers", {}).items():
+            if category in self.buffers:
+                self.buffers[category].extend(
+                    p for p in products
+                    if p.get("product_id") not in consumed and p.get("product_id") not in buffered
+                )
+        self.fake_seed = max(self.fake_seed, state.get("fake_seed", 0))
+
+    def _save(self) -> None:
+        """Persist the buffered products and drop the consumed IDs they no longer include."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock:
+            state = {
+                "buffers": {c: list(products) for c, products in self.buffers.items()},
+                "fake_seed": self.fake_seed,
+            }
+            self.persisted = True
+            # Products taken from now on are in the saved buffers, so keep marking them.
+            # Earlier IDs stay marked in ".old" until the new buffers replace the file.
+            if os.path.exists(self.consumed):
+                with open(self.consumed) as src, open(f"{self.consumed}.old", "a") as dst:
+                    dst.write(src.read())
+                os.remove(self.consumed)
+        with open(f"{self.file}.tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(f"{self.file}.tmp", self.file)
+        try:
+            os.remove(f"{self.consumed}.old")
+        except FileNotFoundError:
+            pass
+
+    def _generate(self, num_products: int, category: str) -> List[Dict[str, Any]]:
+        """Generate validated products for a category, falling back to local fake data.
+
+        Products repeated within the batch are dropped.
+        """
+        try:
+            products = self.generator.generate_products(num_products, category=category)
+            metrics.incr("product_pool.llm_batches")
+        except Exception as e:
+            log_error(f"LLM product generation failed for {category}, using fallback", e)
+            with self.lock:
+                self.fake_seed += 1
+                seed = self.fake_seed
+            products = fake_products(num_products, category, seed)
+            metrics.incr("product_pool.fallback_batches")
+
+        valid, ids = [], set()
+        for product in products:
+            try:
+                product = validate_product(product)
+            except (ValueError, TypeError):
+                metrics.incr("product_pool.invalid_products")
+                continue
+            # Keep products in the buffer of the category they were requested for
+            product["category"] = category
+            product["product_id"] = stable_product_id(category, product["name"])
+            if product["product_id"] in ids:
+                metrics.incr("product_pool.duplicate_products")
+                continue
+            ids.add(product["product_id"])
+            valid.append(product)
+        return valid
+
+    def refill(self) -> None:
+        """Fill every category below the high-water mark."""
+        try:
+            with unaccounted():
+                self._refill()
+            self._save()
+        finally:
+            with self.lock:
+                self.refilling = False
+
+    def _refill(self) -> None:
+        """Generate products for every category below the high-water mark."""
+        for category in self.categories:
+            while len(self.buffers[category]) < self.high_water:
+                needed = min(
+                    self.batch_size, self.high_water - len(self.buffers[category])
+                )
+                products = self._generate(needed, category)
+                with self.lock:
+                    buffered = {p["product_id"] for p in self.buffers[category]}
+                    products = [p for p in products if p["product_id"] not in buffered]
+                    self.buffers[category].extend(products)
+                # Stop once the generator only repeats buffered products
+                if not products:
+                    break
+
+    def refill_async(self) -> None:
+        """Start a background refill if any category is below the low-water mark."""
+        with self.lock:
+            if self.refilling or all(
+                len(products) >= self.low_water for products in self.buffers.values()
+            ):
+                return
+            self.refilling = True
+        threading.Thread(target=self.refill, daemon=True).start()
+
+    def take(self, num_products: int) -> List[Dict[str, Any]]:
+        """Take products round-robin across categories, generating any shortfall inline."""
+        with metrics.timer("product_pool.take"):
+            products = []
+            with self.lock:
+                empty_rounds = 0
+                while len(products) < num_products and empty_rounds < len(self.categories):
+                    category = self.categories[self.next_category % len(self.categories)]
+                    self.next_category += 1
+                    if self.buffers[category]:
+                        products.append(self.buffers[category].popleft())
+                        empty_rounds = 0
+                    else:
+                        empty_rounds += 1
+                if products and self.persisted:
+                    with open(self.consumed, "a") as f:
+                        f.write("".join(f"{p['product_id']}\n" for p in products))
+
+            metrics.incr("product_pool.hits", len(products))
+            shortfall = num_products - len(products)
+            if shortfall:
+                metrics.incr("product_pool.misses", shortfall)
+                category = self.categories[self.next_category % len(self.categories)]
+                taken = {p["product_id"] for p in products}
+                generated = [p for p in self._generate(shortfall, category) if p["product_id"] not in taken]
+                products.extend(generated[:shortfall])
+
+        self.refill_async()
+        return products
+
+    def stats(self) -> Dict[str, int]:
+        """Return the number of buffered products per category."""
+        with self.lock:
+            return {category: len(products) for category, products in self.buffers.items()}
+
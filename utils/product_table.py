@@ -0,0 +1,189 @@
+import csv
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List
+
+# Column name -> storage: array typecode for numbers, "str" for strings, "cat" for categories
+COLUMNS = {
+    "product_id": "str",
+    "name": "str",
+    "description": "str",
+    "price": "d",
+    "category": "cat",
+    "stock_quantity": "q",
+    "rating": "d",
+    "created_at": "str",
+}
+
+
+class StringColumn:
+    """Strings stored as one buffer plus offsets instead of one object per value."""
+
+    __slots__ = ("buffer", "offsets")
+
+    def __init__(self, buffer: str, offsets: array):
+        self.buffer = buffer
+        self.offsets = offsets
+
+    @classmethod
+    def from_values(cls, values: Iterable[Any]) -> "StringColumn":
+        values = [str(value) for value in values]
+        offsets = array("L", [0])
+        total = 0
+        for value in values:
+            total += len(value)
+            offsets.append(total)
+        return cls("".join(values), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        return self.buffer[self.offsets[index] : self.offsets[index + 1]]
+
+    def __iter__(self) -> Iterator[str]:
+        buffer, offsets = self.buffer, self.offsets
+        for i in range(len(offsets) - 1):
+            yield buffer[offsets[i] : offsets[i + 1]]
+
+
+class CategoryColumn:
+    """Dictionary-encoded strings for columns with few distinct values."""
+
+    __slots__ = ("categories", "codes")
+
+    def __init__(self, categories: List[str], codes: array):
+        self.categories = categories
+        self.codes = codes
+
+    @classmethod
+    def from_values(cls, values: Iterable[Any]) -> "CategoryColumn":
+        lookup: Dict[str, int] = {}
+        codes = array("H")
+        for value in values:
+            codes.append(lookup.setdefault(str(value), len(lookup)))
+        return cls(list(lookup), codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> str:
+        return self.categories[self.codes[index]]
+
+    def __iter__(self) -> Iterator[str]:
+        categories = self.categories
+        return (categories[code] for code in self.codes)
+
+
+class ProductRow:
+    """Read-only view of one row of a ProductTable."""
+
+    __slots__ = ("table", "index")
+
+    def __init__(self, table: "ProductTable", index: int):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, column: str) -> Any:
+        return self.table.columns[column][self.index]
+
+    def keys(self) -> List[str]:
+        return list(COLUMNS)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Materialize the row as a dictionary."""
+        return {column: self[column] for column in COLUMNS}
+
+
+class ProductTable:
+    """Column-oriented product dataset backed by arrays and string buffers."""
+
+    __slots__ = ("columns", "num_rows")
+
+    def __init__(self, columns: Dict[str, Any], num_rows: int):
+        self.columns = columns
+        self.num_rows = num_rows
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "ProductTable":
+        """Build a table from a list of product dictionaries."""
+        columns = {}
+        for column, kind in COLUMNS.items():
+            values = (record[column] for record in records)
+            if kind == "str":
+                columns[column] = StringColumn.from_values(values)
+            elif kind == "cat":
+                columns[column] = CategoryColumn.from_values(values)
+            elif kind == "q":
+                columns[column] = array(kind, (int(value) for value in values))
+            else:
+                columns[column] = array(kind, (float(value) for value in values))
+        return cls(columns, len(records))
+
+    def __len__(self) -> int:
+        return self.num_rows
+
+    def __getitem__(self, index: int) -> ProductRow:
+        if not -self.num_rows <= index < self.num_rows:
+            raise IndexError("Product index out of range")
+        return ProductRow(self, index % self.num_rows)
+
+    def __iter__(self) -> Iterator[ProductRow]:
+        return (ProductRow(self, i) for i in range(self.num_rows))
+
+    def header(self) -> List[str]:
+        """Return the column names."""
+        return list(COLUMNS)
+
+    def iter_rows(self) -> Iterator[tuple]:
+        """Yield each row as a tuple of values, without building dictionaries."""
+        return zip(*(self.columns[column] for column in COLUMNS))
+
+    def to_sheet_values(self) -> List[List[Any]]:
+        """Return the header and rows in the shape expected by the Sheets API."""
+        return [self.header()] + [list(row) for row in self.iter_rows()]
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """Materialize the rows as product dictionaries."""
+        return [dict(zip(COLUMNS, row)) for row in self.iter_rows()]
+
+    def to_csv(self, path: str) -> str:
+        """Write the table to a CSV file and return its path."""
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(self.header())
+            writer.writerows(self.iter_rows())
+        return path
+
+    def to_compact(self) -> Dict[str, Any]:
+        """Serialize the table into a compact form of bytes and strings, e.g. for checkpoints."""
+        columns = {}
+        for column, kind in COLUMNS.items():
+            data = self.columns[column]
+            if kind == "str":
+                columns[column] = {"buffer": data.buffer, "offsets": data.offsets.tobytes()}
+            elif kind == "cat":
+                columns[column] = {"categories": data.categories, "codes": data.codes.tobytes()}
+            else:
+                columns[column] = {"data": data.tobytes()}
+        return {"type": "product_table", "num_rows": self.num_rows, "columns": columns}
+
+    @classmethod
+    def from_compact(cls, compact: Dict[str, Any]) -> "ProductTable":
+        """Rebuild a table from its compact form."""
+        columns = {}
+        for column, kind in COLUMNS.items():
+            data = compact["columns"][column]
+            if kind == "str":
+                offsets = array("L")
+                offsets.frombytes(data["offsets"])
+                columns[column] = StringColumn(data["buffer"], offsets)
+            elif kind == "cat":
+                codes = array("H")
+                codes.frombytes(data["codes"])
+                columns[column] = CategoryColumn(data["categories"], codes)
+            else:
+                values = array(kind)
+                values.frombytes(data["data"])
+                columns[column] = values
+        return cls(columns, compact["num_rows"])
+
@@ -0,0 +1,294 @@
+import json
+import os
+import re
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from types import CodeType, FrameType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from config import (
+    PROFILE_DIR,
+    PROFILE_INTERVAL,
+    PROFILE_TRACEMALLOC_FRAMES,
+    PROFILE_TOP,
+)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STDLIB = sysconfig.get_paths()["stdlib"]
+# Frames are (name, file, line) of the function a stack entry is in
+Frame = Tuple[str, str, int]
+
+# tracemalloc is process-wide, so concurrent profiled turns share one trace
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+_tracemalloc_started = False
+
+
+def short_path(filename: str) -> str:
+    """Shorten a source path to the repo, site-packages or stdlib relative path."""
+    if filename.startswith(REPO_ROOT + os.sep):
+        return os.path.relpath(filename, REPO_ROOT)
+    _, marker, rest = filename.rpartition("site-packages" + os.sep)
+    if marker:
+        return rest
+    if filename.startswith(STDLIB + os.sep):
+        return os.path.relpath(filename, STDLIB)
+    return filename
+
+
+class SamplingProfiler:
+    """Samples the stack of one thread from a background thread, weighting each sample by
+    the wall-clock and CPU time that passed since the previous one.
+
+    The turn being profiled runs unmodified: no tracing hooks are installed, so its
+    cost is one stack walk per interval.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self.frames: Dict[CodeType, Frame] = {}
+        self.repo_frames = set()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _frame(self, code: CodeType) -> Frame:
+        frame = self.frames.get(code)
+        if frame is None:
+            frame = self.frames[code] = (
+                code.co_name,
+                short_path(code.co_filename),
+                code.co_firstlineno,
+            )
+            if code.co_filename.startswith(REPO_ROOT + os.sep):
+                self.repo_frames.add(frame)
+        return frame
+
+    def _stack(self, frame: Optional[FrameType]) -> Tuple[Frame, ...]:
+        stack = []
+        while frame is not None:
+            stack.append(self._frame(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+    def _run(self, target: int) -> None:
+        clock = time.pthread_getcpuclockid(target) if hasattr(time, "pthread_getcpuclockid") else None
+        last_wall = time.perf_counter()
+        last_cpu = time.clock_gettime(clock) if clock is not None else 0.0
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(target)
+            now_wall = time.perf_counter()
+            try:
+                now_cpu = time.clock_gettime(clock) if clock is not None else 0.0
+            except OSError:
+                # The target thread has exited
+                break
+            if frame is not None:
+                stack = self._stack(frame)
+                self.wall[stack] += now_wall - last_wall
+                self.cpu[stack] += now_cpu - last_cpu
+                self.samples += 1
+            last_wall, last_cpu = now_wall, now_cpu
+
+    def start(self, thread_id: Optional[int] = None) -> None:
+        """Start sampling a thread, by default the calling one."""
+        target = thread_id if thread_id is not None else threading.get_ident()
+        self._thread = threading.Thread(
+            target=self._run, args=(target,), name="profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sampling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self, weights: Counter) -> str:
+        """Render stacks in the collapsed format of flamegraph.pl, weighted in microseconds."""
+        lines = []
+        for stack, seconds in weights.most_common():
+            microseconds = round(seconds * 1_000_000)
+            if microseconds:
+                names = ";".join(f"{name} ({path}:{line})" for name, path, line in stack)
+                lines.append(f"{names} {microseconds}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> Dict[str, Any]:
+        """Render the wall-clock and CPU profiles as one speedscope file."""
+        index: Dict[Frame, int] = {}
+        frames = []
+
+        def profile(kind: str, weights: Counter) -> Dict[str, Any]:
+            samples, values = [], []
+            for stack, seconds in weights.items():
+                ids = []
+                for frame in stack:
+                    if frame not in index:
+                        index[frame] = len(frames)
+                        frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                    ids.append(index[frame])
+                samples.append(ids)
+                values.append(seconds)
+            return {
+                "type": "sampled",
+                "name": f"{name} ({kind})",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(values),
+                "samples": samples,
+                "weights": values,
+            }
+
+        profiles = [profile("wall", self.wall), profile("cpu", self.cpu)]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "utils.profiling",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+    def hot_spots(self, top: int = PROFILE_TOP) -> List[Dict[str, Any]]:
+        """Functions with the most inclusive wall-clock time, with their CPU and self time.
+
+        Functions of this repo are listed first, since they say which step of the turn
+        the time went to; library functions by self time say what it was spent on.
+        """
+        inclusive_wall: Counter = Counter()
+        inclusive_cpu: Counter = Counter()
+        self_wall: Counter = Counter()
+        for stack, seconds in self.wall.items():
+            for frame in set(stack):
+                inclusive_wall[frame] += seconds
+                inclusive_cpu[frame] += self.cpu[stack]
+            if stack:
+                self_wall[stack[-1]] += seconds
+
+        def entry(frame: Frame) -> Dict[str, Any]:
+            name, path, line = frame
+            return {
+                "function": f"{name} ({path}:{line})",
+                "wall_seconds": round(inclusive_wall[frame], 4),
+                "cpu_seconds": round(inclusive_cpu[frame], 4),
+                "self_seconds": round(self_wall[frame], 4),
+            }
+
+        repo = [
+            frame
+            for frame, _ in inclusive_wall.most_common()
+            if frame in self.repo_frames and frame[0] != "<module>"
+        ]
+        libraries = [frame for frame, _ in self_wall.most_common() if frame not in repo]
+        return [entry(frame) for frame in repo[:top]] + [entry(frame) for frame in libraries[:top]]
+
+
+def _start_tracemalloc() -> None:
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            _tracemalloc_started = True
+        else:
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc() -> Tuple[tracemalloc.Snapshot, int]:
+    global _tracemalloc_users, _tracemalloc_started
+    with _tracemalloc_lock:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _tracemalloc_users -= 1
+        # A trace started outside of profiling, e.g. with PYTHONTRACEMALLOC, keeps running
+        if _tracemalloc_users == 0 and _tracemalloc_started:
+            tracemalloc.stop()
+            _tracemalloc_started = False
+    return snapshot, peak
+
+
+def format_allocations(snapshot: tracemalloc.Snapshot, top: int = PROFILE_TOP) -> str:
+    """Render the allocation tracebacks holding the most memory allocated during the turn."""
+    snapshot = snapshot.filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+    )
+    lines = []
+    for stat in snapshot.statistics("traceback")[:top]:
+        lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+        for frame in stat.traceback.format(most_recent_first=True)[:10]:
+            lines.append(f"  {frame}")
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def profile_turn(
+    name: str,
+    directory: str = PROFILE_DIR,
+    allocations: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """Profile the enclosed code on the current thread and write its profiles to a directory.
+
+    Yields a report that, once the block exits, holds the wall-clock and CPU time, the
+    hot spots and the paths of the files written: a speedscope file with wall and CPU
+    profiles, and wall and CPU stacks in collapsed format. With allocations, the
+    largest allocations and their peak are captured too. They are traced
+    process-wide, so concurrent work is included, and tracing slows allocation-heavy
+    code many times over, so CPU times are only accurate without them.
+    """
+    report: Dict[str, Any] = {}
+    profiler = SamplingProfiler()
+    if allocations:
+        _start_tracemalloc()
+    wall_start, cpu_start = time.perf_counter(), time.thread_time()
+    profiler.start()
+    try:
+        yield report
+    finally:
+        profiler.stop()
+        wall, cpu = time.perf_counter() - wall_start, time.thread_time() - cpu_start
+        snapshot, peak = _stop_tracemalloc() if allocations else (None, None)
+
+        os.makedirs(directory, exist_ok=True)
+        safe_name = re.sub(r"[^\w.-]", "_", name)
+        stem = os.path.join(directory, f"{safe_name}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}")
+        files = {
+            "speedscope": f"{stem}.speedscope.json",
+            "wall_collapsed": f"{stem}.wall.collapsed",
+            "cpu_collapsed": f"{stem}.cpu.collapsed",
+        }
+        with open(files["speedscope"], "w") as f:
+            json.dump(profiler.speedscope(name), f)
+        with open(files["wall_collapsed"], "w") as f:
+            f.write(profiler.collapsed(profiler.wall))
+        with open(files["cpu_collapsed"], "w") as f:
+            f.write(profiler.collapsed(profiler.cpu))
+        if snapshot is not None:
+            files["allocations"] = f"{stem}.alloc.txt"
+            with open(files["allocations"], "w") as f:
+                f.write(format_allocations(snapshot))
+
+        report.update(
+            {
+                "wall_seconds": round(wall, 4),
+                "cpu_seconds": round(cpu, 4),
+                # Time the thread spent off the CPU: LLM and API calls, locks, sleeps
+                "waiting_seconds": round(max(0.0, wall - cpu), 4),
+                "samples": profiler.samples,
+                "allocated_peak_bytes": peak,
+                "hot_spots": profiler.hot_spots(),
+                "files": files,
+            }
+        )
+
@@ -0,0 +1,267 @@
+import random
+import smtplib
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+import httpx
+import openai
+from config import RATE_LIMITS
+from utils.cancellation import (
+    CANCEL_POLL_INTERVAL,
+    TurnCancelledError,
+    cancellable_sleep,
+    check_cancelled,
+)
+from utils.metrics import metrics
+
+# SMTP reply codes that signal temporary throttling or unavailability
+TRANSIENT_SMTP_CODES = {421, 450, 451, 452, 454}
+TRANSIENT_HTTP_STATUSES = {500, 502, 503, 504}
+# Lower-cased reasons of Google's 403s that throttle rather than deny
+RATE_LIMIT_REASONS = ("ratelimitexceeded", "userratelimitexceeded")
+# Dropped connections and timeouts, including those of the OpenAI client, whose own
+# retries are disabled so that its calls are retried here
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    smtplib.SMTPServerDisconnected,
+    openai.APIConnectionError,
+    httpx.TimeoutException,
+    httpx.NetworkError,
+    httpx.RemoteProtocolError,
+)
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` calls per second with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Block until a token is available and return the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            cancellable_sleep(delay)
+            waited += delay
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit with additive increase on success and multiplicative decrease on throttling."""
+
+    def __init__(
+        self,
+        initial: int,
+        maximum: int,
+        minimum: int = 1,
+        decrease_factor: float = 0.5,
+    ):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        """Block until a concurrency slot is free, or the current turn is cancelled."""
+        with self.condition:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    self.condition.wait(CANCEL_POLL_INTERVAL)
+                    check_cancelled()
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    def release(self) -> None:
+        """Free a concurrency slot."""
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def on_success(self) -> None:
+        """Grow the limit by roughly one slot per full window of successful calls."""
+        with self.condition:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify()
+
+    def on_throttle(self) -> None:
+        """Shrink the limit after the backend signals overload."""
+        with self.condition:
+            self.limit = max(self.minimum, self.limit * self.decrease_factor)
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """Return the HTTP or SMTP status code carried by an exception, if any."""
+    if isinstance(error, smtplib.SMTPResponseException):
+        return error.smtp_code
+    status = getattr(error, "status_code", None)
+    if status is None and hasattr(error, "resp"):
+        status = getattr(error.resp, "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Return the delay requested by a Retry-After header, if any."""
+    headers = None
+    if getattr(error, "response", None) is not None:
+        headers = getattr(error.response, "headers", None)
+    elif getattr(error, "resp", None) is not None:
+        headers = error.resp
+    if headers is None:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_rate_limit_reason(error: Exception) -> bool:
+    """Check whether a Google API error names a rate limit as its reason.
+
+    The reasons are read from the error details of an HttpError, and from its message.
+    """
+    details = getattr(error, "error_details", None)
+    reasons = [
+        str(detail.get("reason", "")) for detail in details if isinstance(detail, dict)
+    ] if isinstance(details, list) else []
+    text = " ".join([str(error), *reasons]).lower()
+    return any(reason in text for reason in RATE_LIMIT_REASONS)
+
+
+def is_throttled(error: Exception) -> bool:
+    """Check whether an error means the backend is rate limiting us."""
+    status = get_status_code(error)
+    if isinstance(error, smtplib.SMTPResponseException):
+        return status in TRANSIENT_SMTP_CODES
+    return status == 429 or (status == 403 and is_rate_limit_reason(error))
+
+
+def is_transient(error: Exception) -> bool:
+    """Check whether an error is worth retrying."""
+    if is_throttled(error):
+        return True
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return get_status_code(error) in TRANSIENT_HTTP_STATUSES
+
+
+def is_retryable(error: Exception, idempotent: bool = True) -> bool:
+    """Check whether a failed call may be retried.
+
+    A call that is not idempotent is only retried when it was throttled, since the
+    backend then refused it. After a timeout, a dropped connection or a server error,
+    it may already have taken effect.
+    """
+    return is_transient(error) if idempotent else is_throttled(error)
+
+
+class BackendLimiter:
+    """Rate limit, adaptively bound and retry the calls made to one backend."""
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        max_concurrency: int,
+        max_retries: int = 5,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = AdaptiveConcurrency(
+            initial=max(1, max_concurrency // 2), maximum=max_concurrency
+        )
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Return the delay before the next attempt, honoring Retry-After."""
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # Full jitter exponential backoff
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def call(
+        self, fn: Callable[..., Any], *args: Any, idempotent: bool = True, **kwargs: Any
+    ) -> Any:
+        """Call fn under this backend's limits, retrying throttled and transient failures.
+
+        Calls that are not idempotent, such as creating a file or sending an email,
+        are only retried when throttled. Calls made by a cancelled conversation turn
+        are not started or retried.
+        """
+        for attempt in range(self.max_retries + 1):
+            check_cancelled()
+            start = time.perf_counter()
+            metrics.observe(f"ratelimit.{self.name}.bucket_wait", self.bucket.acquire())
+            self.concurrency.acquire()
+            metrics.observe(
+                f"ratelimit.{self.name}.queue_wait", time.perf_counter() - start
+            )
+            try:
+                # The turn may have been cancelled while queued for a slot
+                check_cancelled()
+                result = fn(*args, **kwargs)
+                self.concurrency.on_success()
+                metrics.incr(f"ratelimit.{self.name}.calls")
+                return result
+            except TurnCancelledError:
+                metrics.incr(f"ratelimit.{self.name}.cancelled")
+                raise
+            except Exception as e:
+                if is_throttled(e):
+                    self.concurrency.on_throttle()
+                    metrics.incr(f"ratelimit.{self.name}.throttled")
+                if attempt == self.max_retries or not is_retryable(e, idempotent):
+                    metrics.incr(f"ratelimit.{self.name}.failed")
+                    raise
+                delay = self.backoff(attempt, e)
+            finally:
+                self.concurrency.release()
+            metrics.incr(f"ratelimit.{self.name}.retries")
+            cancellable_sleep(delay)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the current concurrency limit and queue state."""
+        return {
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "waiting": self.concurrency.waiting,
+        }
+
+
+limiters: Dict[str, BackendLimiter] = {
+    name: BackendLimiter(name, **settings) for name, settings in RATE_LIMITS.items()
+}
+
+
+def get_limiter(name: str) -> BackendLimiter:
+    """Get the shared limiter of a backend ("openai", "google" or "smtp")."""
+    return limiters[name]
+
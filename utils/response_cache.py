@@ -0,0 +1,50 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Tuple
+from config import RESPONSE_CACHE_SIZE
+from utils.metrics import metrics
+
+
+def state_hash(state: Any) -> str:
+    """Short digest of the JSON of the state a response is rendered from."""
+    data = json.dumps(state, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(data.encode(), digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    """Rendered replies of deterministic graph transitions, keyed on (node, state hash).
+
+    Only replies that are pure functions of the state they are keyed on belong here:
+    anything with a timestamp or an LLM call behind it is rendered every time.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, node: str, state: Any, render: Callable[[], str]) -> str:
+        """Return the reply of the node for the state, rendering it on a miss."""
+        key = (node, state_hash(state))
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                metrics.incr("response_cache.hits")
+                return self.entries[key]
+        metrics.incr("response_cache.misses")
+        response = render()
+        with self.lock:
+            self.entries[key] = response
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return response
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+response_cache = ResponseCache()
+
@@ -0,0 +1,257 @@
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import numpy as np
+from utils.metrics import metrics
+
+# Numbers, email addresses, URLs and negations must match exactly for a cache hit, so
+# that "email bob@x.com" never reuses the response for "email alice@x.com", nor "do not
+# email" the one for "email"
+SALIENT_PATTERN = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+|https?://\S+|\d+(?:\.\d+)?")
+NEGATION_PATTERN = re.compile(r"n't\b|\b(?:not|no|never|none|without|except)\b")
+# Words that do not change what a prompt asks for
+STOPWORDS = frozenset(
+    "a an the please kindly just to into in on onto of for and then me us my our i we you "
+    "can could would will it them this that".split()
+)
+# Words asking for the same thing, mapped to one of them before prompts are embedded
+SYNONYMS = {
+    "create": "generate",
+    "make": "generate",
+    "produce": "generate",
+    "build": "generate",
+    "add": "put",
+    "place": "put",
+    "insert": "put",
+    "write": "put",
+    "upload": "put",
+    "spreadsheet": "sheet",
+    "spreadsheets": "sheets",
+    "item": "product",
+    "items": "products",
+    "e-mail": "email",
+    "mail": "email",
+}
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace and punctuation."""
+    return " ".join(re.findall(r"[\w@.+-]+", text.lower()))
+
+
+def salient_tokens(text: str) -> List[str]:
+    """The numbers, email addresses, URLs and negations of a text, without sentence-ending dots."""
+    tokens = [token.rstrip(".") for token in SALIENT_PATTERN.findall(text)]
+    return tokens + ["not"] * len(NEGATION_PATTERN.findall(text.lower()))
+
+
+def content_words(text: str) -> List[str]:
+    """The sorted distinct words of a text, apart from STOPWORDS."""
+    words = {word.strip(".+-") for word in normalize_text(text).split()}
+    return sorted(words - STOPWORDS - {""})
+
+
+def canonical_text(text: str) -> str:
+    """The words of a text in order, without STOPWORDS and with SYNONYMS replaced."""
+    words = (word.strip(".+-") for word in normalize_text(text).split())
+    return " ".join(SYNONYMS.get(word, word) for word in words if word and word not in STOPWORDS)
+
+
+class HashedNgramEmbedder:
+    """Embed text as a normalized vector of hashed character n-grams and words."""
+
+    def __init__(self, dim: int = 1024, ngram: int = 3):
+        self.dim = dim
+        self.ngram = ngram
+
+    def __call__(self, text: str) -> np.ndarray:
+        text = normalize_text(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        padded = f" {text} "
+        for i in range(len(padded) - self.ngram + 1):
+            vector[zlib.crc32(padded[i : i + self.ngram].encode()) % self.dim] += 1.0
+        for word in text.split():
+            vector[zlib.crc32(word.encode()) % self.dim] += 2.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class SemanticCache:
+    """Nearest-neighbor response cache over canonical prompt embeddings with LRU eviction.
+
+    Prompts are embedded without stopwords and with synonyms replaced, so rephrasings
+    such as "create" for "generate" or an added "please" score close to 1, while an
+    added constraint falls below the threshold. A hit also needs the same salient
+    tokens as the cached prompt, since changing one number or address barely moves
+    the similarity.
+
+    With a path, the vectors are memmapped to "<path>.npy" and the entries appended to
+    "<path>.jsonl", both shared by the processes using the path under a file lock. Each
+    process applies the entries the others appended before it reads or adds one, and the
+    log is rewritten with the current entries once it holds twice max_entries.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        threshold: float = 0.95,
+        max_entries: int = 1000,
+        embedder: Optional[Callable[[str], np.ndarray]] = None,
+        path: Optional[str] = None,
+    ):
+        self.name = name
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.dim = len(self.embedder("dimension probe"))
+        self.path = path
+        self.lock = threading.Lock()
+        # Per-slot entry data; a slot with entry None is free
+        self.entries: List[Optional[Dict[str, Any]]] = [None] * max_entries
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self.hits = 0
+        self.misses = 0
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self.log_path = f"{path}.jsonl"
+            # First line of the log, which a rewrite changes
+            self.log_id: Optional[bytes] = None
+            self.log_offset = 0
+            self.log_records = 0
+            self.lock_file = open(f"{path}.lock", "a")
+            with self._locked():
+                mode = "r+" if os.path.exists(f"{path}.npy") else "w+"
+                self.vectors = np.lib.format.open_memmap(
+                    f"{path}.npy", mode=mode, dtype=np.float32, shape=(max_entries, self.dim)
+                )
+        else:
+            self.vectors = np.zeros((max_entries, self.dim), dtype=np.float32)
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the cache's lock and, with a path, the file lock, syncing the entries first."""
+        with self.lock:
+            if not self.path:
+                yield
+                return
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            try:
+                self._sync_entries()
+                yield
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def _sync_entries(self) -> None:
+        """Apply the entries appended to the log since the last sync."""
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            log_id = f.readline()
+            if log_id != self.log_id:
+                # Rewritten since the last sync, so replayed from the start
+                self.log_id, self.log_offset, self.log_records = log_id, len(log_id), 0
+                self.entries = [None] * self.max_entries
+                self.last_used[:] = 0
+            f.seek(self.log_offset)
+            appended = f.read()
+        self.log_offset += len(appended)
+        for line in appended.splitlines():
+            entry = json.loads(line)
+            slot = entry.pop("slot")
+            self.entries[slot] = entry
+            self.last_used[slot] = max(self.last_used[slot], entry["created_at"])
+            self.log_records += 1
+
+    def _append_entry(self, slot: int) -> None:
+        """Flush the memmapped vectors and append the entry of a slot to the log."""
+        self.vectors.flush()
+        if self.log_id is None or self.log_records >= 2 * self.max_entries:
+            self._rewrite_log()
+            return
+        line = json.dumps({"slot": slot, **self.entries[slot]}).encode() + b"\n"
+        with open(self.log_path, "ab") as f:
+            f.write(line)
+        self.log_offset += len(line)
+        self.log_records += 1
+
+    def _rewrite_log(self) -> None:
+        """Replace the log with a new one holding the current entries."""
+        self.log_id = uuid.uuid4().hex.encode() + b"\n"
+        lines = [self.log_id] + [
+            json.dumps({"slot": slot, **entry}).encode() + b"\n"
+            for slot, entry in enumerate(self.entries)
+            if entry is not None
+        ]
+        with open(f"{self.log_path}.tmp", "wb") as f:
+            f.writelines(lines)
+        os.replace(f"{self.log_path}.tmp", self.log_path)
+        self.log_offset = sum(map(len, lines))
+        self.log_records = len(lines) - 1
+
+    def lookup(self, text: str) -> Optional[str]:
+        """Return the cached response of the most similar prompt above the threshold."""
+        with metrics.timer(f"semantic_cache.{self.name}.lookup"):
+            query = self.embedder(canonical_text(text))
+            salient = salient_tokens(text)
+            with self._locked():
+                scores = self.vectors @ query
+                for slot in np.argsort(scores)[::-1]:
+                    entry = self.entries[slot]
+                    if scores[slot] < self.threshold:
+                        break
+                    if entry is None or entry["salient"] != salient:
+                        continue
+                    self.last_used[slot] = time.time()
+                    self.hits += 1
+                    metrics.incr(f"semantic_cache.{self.name}.hits")
+                    metrics.incr(
+                        f"semantic_cache.{self.name}.saved_seconds", entry["latency"]
+                    )
+                    return entry["response"]
+                self.misses += 1
+                metrics.incr(f"semantic_cache.{self.name}.misses")
+                return None
+
+    def add(self, text: str, response: str, latency: float = 0.0) -> None:
+        """Cache a response, evicting the least recently used entry when full."""
+        vector = self.embedder(canonical_text(text))
+        with self._locked():
+            free = [slot for slot, entry in enumerate(self.entries) if entry is None]
+            if free:
+                slot = free[0]
+            else:
+                slot = int(np.argmin(self.last_used))
+                metrics.incr(f"semantic_cache.{self.name}.evictions")
+            now = time.time()
+            self.vectors[slot] = vector
+            self.last_used[slot] = now
+            self.entries[slot] = {
+                "response": response,
+                "salient": salient_tokens(text),
+                "latency": latency,
+                "created_at": now,
+            }
+            if self.path:
+                self._append_entry(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the size and hit rate of the cache."""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(entry is not None for entry in self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,135 @@
+import bisect
+import hashlib
+import os
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from config import SHARD_VNODES
+
+
+def ring_hash(key: str) -> int:
+    """64-bit position of a key on the hash ring."""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping keys to nodes, so adding a node moves only about 1/N of the keys."""
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: int = SHARD_VNODES):
+        self.vnodes = vnodes
+        self.nodes: List[str] = []
+        # Sorted ring positions and their owners, replaced as a whole so lookups need no lock
+        self.ring: Tuple[List[int], List[str]] = ([], [])
+        for node in nodes:
+            self.add(node)
+
+    def _rebuild(self, nodes: List[str]) -> None:
+        points = sorted(
+            (ring_hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(self.vnodes)
+        )
+        self.nodes = nodes
+        self.ring = ([point for point, _ in points], [node for _, node in points])
+
+    def add(self, node: str) -> None:
+        """Add a node to the ring."""
+        if node not in self.nodes:
+            self._rebuild(self.nodes + [node])
+
+    def remove(self, node: str) -> None:
+        """Remove a node from the ring; its keys move to the following nodes."""
+        if node in self.nodes:
+            self._rebuild([n for n in self.nodes if n != node])
+
+    def node_for(self, key: str) -> str:
+        """Return the node owning a key."""
+        points, owners = self.ring
+        if not points:
+            raise LookupError("Hash ring has no nodes")
+        return owners[bisect.bisect(points, ring_hash(key)) % len(points)]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+def shard_paths(path: str, shards: int) -> List[str]:
+    """Derive the file of each shard from a database path, e.g. checkpoints-0.db."""
+    if shards <= 1:
+        return [path]
+    stem, extension = os.path.splitext(path)
+    return [f"{stem}-{shard}{extension}" for shard in range(shards)]
+
+
+class ShardedSaver(BaseCheckpointSaver):
+    """Checkpointer spreading conversation threads over several savers by consistent hashing of thread_id."""
+
+    def __init__(self, shards: Dict[str, BaseCheckpointSaver], vnodes: int = SHARD_VNODES):
+        first = next(iter(shards.values()))
+        super().__init__(serde=first.serde)
+        self.shards = shards
+        self.ring = HashRing(shards, vnodes)
+
+    def shard(self, thread_id: str) -> BaseCheckpointSaver:
+        """Return the saver holding a thread."""
+        return self.shards[self.ring.node_for(str(thread_id))]
+
+    def _for_config(self, config: RunnableConfig) -> BaseCheckpointSaver:
+        return self.shard(config["configurable"]["thread_id"])
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self._for_config(config).get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config and "thread_id" in config.get("configurable", {}):
+            savers = [self._for_config(config)]
+        else:
+            savers = list(self.shards.values())
+        for saver in savers:
+            for checkpoint in saver.list(config, filter=filter, before=before, limit=limit):
+                yield checkpoint
+                if limit is not None:
+                    limit -= 1
+                    if limit <= 0:
+                        return
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return self._for_config(config).put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        self._for_config(config).put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        self.shard(thread_id).delete_thread(thread_id)
+
+    def get_delta_channel_history(self, *, config: RunnableConfig, channels: Sequence[str]):
+        return self._for_config(config).get_delta_channel_history(config=config, channels=channels)
+
+    def get_next_version(self, current: Optional[str], channel: Any) -> str:
+        return next(iter(self.shards.values())).get_next_version(current, channel)
+
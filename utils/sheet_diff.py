@@ -0,0 +1,139 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Sequence, Tuple
+
+SheetValues = List[List[Any]]
+# Row key -> (row index in the sheet, row fingerprint) of the rows with that key
+RowIndex = Dict[str, List[Tuple[int, str]]]
+
+
+def normalize_cell(value: Any) -> Any:
+    """Normalize a cell so values written and read back through the Sheets API compare equal."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    return "" if value is None else str(value)
+
+
+def normalize_row(row: List[Any], width: int) -> List[Any]:
+    """Normalize the cells of a row, padding the trailing empty cells the API omits."""
+    return [normalize_cell(cell) for cell in row] + [""] * (width - len(row))
+
+
+def row_fingerprint(row: List[Any], width: int) -> str:
+    """Short digest of the normalized contents of a row."""
+    data = json.dumps(normalize_row(row, width), separators=(",", ":"))
+    return hashlib.blake2b(data.encode(), digest_size=8).hexdigest()
+
+
+def row_keys(values: SheetValues, key: Sequence[str]) -> List[Tuple[int, str]]:
+    """Key each non-empty row of sheet values (header row included) by its key columns.
+
+    Returns (row index in the sheet, key) pairs.
+    """
+    header = values[0]
+    key_indexes, width = [header.index(column) for column in key], len(header)
+    keys = []
+    for position, row in enumerate(values[1:], 1):
+        cells = normalize_row(row, width)
+        if any(cell != "" for cell in cells):
+            keys.append((position, json.dumps([cells[i] for i in key_indexes])))
+    return keys
+
+
+def index_rows(values: SheetValues, key: Sequence[str]) -> RowIndex:
+    """Index the rows of sheet values (header row included) by their key columns."""
+    width = len(values[0])
+    index: RowIndex = {}
+    for position, row_key in row_keys(values, key):
+        index.setdefault(row_key, []).append((position, row_fingerprint(values[position], width)))
+    return index
+
+
+def diff_rows(
+    index: RowIndex, values: SheetValues, key: Sequence[str], num_rows: int
+) -> Dict[str, Any]:
+    """Compare new sheet values (header row included) against the indexed current rows.
+
+    Rows are matched on their key, and rows sharing a key on their contents first.
+    Matched rows that changed are rewritten in place. New rows take the places of
+    removed ones first, then go after the last row. When more rows are removed than
+    added, the last rows move into the remaining gaps and the rows left over at the
+    end are blanked, so the sheet never has gaps.
+
+    Returns the rows to write as (row index in the sheet, values), the index and
+    number of rows of the sheet once they are written, and the number of rows
+    updated, appended and removed.
+    """
+    width = len(values[0])
+    new_rows: Dict[str, List[Tuple[List[Any], str]]] = {}
+    for position, row_key in row_keys(values, key):
+        row = values[position]
+        new_rows.setdefault(row_key, []).append((row, row_fingerprint(row, width)))
+
+    writes: Dict[int, List[Any]] = {}
+    # Row index in the sheet -> (key, row, fingerprint) of the rows kept or added
+    placed: Dict[int, Tuple[str, List[Any], str]] = {}
+    appended, free = [], []
+    for row_key in index.keys() | new_rows.keys():
+        current = list(index.get(row_key, []))
+        unmatched = []
+        for row, fingerprint in new_rows.get(row_key, []):
+            same = next((entry for entry in current if entry[1] == fingerprint), None)
+            if same is None:
+                unmatched.append((row, fingerprint))
+            else:
+                current.remove(same)
+                placed[same[0]] = (row_key, row, fingerprint)
+        for (position, _), (row, fingerprint) in zip(current, unmatched):
+            writes[position] = row
+            placed[position] = (row_key, row, fingerprint)
+        appended.extend((row_key, row, fingerprint) for row, fingerprint in unmatched[len(current):])
+        free.extend(position for position, _ in current[len(unmatched):])
+    updated = len(writes)
+
+    free.sort()
+    removed = len(free)
+    for row_key, row, fingerprint in appended:
+        position = free.pop(0) if free else num_rows
+        num_rows = max(num_rows, position + 1)
+        writes[position] = row
+        placed[position] = (row_key, row, fingerprint)
+
+    if free:
+        end = num_rows - len(free)
+        gaps = [position for position in free if position < end]
+        moved = sorted(position for position in placed if position >= end)
+        for position, gap in zip(moved, gaps):
+            writes.pop(position, None)
+            placed[gap] = placed.pop(position)
+            writes[gap] = placed[gap][1]
+        for position in range(end, num_rows):
+            writes[position] = [""] * width
+        num_rows = end
+
+    new_index: RowIndex = {}
+    for position, (row_key, _, fingerprint) in sorted(placed.items()):
+        new_index.setdefault(row_key, []).append((position, fingerprint))
+    return {
+        "writes": sorted(writes.items()),
+        "index": new_index,
+        "num_rows": num_rows,
+        "updated": updated,
+        "appended": len(appended),
+        "removed": removed,
+    }
+
+
+def changed_ranges(writes: List[Tuple[int, List[Any]]]) -> List[Dict[str, Any]]:
+    """Group the rows to write, sorted by row index, into contiguous A1 ranges."""
+    ranges = []
+    for index, row in writes:
+        if ranges and ranges[-1]["end"] == index:
+            ranges[-1]["values"].append(row)
+            ranges[-1]["end"] += 1
+        else:
+            ranges.append({"start": index, "end": index + 1, "values": [row]})
+    return [{"range": f"A{r['start'] + 1}", "values": r["values"]} for r in ranges]
+
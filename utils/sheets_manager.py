@@ -2,13 +2,26 @@ from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaFileUpload
 import pandas as pd
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Sequence, Union
 import os
 from dotenv import load_dotenv
 from utils.logger import log_error, log_success
+from utils.rate_limit import get_limiter
+from utils.product_table import ProductTable
+from utils.sheet_diff import index_rows, diff_rows, changed_ranges
 
 load_dotenv()
 
+# Columns identifying a product row across upserts. The product pool derives product
+# IDs from the category and name, so a product keeps its row when generated again.
+UPSERT_KEY = ('product_id',)
+
+
+def escape_query(value: str) -> str:
+    """Escape a string for a Drive search query."""
+    return value.replace("\\", "\\\\").replace("'", "\\'")
+
+
 class GoogleSheetsManager:
     def __init__(self, credentials_path: str):
         """Initialize with path to service account credentials JSON file."""
@@ -20,63 +33,220 @@ class GoogleSheetsManager:
             )
             self.sheets_service = build('sheets', 'v4', credentials=self.credentials)
             self.drive_service = build('drive', 'v3', credentials=self.credentials)
+            self.limiter = get_limiter("google")
+            # Row index of sheets last written by upsert_data, with the Drive version after the write
+            self.snapshots: Dict[str, Dict[str, Any]] = {}
         except Exception as e:
             log_error("Error initializing Google Sheets Manager", e)
             raise
 
-    def create_sheet(self, title: str) -> str:
-        """Create a new Google Sheet and return its ID."""
+    def _execute(self, request, idempotent: bool = True) -> Any:
+        """Execute a Google API request under the shared Google rate limiter.
+
+        Requests that are not idempotent are only retried when throttled.
+        """
+        return self.limiter.call(request.execute, idempotent=idempotent)
+
+    def create_sheet(self, title: str, thread_id: Optional[str] = None) -> str:
+        """Create a new Google Sheet and return its ID.
+
+        A thread_id is stored in the file's app properties, for find_sheet.
+        """
         try:
             spreadsheet = {
                 'properties': {
                     'title': title
                 }
             }
-            spreadsheet = self.sheets_service.spreadsheets().create(body=spreadsheet).execute()
+            spreadsheet = self._execute(
+                self.sheets_service.spreadsheets().create(body=spreadsheet), idempotent=False
+            )
             sheet_id = spreadsheet['spreadsheetId']
+            if thread_id:
+                self._execute(self.drive_service.files().update(
+                    fileId=sheet_id,
+                    body={'appProperties': {'thread_id': thread_id}}
+                ))
             log_success(f"Created sheet with ID: {sheet_id}")
             return sheet_id
         except Exception as e:
             log_error("Error creating sheet", e)
             raise
 
-    def add_data_to_sheet(self, spreadsheet_id: str, data: List[Dict[str, Any]]) -> None:
+    def add_data_to_sheet(self, spreadsheet_id: str, data: Union[ProductTable, List[Dict[str, Any]]]) -> None:
         """Add data to the specified Google Sheet."""
         try:
             # First verify the sheet exists
             try:
-                self.sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+                self._execute(self.sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id))
             except Exception as e:
                 raise ValueError(f"Sheet with ID {spreadsheet_id} does not exist. Create it first using create_sheet().")
 
-            # Convert data to DataFrame
-            df = pd.DataFrame(data)
-            
-            # Convert DataFrame to list of lists
-            values = [df.columns.tolist()] + df.values.tolist()
+            if isinstance(data, ProductTable):
+                # Product tables convert to sheet rows directly
+                values = data.to_sheet_values()
+            else:
+                # Convert data to DataFrame
+                df = pd.DataFrame(data)
+
+                # Convert DataFrame to list of lists
+                values = [df.columns.tolist()] + df.values.tolist()
             
             body = {
                 'values': values
             }
             
             # Update the sheet
-            self.sheets_service.spreadsheets().values().update(
+            self._execute(self.sheets_service.spreadsheets().values().update(
                 spreadsheetId=spreadsheet_id,
                 range='A1',
                 valueInputOption='RAW',
                 body=body
-            ).execute()
+            ))
             log_success("Added data to sheet")
         except Exception as e:
             log_error("Error adding data to sheet", e)
             raise
 
+    def find_sheet(self, title: str, thread_id: Optional[str] = None) -> Optional[str]:
+        """Return the ID of an existing spreadsheet with the given title, or None.
+
+        With a thread_id, only spreadsheets created for that thread are found.
+        """
+        try:
+            query = (
+                f"name = '{escape_query(title)}' and trashed = false and "
+                "mimeType = 'application/vnd.google-apps.spreadsheet'"
+            )
+            if thread_id:
+                query += (
+                    " and appProperties has { key='thread_id' and "
+                    f"value='{escape_query(thread_id)}' }}"
+                )
+            result = self._execute(self.drive_service.files().list(
+                q=query,
+                fields='files(id)',
+                pageSize=1
+            ))
+            files = result.get('files', [])
+            return files[0]['id'] if files else None
+        except Exception as e:
+            log_error("Error finding sheet", e)
+            raise
+
+    def get_values(self, spreadsheet_id: str) -> List[List[Any]]:
+        """Return the current contents of the first sheet, header row included."""
+        result = self._execute(self.sheets_service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range='A:ZZ',
+            valueRenderOption='UNFORMATTED_VALUE'
+        ))
+        return result.get('values', [])
+
+    def get_file(self, spreadsheet_id: str) -> Dict[str, str]:
+        """Return the Drive version of a spreadsheet, which changes on every edit, and its web link."""
+        return self._execute(self.drive_service.files().get(
+            fileId=spreadsheet_id,
+            fields='version,webViewLink'
+        ))
+
+    def upsert_data(
+        self, spreadsheet_id: str, data: ProductTable, key: Sequence[str] = UPSERT_KEY
+    ) -> Dict[str, Any]:
+        """Make the sheet hold the table, writing only the rows that changed.
+
+        Rows are matched on the key columns. Matched rows that changed are rewritten in
+        place, new rows are added and rows missing from the table are removed. The
+        writes are sent in a single batchUpdate request. The current contents are read
+        unless the sheet is unchanged since the last upsert from this process. Falls
+        back to clearing and rewriting the sheet when it is empty or has other columns.
+
+        Returns the number of rows updated, appended and removed, the number of ranges
+        written and the web link of the sheet.
+        """
+        try:
+            values = data.to_sheet_values()
+            header = values[0]
+            snapshot = self.snapshots.get(spreadsheet_id)
+            file = self.get_file(spreadsheet_id) if snapshot else None
+            if snapshot and snapshot["header"] == header and snapshot["version"] == file.get('version'):
+                index, num_rows = snapshot["index"], snapshot["num_rows"]
+            else:
+                current = self.get_values(spreadsheet_id)
+                if not current or current[0] != header:
+                    if current:
+                        self.clear_values(spreadsheet_id)
+                    self.add_data_to_sheet(spreadsheet_id, data)
+                    link = self._remember(spreadsheet_id, header, index_rows(values, key), len(values))
+                    removed = max(len(current) - 1, 0)
+                    return {
+                        "updated": 0,
+                        "appended": len(values) - 1,
+                        "removed": removed,
+                        "ranges": 1,
+                        "link": link,
+                    }
+                index, num_rows = index_rows(current, key), len(current)
+
+            diff = diff_rows(index, values, key, num_rows)
+            ranges = changed_ranges(diff["writes"])
+            if ranges:
+                self._execute(self.sheets_service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={'valueInputOption': 'RAW', 'data': ranges}
+                ))
+                link = self._remember(spreadsheet_id, header, diff["index"], diff["num_rows"])
+            elif file is not None:
+                # Nothing was written, so the version read for the snapshot is still current
+                self.snapshots[spreadsheet_id] = {**snapshot, "version": file.get('version')}
+                link = file.get('webViewLink')
+            else:
+                link = self._remember(spreadsheet_id, header, diff["index"], diff["num_rows"])
+            log_success(
+                f"Upserted sheet: {diff['updated']} rows updated, {diff['appended']} appended, "
+                f"{diff['removed']} removed"
+            )
+            return {
+                "updated": diff["updated"],
+                "appended": diff["appended"],
+                "removed": diff["removed"],
+                "ranges": len(ranges),
+                "link": link,
+            }
+        except Exception as e:
+            self.snapshots.pop(spreadsheet_id, None)
+            log_error("Error upserting data to sheet", e)
+            raise
+
+    def clear_values(self, spreadsheet_id: str) -> None:
+        """Clear every value of the first sheet, keeping its formatting."""
+        self._execute(self.sheets_service.spreadsheets().values().clear(
+            spreadsheetId=spreadsheet_id,
+            range='A:ZZ',
+            body={}
+        ))
+
+    def _remember(self, spreadsheet_id: str, header: List[str], index: Dict[str, Any], num_rows: int) -> str:
+        """Keep the row index of a sheet just written, tagged with its new version.
+
+        The version is read with the sheet's web link, which is returned, so that the
+        caller does not need another request for it.
+        """
+        file = self.get_file(spreadsheet_id)
+        self.snapshots[spreadsheet_id] = {
+            "version": file.get('version'),
+            "header": header,
+            "index": index,
+            "num_rows": num_rows,
+        }
+        return file.get('webViewLink')
+
     def get_shareable_link(self, spreadsheet_id: str) -> str:
         """Get a shareable link for the Google Sheet."""
         try:
             # First verify the sheet exists
             try:
-                self.sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+                self._execute(self.sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id))
             except Exception as e:
                 raise ValueError(f"Sheet with ID {spreadsheet_id} does not exist.")
 
@@ -86,16 +256,16 @@ class GoogleSheetsManager:
                 'role': 'reader'
             }
             
-            self.drive_service.permissions().create(
+            self._execute(self.drive_service.permissions().create(
                 fileId=spreadsheet_id,
                 body=permission
-            ).execute()
+            ), idempotent=False)
             
             # Get the web view link
-            file = self.drive_service.files().get(
+            file = self._execute(self.drive_service.files().get(
                 fileId=spreadsheet_id,
                 fields='webViewLink'
-            ).execute()
+            ))
             
             link = file.get('webViewLink')
             log_success(f"Generated shareable link: {link}")
@@ -109,7 +279,7 @@ class GoogleSheetsManager:
         try:
             # First verify the sheet exists
             try:
-                self.sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+                self._execute(self.sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id))
             except Exception as e:
                 raise ValueError(f"Sheet with ID {spreadsheet_id} does not exist.")
 
@@ -119,7 +289,7 @@ class GoogleSheetsManager:
             )
             
             with open(output_path, 'wb') as f:
-                downloader = request.execute()
+                downloader = self._execute(request)
                 f.write(downloader)
             
             log_success(f"Exported sheet as CSV to {output_path}")
@@ -133,7 +303,7 @@ class GoogleSheetsManager:
         try:
             # First verify the sheet exists
             try:
-                self.sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
+                self._execute(self.sheets_service.spreadsheets().get(spreadsheetId=spreadsheet_id))
             except Exception as e:
                 raise ValueError(f"Sheet with ID {spreadsheet_id} does not exist.")
 
@@ -143,7 +313,7 @@ class GoogleSheetsManager:
             )
             
             with open(output_path, 'wb') as f:
-                downloader = request.execute()
+                downloader = self._execute(request)
                 f.write(downloader)
             
             log_success(f"Exported sheet as Excel to {output_path}")
@@ -0,0 +1,81 @@
+import socketserver
+import threading
+from typing import Dict
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speak just enough SMTP to accept and discard messages."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def read_data(self) -> int:
+        """Discard the DATA section in large reads and return its size."""
+        size = 0
+        tail = b"\r\n"
+        while True:
+            chunk = self.rfile.read1(1 << 20)
+            if not chunk:
+                return size
+            window = tail + chunk
+            end = window.find(b"\r\n.\r\n")
+            if end != -1:
+                # Data bytes pipelined after the terminator are not expected from smtplib
+                return size + end - len(tail) + 2
+            size += len(chunk)
+            tail = window[-4:]
+
+    def handle(self) -> None:
+        self.server.record(connections=1)
+        self.reply("220 smtp-sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            verb = line[:4].decode("ascii", "replace").upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-smtp-sink\r\n250-8BITMIME\r\n250 SIZE 0\r\n")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                self.server.record(messages=1, bytes=self.read_data())
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            elif verb in {"HELO", "MAIL", "RCPT", "RSET", "NOOP"}:
+                self.reply("250 OK")
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Local SMTP server that counts and discards messages, for benchmarks and tests."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.stats_lock = threading.Lock()
+        self.counts = {"connections": 0, "messages": 0, "bytes": 0}
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def record(self, **counts: int) -> None:
+        """Add to the connection, message and byte counters."""
+        with self.stats_lock:
+            for key, value in counts.items():
+                self.counts[key] += value
+
+    def stats(self) -> Dict[str, int]:
+        """Return a copy of the counters."""
+        with self.stats_lock:
+            return dict(self.counts)
+
+    def start(self) -> "SMTPSink":
+        """Serve in a background thread."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
@@ -0,0 +1,201 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from difflib import SequenceMatcher
+from typing import Any, Callable, Optional
+from config import (
+    SPECULATION_DEBOUNCE,
+    SPECULATION_MIN_CHARS,
+    SPECULATION_SIMILARITY,
+    SPECULATION_TTL,
+    SPECULATION_WORKERS,
+    SPECULATION_MAX_SESSIONS,
+)
+from utils.cancellation import (
+    CANCEL_POLL_INTERVAL,
+    TurnCancelledError,
+    check_cancelled,
+    remaining_time,
+)
+from utils.logger import log_error
+from utils.metrics import metrics, track_llm_usage
+from utils.semantic_cache import content_words, salient_tokens
+
+
+def normalize_draft(text: str) -> str:
+    """Normalize case, whitespace and trailing punctuation of a draft or message."""
+    return " ".join(text.lower().split()).rstrip(".!? ")
+
+
+def drafts_match(draft: str, message: str, threshold: float = SPECULATION_SIMILARITY) -> bool:
+    """Whether a normalized draft is close enough to the normalized message to reuse its analysis.
+
+    Numbers, email addresses and URLs must match exactly, since "3 products" and
+    "30 products" are different tasks, and so must the content words, since "do not
+    email" is not "email". The texts must then still be similar.
+    """
+    if draft == message:
+        return True
+    if salient_tokens(draft) != salient_tokens(message):
+        return False
+    if content_words(draft) != content_words(message):
+        return False
+    return SequenceMatcher(None, draft, message).ratio() >= threshold
+
+
+class Speculation:
+    """Background analysis of one draft."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.normalized = normalize_draft(text)
+        self.created = time.monotonic()
+        self.start_now = threading.Event()
+        self.future: Optional[Future] = None
+        self.tokens = 0.0
+        self.finished = False
+        self.discarded = False
+
+
+class Speculator:
+    """Speculatively analyzes draft input in the background, so a matching final message skips the wait.
+
+    Each session keeps only its latest draft: a newer draft supersedes the previous
+    one, which is dropped before calling the LLM if it is still being debounced, and
+    whose tokens are counted as wasted otherwise.
+    """
+
+    def __init__(
+        self,
+        analyze: Callable[[str], Any],
+        debounce: float = SPECULATION_DEBOUNCE,
+        min_chars: int = SPECULATION_MIN_CHARS,
+        threshold: float = SPECULATION_SIMILARITY,
+        ttl: float = SPECULATION_TTL,
+        workers: int = SPECULATION_WORKERS,
+        max_sessions: int = SPECULATION_MAX_SESSIONS,
+    ):
+        self.analyze = analyze
+        self.debounce = debounce
+        self.min_chars = min_chars
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="speculation"
+        )
+        self.sessions: "OrderedDict[str, Speculation]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, session: str, text: str) -> bool:
+        """Speculate on the latest draft of a session; returns whether it was scheduled."""
+        if len(text.strip()) < self.min_chars:
+            return False
+        speculation = Speculation(text)
+        evicted = []
+        with self.lock:
+            previous = self.sessions.get(session)
+            if previous is not None and previous.normalized == speculation.normalized:
+                return True
+            self.sessions[session] = speculation
+            self.sessions.move_to_end(session)
+            while len(self.sessions) > self.max_sessions:
+                evicted.append(self.sessions.popitem(last=False)[1])
+        for stale in ([previous] if previous is not None else []) + evicted:
+            self._discard(stale)
+            metrics.incr("speculation.superseded")
+        # The speculation runs with the caller's context, e.g. its tenant
+        context = contextvars.copy_context()
+        speculation.future = self.executor.submit(context.run, self._run, speculation)
+        metrics.incr("speculation.submitted")
+        return True
+
+    def _run(self, speculation: Speculation) -> Optional[Any]:
+        speculation.start_now.wait(self.debounce)
+        if speculation.discarded:
+            return None
+        with track_llm_usage() as usage:
+            try:
+                return self.analyze(speculation.text)
+            except Exception as e:
+                log_error("Error in speculative analysis", e)
+                return None
+            finally:
+                with self.lock:
+                    speculation.tokens = usage["total_tokens"]
+                    speculation.finished = True
+                    if speculation.discarded:
+                        metrics.incr("speculation.wasted_tokens", speculation.tokens)
+
+    def _discard(self, speculation: Speculation) -> None:
+        with self.lock:
+            speculation.discarded = True
+            if speculation.finished:
+                metrics.incr("speculation.wasted_tokens", speculation.tokens)
+        speculation.start_now.set()
+
+    def take(self, session: str, message: str) -> Optional[Any]:
+        """Return the speculated analysis of the final message of a session, or None on a miss.
+
+        A matching speculation still in progress is awaited rather than started over,
+        until the current turn's deadline, after which it is a miss. Raises
+        TurnCancelledError if the turn is cancelled while waiting.
+        """
+        with self.lock:
+            speculation = self.sessions.pop(session, None)
+        if speculation is None:
+            return None
+        if time.monotonic() - speculation.created > self.ttl or not drafts_match(
+            speculation.normalized, normalize_draft(message), self.threshold
+        ):
+            self._discard(speculation)
+            metrics.incr("speculation.misses")
+            return None
+
+        speculation.start_now.set()
+        start = time.perf_counter()
+        result = self._wait(speculation)
+        metrics.observe("speculation.wait", time.perf_counter() - start)
+        if result is None:
+            metrics.incr("speculation.misses")
+            return None
+        metrics.incr("speculation.hits")
+        metrics.incr("speculation.used_tokens", speculation.tokens)
+        return result
+
+    def _wait(self, speculation: Speculation) -> Optional[Any]:
+        """Wait for a speculation in short slices, returning None once the turn's deadline passes."""
+        try:
+            while True:
+                wait = remaining_time(CANCEL_POLL_INTERVAL)
+                if wait <= 0:
+                    metrics.incr("speculation.timeouts")
+                    self._discard(speculation)
+                    return None
+                check_cancelled()
+                try:
+                    return speculation.future.result(timeout=wait)
+                except FutureTimeoutError:
+                    pass
+        except TurnCancelledError:
+            self._discard(speculation)
+            raise
+
+    def stats(self) -> dict:
+        """Return the hit rate and token cost of speculation."""
+        counters = metrics.snapshot()["counters"]
+        hits = counters.get("speculation.hits", 0)
+        misses = counters.get("speculation.misses", 0)
+        with self.lock:
+            pending = len(self.sessions)
+        return {
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+            "hits": hits,
+            "misses": misses,
+            "used_tokens": counters.get("speculation.used_tokens", 0),
+            "wasted_tokens": counters.get("speculation.wasted_tokens", 0),
+            "pending_sessions": pending,
+        }
+
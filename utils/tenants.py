@@ -0,0 +1,232 @@
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional
+from config import (
+    DEFAULT_TENANT,
+    TENANTS_PATH,
+    TENANT_MAX_CONCURRENCY,
+    TENANT_TOKEN_BUDGET,
+    TENANT_BUDGET_WINDOW,
+    TENANT_SLOT_TIMEOUT,
+    TENANT_CACHE_SIZE,
+)
+from utils.cancellation import cancellable_acquire
+from utils.logger import log_error
+
+# Tenant of the request being handled; unnamed requests run as the default tenant
+current_tenant: ContextVar[str] = ContextVar("current_tenant", default=DEFAULT_TENANT)
+# Set while a call holds a concurrency slot, so nested calls (e.g. an LLM call made by a
+# tool) reuse it instead of deadlocking on the tenant's own limit
+_holding_slot: ContextVar[bool] = ContextVar("holding_slot", default=False)
+# Cleared for background work done for all tenants, e.g. product pool refills, which is
+# neither limited by nor accounted to the tenant whose context it happens to run in
+_accounted: ContextVar[bool] = ContextVar("accounted", default=True)
+
+
+class TenantQuotaError(Exception):
+    """Raised when a tenant is over its token budget or cannot get a concurrency slot in time."""
+
+
+class UnknownTenantError(Exception):
+    """Raised for a tenant that is neither the default tenant nor in the tenant settings."""
+
+
+def load_tenant_settings(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """Load per-tenant settings from a JSON object keyed by tenant ID."""
+    if not path:
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        log_error("Error loading tenant settings", e)
+        return {}
+
+
+@contextmanager
+def tenant_context(tenant_id: str) -> Iterator[None]:
+    """Run the enclosed code, and the graph nodes it invokes, on behalf of a tenant."""
+    token = current_tenant.set(tenant_id or DEFAULT_TENANT)
+    try:
+        yield
+    finally:
+        current_tenant.reset(token)
+
+
+@contextmanager
+def unaccounted() -> Iterator[None]:
+    """Run the enclosed code outside every tenant's limits and usage accounting."""
+    token = _accounted.set(False)
+    try:
+        yield
+    finally:
+        _accounted.reset(token)
+
+
+def tenant_thread_id(tenant_id: str, thread_id: str) -> str:
+    """Namespace a conversation thread ID so tenants cannot read each other's threads.
+
+    The default tenant's threads are prefixed too, so a thread ID sent by a client
+    can never name another tenant's thread.
+    """
+    return f"{tenant_id or DEFAULT_TENANT}:{thread_id}"
+
+
+class TenantManager:
+    """Per-tenant settings, backend instances, concurrency and token budgets, and usage accounting.
+
+    Settings of a tenant may hold its own credentials (openai_api_key,
+    google_service_account_path, gmail_email, gmail_app_password) and limits
+    (max_concurrency, token_budget; 0 means unlimited). The default tenant is
+    unlimited unless configured.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[Dict[str, Dict[str, Any]]] = None,
+        cache_size: int = TENANT_CACHE_SIZE,
+        slot_timeout: float = TENANT_SLOT_TIMEOUT,
+        budget_window: float = TENANT_BUDGET_WINDOW,
+    ):
+        self.tenant_settings = settings or {}
+        self.cache_size = cache_size
+        self.slot_timeout = slot_timeout
+        self.budget_window = budget_window
+        self.backends: "OrderedDict[tuple, Any]" = OrderedDict()
+        self.semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self.usage_counters: Dict[str, Counter] = {}
+        # Tenant -> (start of the current budget window, tokens used in it)
+        self.windows: Dict[str, tuple] = {}
+        self.lock = threading.Lock()
+
+    def settings(self, tenant_id: str) -> Dict[str, Any]:
+        """Return the settings of a tenant, with defaults for missing limits."""
+        configured = self.tenant_settings.get(tenant_id, {})
+        unlimited = tenant_id == DEFAULT_TENANT and not configured
+        return {
+            "max_concurrency": 0 if unlimited else TENANT_MAX_CONCURRENCY,
+            "token_budget": 0 if unlimited else TENANT_TOKEN_BUDGET,
+            **configured,
+        }
+
+    def check_known(self, tenant_id: str) -> None:
+        """Raise UnknownTenantError unless the tenant is the default one or configured.
+
+        Requests are checked before any usage is recorded, so arbitrary tenant IDs
+        cannot grow the usage counters.
+        """
+        if tenant_id != DEFAULT_TENANT and tenant_id not in self.tenant_settings:
+            raise UnknownTenantError(f"Unknown tenant {tenant_id}")
+
+    def backend(self, tenant_id: str, name: str, factory: Callable[[], Any]) -> Any:
+        """Return the tenant's instance of a backend, creating it with the factory if not cached."""
+        key = (tenant_id, name)
+        with self.lock:
+            if key in self.backends:
+                self.backends.move_to_end(key)
+                return self.backends[key]
+        instance = factory()
+        with self.lock:
+            instance = self.backends.setdefault(key, instance)
+            self.backends.move_to_end(key)
+            while len(self.backends) > self.cache_size:
+                self.backends.popitem(last=False)
+        return instance
+
+    def _counters(self, tenant_id: str) -> Counter:
+        return self.usage_counters.setdefault(tenant_id, Counter())
+
+    def _semaphore(self, tenant_id: str) -> Optional[threading.BoundedSemaphore]:
+        limit = self.settings(tenant_id)["max_concurrency"]
+        if not limit:
+            return None
+        with self.lock:
+            if tenant_id not in self.semaphores:
+                self.semaphores[tenant_id] = threading.BoundedSemaphore(limit)
+            return self.semaphores[tenant_id]
+
+    def tokens_used(self, tenant_id: str) -> int:
+        """Return the tokens used by a tenant in the current budget window."""
+        with self.lock:
+            start, used = self.windows.get(tenant_id, (0.0, 0))
+            if time.time() - start >= self.budget_window:
+                return 0
+            return used
+
+    def check_budget(self, tenant_id: str) -> None:
+        """Raise TenantQuotaError if the tenant has used up its token budget."""
+        budget = self.settings(tenant_id)["token_budget"]
+        if budget and self.tokens_used(tenant_id) >= budget:
+            with self.lock:
+                self._counters(tenant_id)["rejected"] += 1
+            raise TenantQuotaError(f"Token budget of tenant {tenant_id} exceeded")
+
+    @contextmanager
+    def slot(self, tenant_id: str, kind: str) -> Iterator[None]:
+        """Run one LLM or tool call within the tenant's budget and concurrency limit, and account for it."""
+        if not _accounted.get():
+            yield
+            return
+        self.check_budget(tenant_id)
+        semaphore = None if _holding_slot.get() else self._semaphore(tenant_id)
+        if semaphore is not None and not cancellable_acquire(semaphore, self.slot_timeout):
+            with self.lock:
+                self._counters(tenant_id)["rejected"] += 1
+            raise TenantQuotaError(f"Tenant {tenant_id} has too many calls in flight")
+        token = _holding_slot.set(True)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            _holding_slot.reset(token)
+            if semaphore is not None:
+                semaphore.release()
+            with self.lock:
+                counters = self._counters(tenant_id)
+                counters[kind] += 1
+                counters[f"{kind}_seconds"] += time.perf_counter() - start
+
+    def record(self, tenant_id: str, **counts: float) -> None:
+        """Add to the usage counters of a tenant, e.g. emails or wall_time."""
+        if not _accounted.get():
+            return
+        with self.lock:
+            self._counters(tenant_id).update(counts)
+
+    def record_tokens(self, tenant_id: str, response: Any) -> None:
+        """Account the token usage of an LLM response to the tenant and its budget window."""
+        if not _accounted.get():
+            return
+        usage = getattr(response, "usage_metadata", None) or {}
+        total = usage.get("total_tokens", 0)
+        with self.lock:
+            counters = self._counters(tenant_id)
+            for key in ("input_tokens", "output_tokens", "total_tokens"):
+                counters[key] += usage.get(key, 0)
+            start, used = self.windows.get(tenant_id, (0.0, 0))
+            now = time.time()
+            if now - start >= self.budget_window:
+                start, used = now, 0
+            self.windows[tenant_id] = (start, used + total)
+
+    def usage(self, tenant_id: str) -> Dict[str, Any]:
+        """Return the usage counters and remaining budget of a tenant."""
+        settings = self.settings(tenant_id)
+        used = self.tokens_used(tenant_id)
+        with self.lock:
+            counters = dict(self.usage_counters.get(tenant_id, {}))
+        return {
+            "tenant_id": tenant_id,
+            "usage": {key: round(value, 3) for key, value in counters.items()},
+            "tokens_in_window": used,
+            "token_budget": settings["token_budget"] or None,
+            "max_concurrency": settings["max_concurrency"] or None,
+        }
+
+
+tenant_manager = TenantManager(load_tenant_settings(TENANTS_PATH))
+
@@ -1,8 +1,12 @@
+import os
 from langchain_core.tools import tool
 from typing import List, Dict, Any, Optional
 from utils.email_sender import GmailSender
 from .data_generator import ProductDataGenerator
 from .sheets_manager import GoogleSheetsManager
+from .product_pool import ProductPool
+from .product_table import ProductTable
+from .tenants import current_tenant, tenant_manager
 from datetime import datetime
 from config import (
     GOOGLE_SERVICE_ACCOUNT_PATH,
@@ -13,40 +17,111 @@ from config import (
 
 # Initialize the utility classes
 data_generator = ProductDataGenerator()
+product_pool = ProductPool(data_generator)
 sheets_manager = GoogleSheetsManager(GOOGLE_SERVICE_ACCOUNT_PATH)
 gmail_sender = GmailSender(email=GMAIL_EMAIL, app_password=GMAIL_APP_PASSWORD)
 
 
+def get_sheets_manager() -> GoogleSheetsManager:
+    """Get the Sheets manager of the current tenant, or the shared one if it has no service account."""
+    tenant_id = current_tenant.get()
+    path = tenant_manager.settings(tenant_id).get("google_service_account_path")
+    if not path:
+        return sheets_manager
+    return tenant_manager.backend(tenant_id, "sheets", lambda: GoogleSheetsManager(path))
+
+
+def get_gmail_sender() -> GmailSender:
+    """Get the email sender of the current tenant, or the shared one if it has no Gmail account."""
+    tenant_id = current_tenant.get()
+    settings = tenant_manager.settings(tenant_id)
+    if not settings.get("gmail_email"):
+        return gmail_sender
+    return tenant_manager.backend(
+        tenant_id,
+        "gmail",
+        lambda: GmailSender(
+            email=settings["gmail_email"], app_password=settings.get("gmail_app_password")
+        ),
+    )
+
+
 @tool
-def generate_products(num_products: int = 10) -> List[Dict[str, Any]]:
-    """Generate sample product data using OpenAI.
+def generate_products(num_products: int = 10) -> Dict[str, Any]:
+    """Generate sample product data, served from the pre-generated product pool.
 
     Args:
         num_products: Number of products to generate (default: 10)
 
     Returns:
-        List of product dictionaries with fields like product_id, name, description, etc.
+        Compact columnar product table (see ProductTable.to_compact) with fields
+        like product_id, name, description, etc.
     """
-    return data_generator.generate_products(num_products)
+    return ProductTable.from_records(product_pool.take(num_products)).to_compact()
 
 
 @tool
-def create_google_sheet(title: str, data: List[Dict[str, Any]]) -> Dict[str, str]:
+def create_google_sheet(title: str, data: Dict[str, Any]) -> Dict[str, str]:
     """Create a new Google Sheet with the provided data.
 
     Args:
         title: Title of the Google Sheet
-        data: List of dictionaries containing the data to add
+        data: Compact columnar product table containing the data to add
 
     Returns:
         Dictionary containing sheet_id and shareable_link
     """
-    sheet_id = sheets_manager.create_sheet(title)
-    sheets_manager.add_data_to_sheet(sheet_id, data)
-    shareable_link = sheets_manager.get_shareable_link(sheet_id)
+    sheets = get_sheets_manager()
+    sheet_id = sheets.create_sheet(title)
+    sheets.add_data_to_sheet(sheet_id, ProductTable.from_compact(data))
+    shareable_link = sheets.get_shareable_link(sheet_id)
     return {"sheet_id": sheet_id, "shareable_link": shareable_link}
 
 
+@tool
+def upsert_google_sheet(
+    title: str,
+    data: Dict[str, Any],
+    spreadsheet_id: Optional[str] = None,
+    thread_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Make an existing Google Sheet hold the data, creating it if it does not exist yet.
+
+    Args:
+        title: Title of the Google Sheet, used to find it when no ID is given
+        data: Compact columnar product table containing the data to upsert
+        spreadsheet_id: ID of the Google Sheet to update
+        thread_id: Conversation thread the sheet belongs to. Without a spreadsheet_id,
+            only a sheet created for the same thread is updated
+
+    Returns:
+        Dictionary containing sheet_id, shareable_link and the number of rows
+        updated, appended and removed
+    """
+    table = ProductTable.from_compact(data)
+    sheets = get_sheets_manager()
+    sheet_id = spreadsheet_id or sheets.find_sheet(title, thread_id)
+    if sheet_id is None:
+        sheet_id = sheets.create_sheet(title, thread_id)
+        sheets.add_data_to_sheet(sheet_id, table)
+        shareable_link = sheets.get_shareable_link(sheet_id)
+        return {
+            "sheet_id": sheet_id,
+            "shareable_link": shareable_link,
+            "updated": 0,
+            "appended": len(table),
+            "removed": 0,
+        }
+    stats = sheets.upsert_data(sheet_id, table)
+    return {
+        "sheet_id": sheet_id,
+        "shareable_link": stats["link"],
+        "updated": stats["updated"],
+        "appended": stats["appended"],
+        "removed": stats["removed"],
+    }
+
+
 @tool
 def export_sheet(sheet_id: str, format: str = "csv") -> str:
     """Export a Google Sheet to a file.
@@ -58,13 +133,30 @@ def export_sheet(sheet_id: str, format: str = "csv") -> str:
     Returns:
         Path to the exported file
     """
+    sheets = get_sheets_manager()
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     if format == "csv":
         output_path = f"{EXPORT_DIR}/products_{timestamp}.csv"
-        return sheets_manager.export_as_csv(sheet_id, output_path)
+        return sheets.export_as_csv(sheet_id, output_path)
     else:
         output_path = f"{EXPORT_DIR}/products_{timestamp}.xlsx"
-        return sheets_manager.export_as_excel(sheet_id, output_path)
+        return sheets.export_as_excel(sheet_id, output_path)
+
+
+@tool
+def export_products(data: Dict[str, Any]) -> str:
+    """Export products to a local CSV file without going through Google Drive.
+
+    Args:
+        data: Compact columnar product table to export
+
+    Returns:
+        Path to the exported file
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_path = f"{EXPORT_DIR}/products_{timestamp}.csv"
+    return ProductTable.from_compact(data).to_csv(output_path)
 
 
 @tool
@@ -89,17 +181,53 @@ def send_email(
         elif body is None:
             body = ""
 
-        gmail_sender.send_email_with_attachment(
-            sender=GMAIL_EMAIL,
+        email_sender = get_gmail_sender()
+        email_sender.send_email_with_attachment(
+            sender=email_sender.email,
             to=recipient,
             subject=subject,
             body=body,
             attachments=attachments,
         )
+        tenant_manager.record(current_tenant.get(), emails=1)
         return f"Email successfully sent to {recipient}"
     except Exception as e:
         raise Exception(f"Failed to send email: {str(e)}")
 
 
+@tool
+def send_bulk_email(
+    recipients: List[str],
+    subject: str,
+    body: str,
+    variables: Optional[Dict[str, Dict[str, Any]]] = None,
+    attachments: List[str] = None,
+) -> Dict[str, str]:
+    """Send a templated email to many recipients over a single SMTP session.
+
+    Args:
+        recipients: Email addresses of the recipients
+        subject: Subject template of the email
+        body: Body template, with $recipient and any per-recipient variables
+        variables: Template variables per recipient address
+        attachments: List of file paths to attach to every email
+
+    Returns:
+        Dictionary mapping each recipient to "sent" or the reason it failed
+    """
+    email_sender = get_gmail_sender()
+    results = email_sender.send_bulk(
+        sender=email_sender.email,
+        recipients=recipients,
+        subject=subject,
+        body=body,
+        variables=variables,
+        attachments=attachments,
+    )
+    sent = sum(1 for result in results.values() if result == "sent")
+    tenant_manager.record(current_tenant.get(), emails=sent)
+    return results
+
+
 # List of all available tools
 AVAILABLE_TOOLS = [generate_products, create_google_sheet, export_sheet]